@@ -0,0 +1,51 @@
+"""
+Benchmarks for astra.
+
+Each benchmark is a module that can be run from the repository root, e.g.
+
+    python -m benchmarks.duplicate_deliveries
+
+Benchmarks run against a throwaway database created the same way the test
+runner creates its test database, so they never touch db.sqlite3.
+"""
+
+import logging
+import os
+from contextlib import contextmanager
+
+import django
+
+
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+    django.setup()
+    # Per-request logging would dominate the timings.
+    logging.disable(logging.WARNING)
+
+
+@contextmanager
+def test_database(name: str | None = None):
+    """
+    Creates a test database for the duration of the block.
+
+    Args:
+        name (str | None): Path of an SQLite file to use instead of an in-memory database.
+    """
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    if name:
+        connection.settings_dict["TEST"]["NAME"] = name
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def print_table(headers: list[str], rows: list[list]):
+    widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+    for row in [headers, *rows]:
+        print("  ".join(str(value).ljust(width) for value, width in zip(row, widths)))
@@ -0,0 +1,86 @@
+"""
+Sustained insert throughput of GitHubWebhookEvent on a file-backed SQLite database.
+
+Compares one INSERT and commit per event with the batch writer in
+webhooks/writer.py, with several threads producing events as request threads
+would. With "flush" durability every thread waits for its batch, so batches
+(and throughput) are bounded by the number of threads in flight.
+
+    python -m benchmarks.batch_writer [--events 5000] [--threads 100] [--max-size 200] [--max-delay 0.05]
+"""
+
+import argparse
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from benchmarks import print_table, setup_django, test_database
+
+PAYLOAD = {"action": "created", "installation": {"id": 1, "account": {"login": "octocat"}}}
+
+
+def run_threads(threads: int, events: int, fn) -> float:
+    from django.db import connection
+
+    def produce(count):
+        try:
+            for _ in range(count):
+                fn(str(uuid.uuid4()))
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=produce, args=(events // threads,)) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=100)
+    parser.add_argument("--max-size", type=int, default=200)
+    parser.add_argument("--max-delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from webhooks.models import GitHubWebhook, GitHubWebhookEvent
+    from webhooks.writer import BatchWriter
+
+    with tempfile.TemporaryDirectory() as directory, test_database(str(Path(directory) / "benchmark.sqlite3")):
+        webhook = GitHubWebhook.objects.create(public_id="benchmark", secret_token="")
+
+        def create(delivery_uuid):
+            GitHubWebhookEvent.objects.create_delivery(webhook.id, delivery_uuid, False, event="installation", action="created", payload=PAYLOAD)
+
+        writer = BatchWriter(max_size=args.max_size, max_delay=args.max_delay)
+
+        def submit_and_wait(delivery_uuid):
+            writer.submit(webhook.id, delivery_uuid, False, event="installation", action="created", payload=PAYLOAD).result()
+
+        def submit(delivery_uuid):
+            writer.submit(webhook.id, delivery_uuid, False, event="installation", action="created", payload=PAYLOAD)
+
+        rows = []
+        for name, fn in [("insert per event", create), ("batch writer, flush", submit_and_wait), ("batch writer, buffer", submit)]:
+            elapsed = run_threads(args.threads, args.events, fn)
+            if fn is submit:
+                # Buffered events only count once they're written.
+                started = time.perf_counter()
+                writer.close()
+                elapsed += time.perf_counter() - started
+            rows.append([name, f"{args.events / elapsed:.0f}"])
+        count = GitHubWebhookEvent.objects.count()
+
+    print(f"{args.events} events per writer from {args.threads} threads, {count} of {args.events * len(rows)} stored")
+    print_table(["writer", "events/s"], rows)
+
+
+if __name__ == "__main__":
+    main()
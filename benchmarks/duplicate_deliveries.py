@@ -0,0 +1,84 @@
+"""
+Queries per delivery for duplicate detection.
+
+Compares the previous check-then-insert approach (an exists() query followed by
+a create()) with GitHubWebhookEventManager.create_delivery, which relies on the
+unique_github_webhook_event_delivery constraint, and with the view, where quick
+redeliveries are rejected by the recent-delivery filter.
+
+    python -m benchmarks.duplicate_deliveries [--deliveries 1000]
+"""
+
+import argparse
+import json
+import time
+import uuid
+
+from benchmarks import print_table, setup_django, test_database
+
+
+def count_queries(connection, fn) -> tuple[int, float]:
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+    return len(queries.captured_queries), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--deliveries", type=int, default=1000)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.test import Client
+
+    from webhooks.cache import recent_deliveries, webhook_config_cache
+    from webhooks.models import GitHubWebhook, GitHubWebhookEvent
+
+    with test_database() as connection:
+        webhook = GitHubWebhook.objects.create(public_id="benchmark", secret_token="")
+        delivery_uuids = [str(uuid.uuid4()) for _ in range(args.deliveries)]
+
+        def check_then_insert(prefix):
+            for delivery_uuid in delivery_uuids:
+                if not GitHubWebhookEvent.objects.filter(webhook=webhook, delivery_uuid=delivery_uuid).exists():
+                    GitHubWebhookEvent.objects.create(webhook=webhook, delivery_uuid=delivery_uuid, event=prefix, payload={})
+
+        def create_delivery(prefix):
+            for delivery_uuid in delivery_uuids:
+                GitHubWebhookEvent.objects.create_delivery(webhook.id, delivery_uuid, False, event=prefix, payload={})
+
+        client = Client()
+        url = f"/webhooks/github/{webhook.public_id}/handle"
+
+        def post_deliveries():
+            for delivery_uuid in delivery_uuids:
+                headers = {"X-GitHub-Delivery": delivery_uuid, "X-GitHub-Event": "installation"}
+                client.post(url, data=json.dumps({delivery_uuid: {"action": "created"}}), content_type="application/json", headers=headers)
+
+        rows = []
+        for name, fn in [("check then insert", check_then_insert), ("create_delivery", create_delivery)]:
+            GitHubWebhookEvent.objects.all().delete()
+            new_queries, new_elapsed = count_queries(connection, lambda: fn("new"))
+            duplicate_queries, duplicate_elapsed = count_queries(connection, lambda: fn("duplicate"))
+            rows.append([name, "new", f"{new_queries / args.deliveries:.2f}", f"{new_elapsed / args.deliveries * 1e6:.0f}"])
+            rows.append([name, "duplicate", f"{duplicate_queries / args.deliveries:.2f}", f"{duplicate_elapsed / args.deliveries * 1e6:.0f}"])
+
+        GitHubWebhookEvent.objects.all().delete()
+        webhook_config_cache.clear()
+        recent_deliveries.clear()
+        new_queries, new_elapsed = count_queries(connection, post_deliveries)
+        duplicate_queries, duplicate_elapsed = count_queries(connection, post_deliveries)
+        rows.append(["view", "new", f"{new_queries / args.deliveries:.2f}", f"{new_elapsed / args.deliveries * 1e6:.0f}"])
+        rows.append(["view", "quick redelivery", f"{duplicate_queries / args.deliveries:.2f}", f"{duplicate_elapsed / args.deliveries * 1e6:.0f}"])
+
+    print(f"{args.deliveries} deliveries")
+    print_table(["approach", "delivery", "queries/delivery", "us/delivery"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Cost of loading rows with EncryptedTextField columns, with eager decryption,
+lazy decryption (ENCRYPTION_LAZY_DECRYPTION) and lazy decryption with the
+decryption cache (ENCRYPTION_DECRYPTION_CACHE_MAX_SIZE).
+
+Each configuration loads every GitHubWebhook without reading the encrypted
+columns, as querysets that only need public_id do, then loads them twice more
+reading secret_token. The second read shows the cache answering hot rows.
+
+    python -m benchmarks.encrypted_fields [--rows 100000]
+"""
+
+import argparse
+import time
+
+from benchmarks import print_table, setup_django, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.test import override_settings
+
+    from encryption import fields
+    from webhooks.models import GitHubWebhook
+
+    def load(read: bool) -> float:
+        started = time.perf_counter()
+        for webhook in GitHubWebhook.objects.order_by().iterator(chunk_size=2000):
+            if read:
+                webhook.secret_token # pylint: disable=pointless-statement
+        return time.perf_counter() - started
+
+    with test_database():
+        started = time.perf_counter()
+        for start in range(0, args.rows, 5000):
+            GitHubWebhook.objects.bulk_create([
+                GitHubWebhook(public_id=f"benchmark-{i}", client_id=f"client-{i}", secret_token=f"secret-token-{i}")
+                for i in range(start, min(start + 5000, args.rows))
+            ])
+        print(f"Created {args.rows} webhooks in {time.perf_counter() - started:.1f}s")
+
+        rows = []
+        for label, lazy, cache_size in [("eager", False, 0), ("lazy", True, 0), ("lazy + cache", True, args.rows)]:
+            fields.decryption_cache.clear()
+            fields.decryption_cache.max_size = cache_size
+            with override_settings(ENCRYPTION_LAZY_DECRYPTION=lazy):
+                rows.append([label, f"{load(False):.2f}", f"{load(True):.2f}", f"{load(True):.2f}"])
+        fields.decryption_cache.max_size = 0
+        fields.decryption_cache.clear()
+
+    print_table(["decryption", "load s", "load + read s", "load + read again s"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Throughput and peak memory of export_webhook_events against loading the whole
+queryset, at increasing table sizes, on a file-backed SQLite database.
+
+Peak memory is the tracemalloc peak of Python allocations, measured in a
+separate run from the throughput so that tracing doesn't skew it.
+
+    python -m benchmarks.export [--events 20000,100000] [--size 2000] [--batch-size 2000]
+"""
+
+import argparse
+import json
+import tempfile
+import time
+import tracemalloc
+import uuid
+from io import StringIO
+from pathlib import Path
+
+from benchmarks import print_table, setup_django, test_database
+from benchmarks.payloads import make_payload
+
+
+def measure(fn) -> tuple[float, int]:
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", default="20000,100000", help="Table sizes to export.")
+    parser.add_argument("--size", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.core.management import call_command
+
+    from webhooks.models import GitHubWebhook, GitHubWebhookEvent
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory, test_database(str(Path(directory) / "benchmark.sqlite3")):
+        webhook = GitHubWebhook.objects.create(public_id="benchmark", secret_token="")
+        output = Path(directory) / "events.jsonl"
+        count = 0
+        for events in (int(events) for events in args.events.split(",")):
+            while count < events:
+                batch = min(10000, events - count)
+                GitHubWebhookEvent.objects.bulk_create([
+                    GitHubWebhookEvent(webhook=webhook, delivery_uuid=uuid.uuid4(), event="push", payload=make_payload(args.size, seed=count + i, repositories=20, senders=100))
+                    for i in range(batch)
+                ])
+                count += batch
+
+            def load_queryset():
+                with open(output, "w", encoding="utf-8") as f:
+                    for event in list(GitHubWebhookEvent.objects.select_related("webhook")):
+                        f.write(json.dumps({"id": event.id, "webhook": event.webhook.public_id, "payload": event.payload}) + "\n")
+
+            def export():
+                call_command("export_webhook_events", "--output", str(output), "--batch-size", str(args.batch_size), stderr=StringIO())
+
+            for name, fn in [("whole queryset", load_queryset), ("export_webhook_events", export)]:
+                elapsed, peak = measure(fn)
+                rows.append([events, name, f"{events / elapsed:.0f}", f"{peak / 2**20:.1f}"])
+
+    print_table(["events", "method", "rows/s", "peak MiB"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""
+Latency and throughput of the webhook endpoint, driven in-process through the
+WSGI and ASGI applications in config/, on a file-backed SQLite database.
+
+Each scenario sends signed deliveries of a given payload size to
+/webhooks/github/<public_id>/handle, re-sending an earlier delivery for the
+given fraction of requests as GitHub does when it retries. It reports p50, p95
+and p99 latency, requests per second, database queries per request and the
+memory allocated per request. Memory is measured with tracemalloc in a separate
+pass over a sample of requests, so that tracing doesn't skew the timings.
+
+Results are written as JSON to --output. Each --threshold METRIC=VALUE makes
+the run exit with status 1 if any scenario exceeds it (or, for rps, falls
+below it), e.g.
+
+    python -m benchmarks.ingest --threshold p99_ms=50 --threshold rps=200 --threshold queries_per_request=2
+
+    python -m benchmarks.ingest [--interfaces wsgi,asgi] [--sizes 2000,25000,250000] [--duplicate-ratios 0,0.2]
+                                [--requests 1000] [--concurrency 1] [--output ingest-results.json]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import io
+import json
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from benchmarks import print_table, setup_django, test_database
+from benchmarks.payloads import as_delivery, make_payload
+
+PUBLIC_ID = "benchmark"
+SECRET_TOKEN = "benchmark-secret-token"
+PATH = f"/webhooks/github/{PUBLIC_ID}/handle"
+
+# Metrics for which a threshold is a minimum rather than a maximum.
+MINIMUM_METRICS = {"rps"}
+
+
+class QueryCounter:
+    """
+    Counts queries on every database connection, including those of the threads ASGI runs sync code in.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+def make_requests(count: int, size: int, duplicate_ratio: float, seed: int) -> list[tuple[bytes, dict]]:
+    """
+    Returns:
+        list[tuple[bytes, dict]]: The body and headers of each request.
+    """
+    rng = random.Random(seed)
+    # Payloads are built once per size and only their delivery changes, building one per request would dominate.
+    payload = make_payload(size, seed=seed, repositories=20, senders=100)
+    requests = []
+    for _ in range(count):
+        if requests and rng.random() < duplicate_ratio:
+            requests.append(rng.choice(requests[-100:]))
+            continue
+        delivery_uuid, delivery = as_delivery(payload)
+        body = json.dumps(delivery).encode("utf-8")
+        signature = hmac.new(SECRET_TOKEN.encode("utf-8"), body, hashlib.sha256).hexdigest()
+        requests.append((body, {
+            "Content-Type": "application/json",
+            "X-GitHub-Delivery": delivery_uuid,
+            "X-GitHub-Event": "installation",
+            "X-Hub-Signature-256": f"sha256={signature}",
+            "User-Agent": "GitHub-Hookshot/benchmark",
+        }))
+    return requests
+
+
+def wsgi_request(application, body: bytes, headers: dict) -> int:
+    environ = {
+        "REQUEST_METHOD": "POST",
+        "PATH_INFO": PATH,
+        "SCRIPT_NAME": "",
+        "QUERY_STRING": "",
+        "SERVER_NAME": "testserver",
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "REMOTE_ADDR": "127.0.0.1",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in headers.items():
+        key = name.upper().replace("-", "_")
+        environ[key if key == "CONTENT_TYPE" else f"HTTP_{key}"] = value
+    status = []
+    response = application(environ, lambda s, h, exc_info=None: status.append(s))
+    for _ in response:
+        pass
+    response.close()
+    return int(status[0].split(" ", 1)[0])
+
+
+async def asgi_request(application, body: bytes, headers: dict) -> int:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": PATH,
+        "raw_path": PATH.encode("ascii"),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    disconnected = asyncio.Event()
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # Django listens for a disconnect while the view runs, the client stays connected until the response is sent.
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    status = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await application(scope, receive, send)
+    disconnected.set()
+    return status[0]
+
+
+def run_wsgi(application, requests: list, concurrency: int) -> tuple[list[float], list[int], float]:
+    def timed(request):
+        started = time.perf_counter()
+        status = wsgi_request(application, *request)
+        return time.perf_counter() - started, status
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(timed, requests))
+    else:
+        results = [timed(request) for request in requests]
+    elapsed = time.perf_counter() - started
+    return [latency for latency, _ in results], [status for _, status in results], elapsed
+
+
+def run_asgi(application, requests: list, concurrency: int) -> tuple[list[float], list[int], float]:
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(request):
+            async with semaphore:
+                started = time.perf_counter()
+                status = await asgi_request(application, *request)
+                return time.perf_counter() - started, status
+
+        # Tasks acquire the semaphore in the order they're created, so re-sent deliveries follow the original.
+        return await asyncio.gather(*(timed(request) for request in requests))
+
+    started = time.perf_counter()
+    results = asyncio.run(run())
+    elapsed = time.perf_counter() - started
+    return [latency for latency, _ in results], [status for _, status in results], elapsed
+
+
+def measure_allocations(interface: str, application, requests: list) -> float:
+    """
+    Returns:
+        float: The mean peak of memory allocated while handling a request, in bytes.
+    """
+    peaks = []
+    tracemalloc.start()
+    try:
+        for request in requests:
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            if interface == "wsgi":
+                wsgi_request(application, *request)
+            else:
+                asyncio.run(asgi_request(application, *request))
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - current)
+    finally:
+        tracemalloc.stop()
+    return statistics.mean(peaks)
+
+
+def percentile(latencies: list[float], p: int) -> float:
+    return statistics.quantiles(latencies, n=100, method="inclusive")[p - 1] if len(latencies) > 1 else latencies[0]
+
+
+def parse_threshold(value: str) -> tuple[str, float]:
+    metric, _, limit = value.partition("=")
+    if not metric or not limit:
+        raise argparse.ArgumentTypeError(f"Expected METRIC=VALUE, got {value}")
+    return metric, float(limit)
+
+
+def check_thresholds(scenarios: list[dict], thresholds: list[tuple[str, float]]) -> list[str]:
+    failures = []
+    for scenario in scenarios:
+        for metric, limit in thresholds:
+            if metric not in scenario:
+                failures.append(f"{scenario['name']}: unknown metric {metric}")
+            elif metric in MINIMUM_METRICS and scenario[metric] < limit:
+                failures.append(f"{scenario['name']}: {metric} {scenario[metric]} is below {limit}")
+            elif metric not in MINIMUM_METRICS and scenario[metric] > limit:
+                failures.append(f"{scenario['name']}: {metric} {scenario[metric]} is above {limit}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--interfaces", default="wsgi,asgi")
+    parser.add_argument("--sizes", default="2000,25000,250000", help="Payload sizes in bytes.")
+    parser.add_argument("--duplicate-ratios", default="0,0.2", help="Fractions of requests that re-send an earlier delivery.")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per scenario.")
+    parser.add_argument("--concurrency", type=int, default=1, help="Requests in flight, as threads for WSGI and tasks for ASGI.")
+    parser.add_argument("--memory-sample", type=int, default=100, help="Requests per scenario measured with tracemalloc.")
+    parser.add_argument("--output", default="ingest-results.json", help="The JSON results file.")
+    parser.add_argument("--threshold", type=parse_threshold, action="append", default=[], metavar="METRIC=VALUE",
+                        help="Fail if a scenario exceeds VALUE for METRIC (p50_ms, p95_ms, p99_ms, queries_per_request, "
+                             "allocated_kib_per_request) or falls below it for rps. Can be repeated.")
+    args = parser.parse_args()
+
+    setup_django()
+
+    import django
+    from django.conf import settings
+    from django.db import connection
+    from django.db.backends.signals import connection_created
+
+    from config.asgi import application as asgi_application
+    from config.wsgi import application as wsgi_application
+    from webhooks.cache import recent_deliveries, webhook_config_cache
+    from webhooks.codecs import get_codec
+    from webhooks.models import GitHubWebhook, GitHubWebhookEvent
+
+    # Production settings: with DEBUG every query is recorded, which costs time and memory.
+    settings.DEBUG = False
+    applications = {"wsgi": wsgi_application, "asgi": asgi_application}
+    runners = {"wsgi": run_wsgi, "asgi": run_asgi}
+    counter = QueryCounter()
+    connection_created.connect(counter.install)
+
+    scenarios = []
+    with tempfile.TemporaryDirectory() as directory, test_database(str(Path(directory) / "benchmark.sqlite3")):
+        counter.install(connection)
+        GitHubWebhook.objects.create(public_id=PUBLIC_ID, secret_token=SECRET_TOKEN)
+        seed = 0
+        for interface in args.interfaces.split(","):
+            for size in (int(size) for size in args.sizes.split(",")):
+                for duplicate_ratio in (float(ratio) for ratio in args.duplicate_ratios.split(",")):
+                    seed += 1
+                    GitHubWebhookEvent.objects.all().delete()
+                    webhook_config_cache.clear()
+                    recent_deliveries.clear()
+                    requests = make_requests(args.requests, size, duplicate_ratio, seed)
+                    # Warm up the caches and the connection, as a long running worker would be.
+                    runners[interface](applications[interface], make_requests(20, size, 0, -seed), 1)
+
+                    counter.count = 0
+                    latencies, statuses, elapsed = runners[interface](applications[interface], requests, args.concurrency)
+                    queries = counter.count
+                    allocated = measure_allocations(interface, applications[interface], make_requests(args.memory_sample, size, duplicate_ratio, -seed - 1000))
+
+                    scenarios.append({
+                        "name": f"{interface}/{size}/{duplicate_ratio}",
+                        "interface": interface,
+                        "payload_bytes": len(requests[0][0]),
+                        "duplicate_ratio": duplicate_ratio,
+                        "requests": len(requests),
+                        "concurrency": args.concurrency,
+                        "status_codes": {str(status): statuses.count(status) for status in sorted(set(statuses))},
+                        "rps": round(len(requests) / elapsed, 1),
+                        "p50_ms": round(percentile(latencies, 50) * 1e3, 3),
+                        "p95_ms": round(percentile(latencies, 95) * 1e3, 3),
+                        "p99_ms": round(percentile(latencies, 99) * 1e3, 3),
+                        "queries_per_request": round(queries / len(requests), 3),
+                        "allocated_kib_per_request": round(allocated / 1024, 1),
+                    })
+
+    results = {
+        "environment": {
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "json_codec": get_codec().name,
+            "platform": platform.platform(),
+        },
+        "scenarios": scenarios,
+    }
+    Path(args.output).write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+
+    print_table(
+        ["scenario", "bytes", "status codes", "rps", "p50 ms", "p95 ms", "p99 ms", "queries", "KiB"],
+        [[
+            scenario["name"], scenario["payload_bytes"], " ".join(f"{code}:{count}" for code, count in scenario["status_codes"].items()),
+            scenario["rps"], scenario["p50_ms"], scenario["p95_ms"], scenario["p99_ms"], scenario["queries_per_request"], scenario["allocated_kib_per_request"],
+        ] for scenario in scenarios],
+    )
+    print(f"Results written to {args.output}")
+
+    failures = check_thresholds(scenarios, args.threshold)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
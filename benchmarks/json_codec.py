@@ -0,0 +1,70 @@
+"""
+JSON handling cost of a delivery, per codec and payload size.
+
+"before" is the previous hot path: decode the body to text, decode it again
+for the debug log, parse it with json.loads, re-encode it for the payload
+column with json.dumps and encode the response with DjangoJSONEncoder. "after"
+parses the body bytes once and encodes the payload and response with the
+configured codec.
+
+    python -m benchmarks.json_codec [--sizes 1000,10000,100000,1000000,5000000]
+"""
+
+import argparse
+import json
+import time
+
+from benchmarks import print_table, setup_django
+from benchmarks.payloads import make_payload
+
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000,5000000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.core.serializers.json import DjangoJSONEncoder
+
+    from webhooks.codecs import JSONCodec, OrjsonCodec, orjson
+
+    codecs = [JSONCodec()] + ([OrjsonCodec()] if orjson is not None else [])
+    response = {"status": "accepted"}
+
+    rows = []
+    for size in (int(size) for size in args.sizes.split(",")):
+        body = json.dumps(make_payload(size)).encode("utf-8")
+
+        def before():
+            body.decode("utf-8")
+            payload = json.loads(body.decode("utf-8"))
+            json.dumps(payload)
+            json.dumps(response, cls=DjangoJSONEncoder)
+
+        baseline = best_of(before, args.repeat)
+        rows.append([len(body), "before", f"{baseline * 1e3:.3f}", "1.0x"])
+        for codec in codecs:
+            def after(codec=codec):
+                payload = codec.loads(body)
+                codec.dumps(payload)
+                codec.dumps(response)
+
+            elapsed = best_of(after, args.repeat)
+            rows.append([len(body), f"after ({codec.name})", f"{elapsed * 1e3:.3f}", f"{baseline / elapsed:.1f}x"])
+
+    print_table(["bytes", "path", "ms", "speedup"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Stored size and encode/decode cost of GitHubWebhookEvent.payload per
+compression setting.
+
+Dictionaries are trained the way train_payload_dictionary trains them, from
+the first half of a synthetic corpus of deliveries to a handful of
+repositories and senders, and measured on the second half.
+
+    python -m benchmarks.payload_compression [--events 2000] [--sizes 2000,8000,30000]
+"""
+
+import argparse
+import json
+import time
+
+from benchmarks import print_table, setup_django, test_database
+from benchmarks.payloads import as_delivery, make_payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--sizes", default="2000,8000,30000", help="Payload sizes the corpus cycles through.")
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.test import override_settings
+
+    from webhooks import compression
+    from webhooks.codecs import get_codec
+    from webhooks.fields import CompressedJSONField
+    from webhooks.models import PayloadCompressionDictionary
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    payloads = [
+        as_delivery(make_payload(sizes[i % len(sizes)], seed=i, repositories=20, senders=50))[1]
+        for i in range(args.events)
+    ]
+    training, corpus = payloads[:len(payloads) // 2], payloads[len(payloads) // 2:]
+    raw_size = sum(len(json.dumps(payload).encode("utf-8")) for payload in corpus)
+
+    with test_database():
+        configurations = [("text (JSONField)", None, None), ("none", None, None), ("zlib", "zlib", None)]
+        algorithms = ["zlib"] + (["zstd"] if compression.zstandard is not None else [])
+        for name in algorithms:
+            algorithm = compression.get_algorithm(name)
+            if name == "zstd":
+                configurations.append(("zstd", "zstd", None))
+            size = compression.ZLIB_MAX_DICTIONARY_SIZE if algorithm == compression.ZLIB else 112 * 1024
+            samples = [get_codec().dumps(payload) for payload in training]
+            started = time.perf_counter()
+            data = compression.train_dictionary(samples, algorithm, size)
+            print(f"Trained {len(data)} byte {name} dictionary from {len(samples)} payloads in {time.perf_counter() - started:.2f}s")
+            dictionary = PayloadCompressionDictionary.objects.create(algorithm=name, data=data, sample_size=len(samples))
+            configurations.append((f"{name} + dictionary", name, dictionary.id))
+
+        rows = []
+        for label, algorithm, dictionary_id in configurations:
+            with override_settings(WEBHOOKS_PAYLOAD_COMPRESSION=algorithm, WEBHOOKS_PAYLOAD_COMPRESSION_DICTIONARY=dictionary_id):
+                if algorithm is None and label.startswith("text"):
+                    encode, decode = lambda payload: get_codec().dumps(payload).decode("utf-8"), get_codec().loads
+                else:
+                    encode, decode = CompressedJSONField.encode, CompressedJSONField.decode
+                started = time.perf_counter()
+                encoded = [encode(payload) for payload in corpus]
+                encode_time = time.perf_counter() - started
+                started = time.perf_counter()
+                for value in encoded:
+                    decode(value)
+                decode_time = time.perf_counter() - started
+            stored_size = sum(len(value.encode("utf-8") if isinstance(value, str) else value) for value in encoded)
+            rows.append([
+                label, stored_size, f"{raw_size / stored_size:.1f}x",
+                f"{encode_time / len(corpus) * 1e6:.0f}", f"{decode_time / len(corpus) * 1e6:.0f}",
+            ])
+
+    print(f"{len(corpus)} payloads, {raw_size} bytes of JSON")
+    print_table(["storage", "bytes", "ratio", "encode us", "decode us"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Storage, insert and read cost of GitHubWebhookEvent payloads with and without
+deduplication of their repository, organization, sender and installation
+objects (webhooks/deduplication.py), on a file-backed SQLite database.
+
+The corpus is a stream of push deliveries spread over a number of repositories
+and senders, as a busy organization would produce.
+
+    python -m benchmarks.payload_deduplication [--events 5000] [--size 8000] [--repositories 20] [--senders 100]
+"""
+
+import argparse
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from benchmarks import print_table, setup_django, test_database
+from benchmarks.payloads import as_delivery, make_payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--size", type=int, default=8000)
+    parser.add_argument("--repositories", type=int, default=20)
+    parser.add_argument("--senders", type=int, default=100)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.db import connection
+    from django.test import override_settings
+
+    from webhooks import deduplication
+    from webhooks.models import GitHubWebhook, GitHubWebhookEvent, PayloadObject
+
+    payloads = [
+        as_delivery(make_payload(args.size, seed=i, repositories=args.repositories, senders=args.senders))[1]
+        for i in range(args.events)
+    ]
+
+    rows = []
+    for label, keys in [("inline", []), ("deduplicated", ["repository", "organization", "sender", "installation"])]:
+        deduplication.objects.clear()
+        deduplication.stored.clear()
+        with override_settings(WEBHOOKS_PAYLOAD_DEDUPLICATED_KEYS=keys), tempfile.TemporaryDirectory() as directory, \
+                test_database(str(Path(directory) / "benchmark.sqlite3")):
+            webhook = GitHubWebhook.objects.create(public_id="benchmark", secret_token="")
+            started = time.perf_counter()
+            for payload in payloads:
+                GitHubWebhookEvent.objects.create_delivery(webhook.id, str(uuid.uuid4()), False, event="push", action="created", payload=payload)
+            insert_time = time.perf_counter() - started
+
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT SUM(LENGTH(payload)) FROM webhooks_githubwebhookevent")
+                event_bytes = cursor.fetchone()[0]
+                cursor.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM webhooks_payloadobject")
+                object_bytes = cursor.fetchone()[0]
+            objects = PayloadObject.objects.count()
+
+            deduplication.objects.clear()
+            started = time.perf_counter()
+            for event in GitHubWebhookEvent.objects.order_by("id").iterator():
+                event.payload # pylint: disable=pointless-statement
+            read_time = time.perf_counter() - started
+
+        rows.append([
+            label, event_bytes, objects, object_bytes, event_bytes + object_bytes,
+            f"{args.events / insert_time:.0f}", f"{args.events / read_time:.0f}",
+        ])
+
+    print(f"{args.events} events of about {args.size} bytes, {args.repositories} repositories, {args.senders} senders")
+    print_table(["payloads", "event bytes", "objects", "object bytes", "total bytes", "inserts/s", "reads/s"], rows)
+
+
+if __name__ == "__main__":
+    main()
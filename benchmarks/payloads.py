@@ -0,0 +1,180 @@
+"""
+Synthetic GitHub webhook payloads of realistic shape and size.
+
+Payloads follow the structure of GitHub push events: the repository,
+organization, sender and installation blocks (with their URL templates) that
+GitHub embeds in every delivery, plus commits until the requested size is
+reached.
+"""
+
+import json
+import random
+import uuid
+
+API = "https://api.github.com"
+
+
+def user(login: str, user_id: int) -> dict:
+    url = f"{API}/users/{login}"
+    return {
+        "login": login,
+        "id": user_id,
+        "node_id": f"MDQ6VXNlcj{user_id}",
+        "avatar_url": f"https://avatars.githubusercontent.com/u/{user_id}?v=4",
+        "gravatar_id": "",
+        "url": url,
+        "html_url": f"https://github.com/{login}",
+        "followers_url": f"{url}/followers",
+        "following_url": f"{url}/following{{/other_user}}",
+        "gists_url": f"{url}/gists{{/gist_id}}",
+        "starred_url": f"{url}/starred{{/owner}}{{/repo}}",
+        "subscriptions_url": f"{url}/subscriptions",
+        "organizations_url": f"{url}/orgs",
+        "repos_url": f"{url}/repos",
+        "events_url": f"{url}/events{{/privacy}}",
+        "received_events_url": f"{url}/received_events",
+        "type": "User",
+        "site_admin": False,
+    }
+
+
+def organization(login: str, organization_id: int) -> dict:
+    url = f"{API}/orgs/{login}"
+    return {
+        "login": login,
+        "id": organization_id,
+        "node_id": f"MDEyOk9yZ2FuaXphdGlvbj{organization_id}",
+        "url": url,
+        "repos_url": f"{url}/repos",
+        "events_url": f"{url}/events",
+        "hooks_url": f"{url}/hooks",
+        "issues_url": f"{url}/issues",
+        "members_url": f"{url}/members{{/member}}",
+        "public_members_url": f"{url}/public_members{{/member}}",
+        "avatar_url": f"https://avatars.githubusercontent.com/u/{organization_id}?v=4",
+        "description": "",
+    }
+
+
+def repository(owner: dict, name: str, repository_id: int) -> dict:
+    full_name = f"{owner['login']}/{name}"
+    url = f"{API}/repos/{full_name}"
+    templates = [
+        "forks", "keys{/key_id}", "collaborators{/collaborator}", "teams", "hooks", "issues/events{/number}", "events",
+        "assignees{/user}", "branches{/branch}", "tags", "git/blobs{/sha}", "git/tags{/sha}", "git/refs{/sha}",
+        "git/trees{/sha}", "statuses/{sha}", "languages", "stargazers", "contributors", "subscribers", "subscription",
+        "commits{/sha}", "git/commits{/sha}", "comments{/number}", "issues/comments{/number}", "contents/{+path}",
+        "compare/{base}...{head}", "merges", "{archive_format}{/ref}", "downloads", "issues{/number}",
+        "pulls{/number}", "milestones{/number}", "notifications{?since,all,participating}", "labels{/name}",
+        "releases{/id}", "deployments",
+    ]
+    data = {
+        "id": repository_id,
+        "node_id": f"MDEwOlJlcG9zaXRvcnk{repository_id}",
+        "name": name,
+        "full_name": full_name,
+        "private": False,
+        "owner": owner,
+        "html_url": f"https://github.com/{full_name}",
+        "description": f"The {name} repository",
+        "fork": False,
+        "url": url,
+    }
+    for template in templates:
+        key = template.split("{")[0].split("/")[-1] or "archive"
+        data[f"{key.replace('.', '_')}_url"] = f"{url}/{template}"
+    data.update({
+        "created_at": 1700000000,
+        "updated_at": "2024-01-01T00:00:00Z",
+        "pushed_at": 1700000100,
+        "git_url": f"git://github.com/{full_name}.git",
+        "ssh_url": f"git@github.com:{full_name}.git",
+        "clone_url": f"https://github.com/{full_name}.git",
+        "homepage": None,
+        "size": 1024,
+        "stargazers_count": 42,
+        "watchers_count": 42,
+        "language": "Python",
+        "has_issues": True,
+        "has_projects": True,
+        "has_downloads": True,
+        "has_wiki": True,
+        "has_pages": False,
+        "forks_count": 7,
+        "archived": False,
+        "disabled": False,
+        "open_issues_count": 3,
+        "license": None,
+        "topics": [],
+        "visibility": "public",
+        "default_branch": "main",
+    })
+    return data
+
+
+def commit(rng: random.Random, full_name: str, author: dict) -> dict:
+    sha = "%040x" % rng.getrandbits(160)
+    files = [f"src/module_{rng.randrange(1000)}.py" for _ in range(rng.randrange(1, 6))]
+    return {
+        "id": sha,
+        "tree_id": "%040x" % rng.getrandbits(160),
+        "distinct": True,
+        "message": f"Change {rng.randrange(10 ** 6)}\n\n" + "Some longer description of the change. " * rng.randrange(1, 4),
+        "timestamp": "2024-01-01T00:00:00Z",
+        "url": f"https://github.com/{full_name}/commit/{sha}",
+        "author": {"name": author["login"], "email": f"{author['login']}@users.noreply.github.com", "username": author["login"]},
+        "committer": {"name": "GitHub", "email": "noreply@github.com", "username": "web-flow"},
+        "added": files[:1],
+        "removed": [],
+        "modified": files[1:],
+    }
+
+
+def make_payload(size: int, seed: int = 0, repositories: int = 1, senders: int = 1) -> dict:
+    """
+    Returns a push event payload of about size bytes once encoded as JSON.
+
+    Args:
+        size (int): The approximate encoded size in bytes.
+        seed (int): Seed for the random parts of the payload.
+        repositories (int): The number of distinct repositories to pick from.
+        senders (int): The number of distinct senders to pick from.
+    """
+    rng = random.Random(seed)
+    org = organization("octo-org", 1000)
+    sender_index = rng.randrange(senders)
+    sender = user(f"octocat-{sender_index}", 2000 + sender_index)
+    repository_index = rng.randrange(repositories)
+    repo = repository(user(org["login"], 1000), f"repository-{repository_index}", 3000 + repository_index)
+    payload = {
+        "ref": "refs/heads/main",
+        "before": "%040x" % rng.getrandbits(160),
+        "after": "%040x" % rng.getrandbits(160),
+        "repository": repo,
+        "pusher": {"name": sender["login"], "email": f"{sender['login']}@users.noreply.github.com"},
+        "organization": org,
+        "sender": sender,
+        "installation": {"id": 4000, "node_id": "MDIzOkludGVncmF0aW9uSW5zdGFsbGF0aW9uNDAwMA=="},
+        "created": False,
+        "deleted": False,
+        "forced": False,
+        "compare": f"https://github.com/{repo['full_name']}/compare/main",
+        "commits": [],
+    }
+    encoded_size = len(json.dumps(payload))
+    while encoded_size < size:
+        payload["commits"].append(commit(rng, repo["full_name"], sender))
+        encoded_size += len(json.dumps(payload["commits"][-1])) + 2
+    payload["head_commit"] = payload["commits"][-1] if payload["commits"] else None
+    return payload
+
+
+def as_delivery(payload: dict, delivery_uuid: str | None = None, action: str = "created") -> tuple[str, dict]:
+    """
+    Nests the delivery the way the webhook view expects it, keyed by its delivery UUID.
+
+    Returns:
+        tuple[str, dict]: The delivery UUID and the payload.
+    """
+    delivery_uuid = delivery_uuid or str(uuid.uuid4())
+    return delivery_uuid, {**payload, delivery_uuid: {"action": action}}
@@ -0,0 +1,67 @@
+"""
+Throughput of forged versus valid deliveries through the webhook view.
+
+Forged deliveries carry an X-Hub-Signature-256 signature made with the wrong
+secret, and are rejected after hashing the body, before it's parsed or any
+query is made. Valid deliveries are parsed and stored.
+
+    python -m benchmarks.signatures [--deliveries 500] [--sizes 1000,100000,1000000]
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import time
+
+from benchmarks import print_table, setup_django, test_database
+from benchmarks.payloads import as_delivery, make_payload
+
+SECRET_TOKEN = "benchmark-secret-token"
+
+
+def sign(body: bytes, secret_token: str) -> str:
+    return "sha256=" + hmac.new(secret_token.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--deliveries", type=int, default=500)
+    parser.add_argument("--sizes", default="1000,100000,1000000")
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.test import Client
+
+    from webhooks.models import GitHubWebhook
+
+    rows = []
+    with test_database():
+        webhook = GitHubWebhook.objects.create(public_id="benchmark", secret_token=SECRET_TOKEN, disallow_duplicate_deliveries=False)
+        client = Client()
+        url = f"/webhooks/github/{webhook.public_id}/handle"
+
+        for size in (int(size) for size in args.sizes.split(",")):
+            payload = make_payload(size)
+            deliveries = int(max(10, args.deliveries * min(1, 100000 / size)))
+            for name, secret_token, expected_status in [("valid", SECRET_TOKEN, 202), ("forged", "forged-secret-token", 403)]:
+                requests = []
+                for _ in range(deliveries):
+                    delivery_uuid, data = as_delivery(payload)
+                    body = json.dumps(data).encode("utf-8")
+                    headers = {"X-GitHub-Delivery": delivery_uuid, "X-GitHub-Event": "installation", "X-Hub-Signature-256": sign(body, secret_token)}
+                    requests.append((body, headers))
+
+                started = time.perf_counter()
+                for body, headers in requests:
+                    response = client.post(url, data=body, content_type="application/json", headers=headers)
+                    assert response.status_code == expected_status, response.content
+                elapsed = time.perf_counter() - started
+                rows.append([len(body), name, deliveries, f"{deliveries / elapsed:.0f}"])
+
+    print_table(["bytes", "delivery", "requests", "requests/s"], rows)
+
+
+if __name__ == "__main__":
+    main()
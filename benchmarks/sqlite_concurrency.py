@@ -0,0 +1,177 @@
+"""
+Sustained concurrent writes and admin reads against one SQLite file, for each
+DJANGO_SQLITE_PROFILE (see config/settings.py).
+
+Writer processes post signed deliveries through the WSGI application as fast as
+they can, while reader processes render the GitHubWebhookEvent admin
+changelist (first page, next page and a filtered page) in a loop, as gunicorn
+workers and staff browsing the admin would. Every request that fails, typically
+with "database is locked", is counted as an error along with its exception.
+
+The run exits with status 1 if the concurrent profile had any error.
+
+    python -m benchmarks.sqlite_concurrency [--profiles default,concurrent] [--writers 4] [--readers 2]
+                                            [--duration 20] [--size 2000]
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from benchmarks import print_table, setup_django, test_database
+
+_errors = Counter()
+
+
+def setup_worker(profile: str, path: str):
+    os.environ["DJANGO_SQLITE_PROFILE"] = profile
+    setup_django()
+    # Failed requests are counted, not logged.
+    logging.disable(logging.CRITICAL)
+
+    from django.conf import settings
+    from django.core.signals import got_request_exception
+    from django.db import connection
+
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ["testserver"]
+    connection.settings_dict["NAME"] = path
+    got_request_exception.connect(record_exception)
+
+
+def record_exception(sender, request=None, **kwargs):
+    error = sys.exc_info()[1]
+    _errors[f"{type(error).__name__}: {error}"] += 1
+
+
+def write(seed: int, duration: float, size: int) -> dict:
+    from benchmarks.ingest import make_requests, wsgi_request
+    from config.wsgi import application
+
+    _errors.clear()
+    statuses, latencies = Counter(), []
+    deadline = time.monotonic() + duration
+    chunk = 0
+    while time.monotonic() < deadline:
+        chunk += 1
+        for request in make_requests(100, size, 0, seed * 1_000_000 + chunk):
+            started = time.perf_counter()
+            statuses[wsgi_request(application, *request)] += 1
+            latencies.append(time.perf_counter() - started)
+            if time.monotonic() >= deadline:
+                break
+    return {"statuses": statuses, "latencies": latencies, "errors": Counter(_errors)}
+
+
+def read(duration: float) -> dict:
+    from django.contrib.admin.sites import site
+    from django.contrib.auth.models import User
+    from django.test import RequestFactory
+
+    from webhooks.models import GitHubWebhookEvent
+
+    model_admin = site._registry[GitHubWebhookEvent]
+    user = User(username="benchmark", is_active=True, is_staff=True, is_superuser=True)
+    factory = RequestFactory()
+
+    def get(params: dict):
+        request = factory.get("/admin/webhooks/githubwebhookevent/", params)
+        request.user = user
+        response = model_admin.changelist_view(request)
+        response.render()
+        return response
+
+    statuses, latencies, errors = Counter(), [], Counter()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        for params in [{}, None, {"event": "installation"}]:
+            started = time.perf_counter()
+            try:
+                if params is None:
+                    # The next page of the previous response.
+                    after = response.context_data["cl"].result_list[-1].pk
+                    params = {"after": after}
+                response = get(params)
+                statuses[response.status_code] += 1
+            except Exception as e: # pylint: disable=broad-exception-caught
+                statuses[500] += 1
+                errors[f"{type(e).__name__}: {e}"] += 1
+            latencies.append(time.perf_counter() - started)
+    return {"statuses": statuses, "latencies": latencies, "errors": errors}
+
+
+def summarize(results: list[dict], ok: int, duration: float) -> dict:
+    statuses = sum((result["statuses"] for result in results), Counter())
+    latencies = [latency for result in results for latency in result["latencies"]]
+    return {
+        "requests": sum(statuses.values()),
+        "errors": sum(count for status, count in statuses.items() if status != ok),
+        "rps": round(sum(statuses.values()) / duration, 1),
+        "p99_ms": round(statistics.quantiles(latencies, n=100)[98] * 1e3, 1) if len(latencies) > 1 else 0,
+        "exceptions": sum((result["errors"] for result in results), Counter()),
+    }
+
+
+def run(profile: str, args) -> tuple[dict, dict]:
+    from webhooks.models import GitHubWebhook, GitHubWebhookEvent
+    from benchmarks.ingest import PUBLIC_ID, SECRET_TOKEN
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = str(Path(directory) / "benchmark.sqlite3")
+        with test_database(path):
+            webhook = GitHubWebhook.objects.create(public_id=PUBLIC_ID, secret_token=SECRET_TOKEN)
+            # Something for the readers to page through from the start.
+            GitHubWebhookEvent.objects.bulk_create([
+                GitHubWebhookEvent(webhook=webhook, delivery_uuid=f"00000000-0000-4000-8000-{i:012d}", event="installation", action="created", payload={})
+                for i in range(1000)
+            ])
+
+            workers = args.writers + args.readers
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=setup_worker, initargs=(profile, path)) as pool:
+                # Start every worker before timing, so that imports don't eat into the run.
+                list(pool.map(time.sleep, [1] * workers))
+                writers = [pool.submit(write, seed, args.duration, args.size) for seed in range(args.writers)]
+                readers = [pool.submit(read, args.duration) for _ in range(args.readers)]
+                writes = summarize([future.result() for future in writers], 202, args.duration)
+                reads = summarize([future.result() for future in readers], 200, args.duration)
+    return writes, reads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", default="default,concurrent")
+    parser.add_argument("--writers", type=int, default=4, help="Processes posting deliveries.")
+    parser.add_argument("--readers", type=int, default=2, help="Processes rendering the admin changelist.")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds each process runs for.")
+    parser.add_argument("--size", type=int, default=2000, help="Payload size in bytes.")
+    args = parser.parse_args()
+
+    setup_django()
+
+    rows, failed = [], False
+    for profile in args.profiles.split(","):
+        writes, reads = run(profile, args)
+        rows.append([
+            profile, writes["requests"], writes["errors"], writes["rps"], writes["p99_ms"],
+            reads["requests"], reads["errors"], reads["rps"], reads["p99_ms"],
+        ])
+        for message, count in (writes["exceptions"] + reads["exceptions"]).most_common(5):
+            print(f"{profile}: {count} x {message}")
+        failed |= profile == "concurrent" and bool(writes["errors"] or reads["errors"])
+
+    print_table(["profile", "writes", "errors", "writes/s", "p99 ms", "reads", "errors", "reads/s", "p99 ms"], rows)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,30 @@
 
 WEBHOOKS_URL="http://localhost:8000/webhooks/github/123/handle"
 
+# The secret token used by `python manage.py load_fixtures`
+SECRET_TOKEN_FILE=".django_github_webhook_secret_token_file"
+SECRET_TOKEN="test-secret-token"
+if [ -f "$SECRET_TOKEN_FILE" ]; then
+    SECRET_TOKEN=$(cat "$SECRET_TOKEN_FILE")
+fi
+
 post() {
-    curl -X POST -H "Content-Type: application/json" -d '{
-        "123-random-uuid": {
-            "action": "created"
-        }
-    }' $WEBHOOKS_URL
+    local DELIVERY_UUID
+    DELIVERY_UUID=$(python -c "import uuid; print(uuid.uuid4())")
+
+    local BODY="{\"$DELIVERY_UUID\": {\"action\": \"created\"}}"
+
+    # https://docs.github.com/en/webhooks/using-webhooks/validating-webhook-deliveries
+    local SIGNATURE
+    SIGNATURE=$(printf '%s' "$BODY" | openssl dgst -sha256 -hmac "$SECRET_TOKEN" | sed 's/^.* //')
+
+    curl -X POST \
+        -H "Content-Type: application/json" \
+        -H "X-GitHub-Delivery: $DELIVERY_UUID" \
+        -H "X-GitHub-Event: installation" \
+        -H "X-Hub-Signature-256: sha256=$SIGNATURE" \
+        -d "$BODY" \
+        $WEBHOOKS_URL
 }
 
 post
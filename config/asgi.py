@@ -3,14 +3,32 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Requests served over ASGI are resolved against ``config.asgi_urls`` so that
+endpoints with a native async view (such as the GitHub webhook ingest) avoid a
+sync_to_async hop per request.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
-application = get_asgi_application()
+
+class AsyncURLConfASGIHandler(ASGIHandler):
+    urlconf = "config.asgi_urls"
+
+    def create_request(self, scope, body_file):
+        request, error_response = super().create_request(scope, body_file)
+        if request is not None:
+            request.urlconf = self.urlconf
+        return request, error_response
+
+
+# Equivalent to django.core.asgi.get_asgi_application(), using the handler above.
+django.setup(set_prefix=False)
+application = AsyncURLConfASGIHandler()
@@ -0,0 +1,15 @@
+"""
+URL configuration for the ASGI application.
+
+Endpoints that have a native async view are routed to it here, everything else
+falls through to the shared URL configuration in config/urls.py.
+"""
+
+from django.urls import include, path
+
+from webhooks import views
+
+urlpatterns = [
+    path("webhooks/github/<slug:public_id>/handle", views.ahandle_github_webhook_event, name="handle_github_webhook_event"),
+    path("", include("config.urls")),
+]
@@ -0,0 +1,69 @@
+"""
+A bounded, thread-safe LRU cache shared by the per-process caches of the apps.
+
+Entries optionally expire after a number of seconds, so that values which can
+change elsewhere, like a webhook's configuration, are eventually read again.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A bounded, thread-safe LRU mapping whose entries optionally expire.
+
+    Args:
+        max_size (int): The number of entries kept, 0 or less disables the cache.
+        ttl (float | None): Seconds an entry is kept for, None keeps it until it's evicted.
+    """
+
+    def __init__(self, max_size: int, ttl: float | None = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        # Lookups with get() answered from and missing the cache.
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if not self._is_live(key):
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][1]
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return self._is_live(key)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def set(self, key, value=None):
+        if self.max_size <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _is_live(self, key) -> bool:
+        # Called with the lock held, drops the entry if it expired.
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        if entry[0] is not None and entry[0] < time.monotonic():
+            del self._entries[key]
+            return False
+        return True
@@ -64,6 +64,18 @@ if DEBUG and not ENCRYPTION_KEY:
         raise ValueError("The ENCRYPTION_KEY environment variable is not set and DEBUG is False. Use `python manage.py generate_encryption_key` to generate a new key.")
 
 ENCRYPTION_KEY_FALLBACKS = []
+# Cipher new values are encrypted with, "fernet" or "aes-gcm", see encryption/ciphers.py.
+ENCRYPTION_CIPHER = "fernet"
+# Encrypted fields are decrypted the first time they're read rather than when rows are loaded.
+ENCRYPTION_LAZY_DECRYPTION = True
+# Plaintexts of recently decrypted values are cached per process, 0 disables the cache.
+ENCRYPTION_DECRYPTION_CACHE_MAX_SIZE = 0
+ENCRYPTION_DECRYPTION_CACHE_TTL = 300
+
+# SECURITY WARNING: keep the blind index key used in production secret!
+# Key of the HMACs of encrypted fields with a BlindIndexField, derived from ENCRYPTION_KEY and ENCRYPTION_KEY_FALLBACKS if not set.
+ENCRYPTION_BLIND_INDEX_KEY = os.getenv("DJANGO_ENCRYPTION_BLIND_INDEX_KEY")
+ENCRYPTION_BLIND_INDEX_KEY_FALLBACKS = []
 
 # SECURITY WARNING: keep the OpenAI API key used in production secret!
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -74,6 +86,12 @@ if DEBUG and not OPENAI_API_KEY:
         with open(django_openai_api_key_file, "r", encoding="utf-8") as f:
             OPENAI_API_KEY = f.read().strip()
 
+# Server of the OpenAI API, the official one if not set.
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+# Chat completion requests in flight at once when getting responses in bulk, see openai_chat/batch.py.
+OPENAI_MAX_CONCURRENCY = 8
+OPENAI_MAX_RETRIES = 2
+
 
 # https://docs.djangoproject.com/en/5.1/ref/settings/#allowed-hosts
 ALLOWED_HOSTS = []
@@ -135,6 +153,42 @@ DATABASES = {
     }
 }
 
+# "concurrent" tunes SQLite for several gunicorn or uvicorn workers ingesting
+# deliveries while the admin reads, see benchmarks/sqlite_concurrency.py:
+#
+#   - WAL lets readers and the writer proceed at the same time, and commits
+#     only fsync the log. With synchronous=NORMAL a power loss can lose the last
+#     commits but never corrupts the database.
+#   - Writers wait up to "timeout" seconds for the lock instead of failing with
+#     "database is locked".
+#   - Transactions take the write lock when they begin (BEGIN IMMEDIATE), so
+#     that a transaction which read first can't deadlock with another writer,
+#     which SQLite reports immediately without waiting for the timeout.
+#   - Connections are kept for CONN_MAX_AGE seconds, so the pragmas and the
+#     page cache aren't set up again on every request.
+SQLITE_PROFILE = os.getenv("DJANGO_SQLITE_PROFILE", "default")
+if SQLITE_PROFILE == "concurrent":
+    DATABASES["default"].update({
+        "OPTIONS": {
+            "init_command": (
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"
+                # 32 MiB of page cache and 256 MiB of memory-mapped I/O per connection.
+                "PRAGMA cache_size=-32768;"
+                "PRAGMA mmap_size=268435456;"
+                "PRAGMA temp_store=MEMORY;"
+                # Truncate the WAL back to 64 MiB after checkpoints.
+                "PRAGMA journal_size_limit=67108864;"
+            ),
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 10,
+        },
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+    })
+elif SQLITE_PROFILE != "default":
+    raise ValueError(f"Unknown DJANGO_SQLITE_PROFILE {SQLITE_PROFILE}, expected \"default\" or \"concurrent\".")
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -202,6 +256,67 @@ LOGGING = {
 }
 
 
+# Webhooks
+
+# JSON codec for deliveries, stored payloads and responses: "auto" (orjson if installed), "orjson" or "json".
+WEBHOOKS_JSON_CODEC = "auto"
+
+# Handlers slower than this many seconds are logged, see webhooks/dispatch.py.
+WEBHOOKS_SLOW_HANDLER_THRESHOLD = 1.0
+# "inline" processes deliveries in the request, "spool" stores them for the process_webhook_deliveries command.
+WEBHOOKS_INGEST_MODE = os.getenv("WEBHOOKS_INGEST_MODE", "inline")
+
+# Webhook configuration is cached per process, keyed by public_id.
+WEBHOOKS_CONFIG_CACHE_MAX_SIZE = 1024
+WEBHOOKS_CONFIG_CACHE_TTL = 60
+# Set to a CACHES alias shared by all workers to propagate invalidations between them.
+WEBHOOKS_CONFIG_CACHE_VERSION_ALIAS = None
+# Number of recently stored deliveries remembered per process to reject quick redeliveries, 0 to disable.
+WEBHOOKS_RECENT_DELIVERIES_MAX_SIZE = 10000
+# Buffer accepted events per process and insert them in batches, see webhooks/writer.py.
+WEBHOOKS_BATCH_WRITER = False
+WEBHOOKS_BATCH_WRITER_MAX_SIZE = 200
+WEBHOOKS_BATCH_WRITER_MAX_DELAY = 0.05
+# "flush" acknowledges deliveries once their batch is committed, "buffer" as soon as they're buffered.
+WEBHOOKS_BATCH_WRITER_DURABILITY = "flush"
+# Store payloads compressed in GitHubWebhookEvent.payload_compressed instead of the payload JSON column: None, "zlib" or "zstd" (requires zstandard), see webhooks/compression.py.
+WEBHOOKS_PAYLOAD_COMPRESSION = os.getenv("WEBHOOKS_PAYLOAD_COMPRESSION") or None
+WEBHOOKS_PAYLOAD_COMPRESSION_LEVEL = None
+# Id of a PayloadCompressionDictionary trained with the train_payload_dictionary command.
+WEBHOOKS_PAYLOAD_COMPRESSION_DICTIONARY = None
+# Payload keys whose objects are stored once and referenced from each payload, e.g. ["repository", "organization", "sender", "installation"], see webhooks/deduplication.py.
+WEBHOOKS_PAYLOAD_DEDUPLICATED_KEYS = []
+WEBHOOKS_PAYLOAD_OBJECT_CACHE_MAX_SIZE = 1024
+# Payload values copied into indexed GitHubWebhookEvent columns, by column, see webhooks/extraction.py.
+WEBHOOKS_EXTRACTED_FIELDS = {
+    "installation_id": "installation.id",
+    "repository_id": "repository.id",
+    "repository_full_name": "repository.full_name",
+    "sender_login": "sender.login",
+}
+# Days events are kept by prune_webhook_events, None to keep them forever. GitHubWebhook.retention_days takes precedence.
+WEBHOOKS_EVENT_RETENTION_DAYS = None
+WEBHOOKS_EVENT_RETENTION_DAYS_BY_EVENT = {}
+# Deliveries per minute accepted per webhook, None for no limit. GitHubWebhook.rate_limit takes precedence, see webhooks/ratelimit.py.
+WEBHOOKS_RATE_LIMIT = None
+WEBHOOKS_RATE_LIMIT_BURST = None
+# Set to a CACHES alias shared by all workers to share rate limits between them.
+WEBHOOKS_RATE_LIMIT_CACHE_ALIAS = None
+# Requests handled at once per process by the ingest views, further ones get a 429 response. None for no limit.
+WEBHOOKS_MAX_IN_FLIGHT = None
+# Page the GitHubWebhookEvent admin by id with counts capped at WEBHOOKS_ADMIN_COUNT_LIMIT, see webhooks/changelist.py.
+WEBHOOKS_ADMIN_KEYSET_PAGINATION = True
+WEBHOOKS_ADMIN_COUNT_LIMIT = 1000
+# Choices of the event and action filters, read through their indexes and cached for this many seconds.
+WEBHOOKS_ADMIN_FILTER_MAX_CHOICES = 100
+WEBHOOKS_ADMIN_FILTER_CHOICES_TTL = 300
+# Add per-stage timings of the ingest views to their responses in a Server-Timing header.
+WEBHOOKS_SERVER_TIMING = False
+# Aggregate ingest timings per process and serve them at /webhooks/metrics, see webhooks/metrics.py.
+WEBHOOKS_METRICS = False
+WEBHOOKS_METRICS_ALLOWED_IPS = ["127.0.0.1", "::1"]
+
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 STATIC_URL = "static/"
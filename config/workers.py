@@ -0,0 +1,36 @@
+"""
+Helpers for running Django code in worker processes.
+
+Worker processes are started with the spawn start method, which works on every
+platform and doesn't inherit the parent's database connections. Pass
+``setup_worker`` as the initializer of the pool so Django is configured before
+any task, and therefore any model import, is unpickled in the worker.
+
+An initializer of the caller's own runs after Django is set up. It's passed to
+the workers by its dotted path so that its module is imported only then.
+"""
+
+import multiprocessing
+import os
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.utils.module_loading import import_string
+
+
+def setup_worker(initializer: str | None = None, initargs: tuple = ()):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+    django.setup()
+    if initializer is not None:
+        import_string(initializer)(*initargs)
+
+
+def get_worker_pool(workers: int, initializer: Callable | None = None, initargs: tuple = ()) -> ProcessPoolExecutor:
+    initializer_path = f"{initializer.__module__}.{initializer.__qualname__}" if initializer is not None else None
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=setup_worker,
+        initargs=(initializer_path, initargs),
+    )
@@ -0,0 +1,96 @@
+import base64
+import hashlib
+import hmac
+import unicodedata
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from django.conf import settings
+
+
+# Encrypted values are randomised, so an encrypted column can't be compared with
+# a value in SQL. A BlindIndexField stores a keyed HMAC of the normalised
+# plaintext of an EncryptedTextField next to it:
+#
+#   <key id>:<first 128 bits of HMAC-SHA256, hex>
+#
+# and exact lookups on the encrypted field are compiled to an
+# indexed lookup of the HMAC of the value under each blind index key instead, see
+# encryption.fields.
+#
+# The HMAC key is ENCRYPTION_BLIND_INDEX_KEY, or one derived from ENCRYPTION_KEY
+# if it's not set. Keys are rotated separately from the encryption keys: move
+# the old key to ENCRYPTION_BLIND_INDEX_KEY_FALLBACKS, lookups keep matching
+# rows indexed with it, and rotate_blind_index_keys recomputes them. Keys
+# derived from ENCRYPTION_KEY_FALLBACKS are fallbacks too, so rotating
+# ENCRYPTION_KEY doesn't stop lookups from matching rows indexed before.
+#
+# Equal plaintexts have equal blind indexes, which reveals which rows share a
+# value. Only index fields whose values are unique or nearly so.
+
+
+def normalize(value: str) -> str:
+    return unicodedata.normalize("NFC", value)
+
+
+def get_key_id(key: bytes) -> str:
+    return hashlib.sha256(key).hexdigest()[:8]
+
+
+def derive_key(encryption_key: str | bytes) -> bytes:
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"astra.encryption.blind-index")
+    return hkdf.derive(base64.urlsafe_b64decode(encryption_key))
+
+
+def get_keys() -> list[bytes]:
+    """
+    Returns:
+        list[bytes]: The blind index keys, the primary key first.
+    """
+    key = getattr(settings, "ENCRYPTION_BLIND_INDEX_KEY", None)
+    if key:
+        keys = [key]
+    else:
+        keys = [derive_key(settings.ENCRYPTION_KEY)]
+    keys += getattr(settings, "ENCRYPTION_BLIND_INDEX_KEY_FALLBACKS", None) or []
+    keys += [derive_key(key) for key in getattr(settings, "ENCRYPTION_KEY_FALLBACKS", None) or []]
+    return [key.encode("utf-8") if isinstance(key, str) else key for key in keys]
+
+
+class BlindIndexer:
+    """
+    Computes the blind indexes of values.
+
+    Args:
+        keys (list[bytes]): HMAC keys, the primary key first.
+    """
+
+    def __init__(self, keys: list[bytes]):
+        self.keys = {get_key_id(key): key for key in keys}
+        self.primary_key_id = get_key_id(keys[0])
+        self.prefix = f"{self.primary_key_id}:"
+
+    def _compute(self, key_id: str, value: str) -> str:
+        digest = hmac.new(self.keys[key_id], normalize(value).encode("utf-8"), hashlib.sha256).hexdigest()
+        return f"{key_id}:{digest[:32]}"
+
+    def compute(self, value: str) -> str:
+        """
+        Returns:
+            str: The blind index of a value under the primary key.
+        """
+        return self._compute(self.primary_key_id, value)
+
+    def get_candidates(self, value: str) -> list[str]:
+        """
+        Returns:
+            list[str]: The blind index of a value under each key.
+        """
+        return [self._compute(key_id, value) for key_id in self.keys]
+
+    def is_current(self, index: str) -> bool:
+        return index.startswith(self.prefix)
+
+
+def get_indexer() -> BlindIndexer:
+    return BlindIndexer(get_keys())
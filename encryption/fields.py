@@ -1,54 +1,343 @@
 import logging
 
-from cryptography.fernet import Fernet, MultiFernet, InvalidToken
+from cryptography.fernet import InvalidToken
 from django.conf import settings
-from django.db.models import TextField
+from django.db.models import CharField, TextField
+from django.db.models.expressions import Col
+from django.db.models.lookups import Exact, In
+from django.db.models.query_utils import DeferredAttribute
 from django.forms import PasswordInput
 from django.utils.translation import gettext as _
 
+from config.lru import LRUCache
+
+from . import blind_index
+from .ciphers import Keyring
+
 
 logger = logging.getLogger("astra.encryption")
 
 
-def get_fernet() -> MultiFernet:
-    if settings.ENCRYPTION_KEY:
-        primary_fernet = Fernet(settings.ENCRYPTION_KEY)
-    else:
+# Decrypting a value costs an HMAC and an AES decrypt, which adds up when
+# querysets load thousands of rows whose encrypted columns are never read, like
+# GitHubWebhook.client_id. With ENCRYPTION_LAZY_DECRYPTION, rows are loaded with
+# the ciphertext wrapped in Ciphertext and EncryptedTextField's descriptor
+# decrypts it the first time the attribute is read. Saving an instance whose
+# encrypted attribute was never read writes the ciphertext back unchanged.
+#
+# ENCRYPTION_DECRYPTION_CACHE_MAX_SIZE optionally keeps the plaintext of
+# recently decrypted ciphertexts in process memory, for at most
+# ENCRYPTION_DECRYPTION_CACHE_TTL seconds, so that rows read on every request
+# aren't decrypted every time. It holds secrets in memory, so it's disabled by
+# default; decryption_cache.clear() drops them, e.g. after removing a key.
+#
+# Decrypted values are DecryptedText, which keeps the ciphertext they were
+# decrypted from, and assigning an equal plaintext keeps it too. Such values are
+# saved as the ciphertext they came from instead of being encrypted again, and
+# EncryptedModel.save() leaves the encrypted fields that still hold the value
+# loaded from the database out of the UPDATE, see get_update_fields().
+
+
+def get_keyring() -> Keyring:
+    if not settings.ENCRYPTION_KEY:
         raise ValueError("ENCRYPTION_KEY setting must be set")
 
-    fallback_fernets = []
-    if hasattr(settings, "ENCRYPTION_KEY_FALLBACKS") and settings.ENCRYPTION_KEY_FALLBACKS:
+    fallback_keys = getattr(settings, "ENCRYPTION_KEY_FALLBACKS", None) or []
+    if fallback_keys:
         logger.info("Using fallback encryption keys, please run `python manage.py rotate_encryption_keys`")
-        fallback_fernets = [Fernet(key) for key in settings.ENCRYPTION_KEY_FALLBACKS]
 
-    return MultiFernet([primary_fernet] + fallback_fernets)
+    return Keyring([settings.ENCRYPTION_KEY, *fallback_keys], getattr(settings, "ENCRYPTION_CIPHER", "fernet"))
+
+keyring = get_keyring()
+
+blind_indexer = blind_index.get_indexer()
+
+decryption_cache = LRUCache(
+    max_size=getattr(settings, "ENCRYPTION_DECRYPTION_CACHE_MAX_SIZE", 0),
+    ttl=getattr(settings, "ENCRYPTION_DECRYPTION_CACHE_TTL", 300),
+)
+
+
+class Ciphertext(str):
+    """
+    An encrypted value loaded from the database that hasn't been decrypted yet.
+    """
+    __slots__ = ()
+
+
+class DecryptedText(str):
+    """
+    A decrypted value, with the ciphertext it was decrypted from.
+    """
+
+    def __new__(cls, plaintext: str, ciphertext: str):
+        value = super().__new__(cls, plaintext)
+        value.ciphertext = str(ciphertext)
+        return value
+
+    def __getnewargs__(self):
+        return str(self), self.ciphertext
+
+
+# Key of the instance __dict__ holding the ciphertexts loaded from the database, by attname.
+LOADED_CIPHERTEXTS = "_loaded_ciphertexts"
+
+
+def get_ciphertext(value) -> str | None:
+    """
+    Returns:
+        str | None: The ciphertext of a value that was loaded from the database,
+        or None if it's a new value.
+    """
+    if isinstance(value, Ciphertext):
+        return str(value)
+    if isinstance(value, DecryptedText):
+        return value.ciphertext
+    return None
 
-fernet = get_fernet()
 
 def encrypt(value: str) -> str:
-    return fernet.encrypt(value.encode("utf-8")).decode("utf-8")
+    return keyring.encrypt(value.encode("utf-8"))
 
 def decrypt(value: str) -> str:
+    value = str(value)
+    cached = decryption_cache.max_size > 0
+    if cached:
+        plaintext = decryption_cache.get(value)
+        if plaintext is not None:
+            return plaintext
     try:
-        return fernet.decrypt(value.encode("utf-8")).decode("utf-8")
+        plaintext = keyring.decrypt(value).decode("utf-8")
     except InvalidToken:
         logger.error("Unable to decrypt, invalid token")
-    return "Unable to decrypt"
+        return "Unable to decrypt"
+    if cached:
+        decryption_cache.set(value, plaintext)
+    return plaintext
+
+
+class DecryptingAttribute(DeferredAttribute):
+    """
+    Decrypts an encrypted value the first time it's read from an instance.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, Ciphertext):
+            value = DecryptedText(decrypt(value), value)
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        # Defining __set__ makes this a data descriptor, so __get__ is called even once the value is loaded.
+        attname = self.field.attname
+        if isinstance(value, Ciphertext) or (isinstance(value, DecryptedText) and attname not in instance.__dict__):
+            # Loaded from the database, by Model.from_db() or refresh_from_db().
+            instance.__dict__.setdefault(LOADED_CIPHERTEXTS, {})[attname] = get_ciphertext(value)
+        elif isinstance(value, str) and not isinstance(value, DecryptedText):
+            # Forms assign the plaintext back even when it wasn't changed.
+            current = instance.__dict__.get(attname)
+            if isinstance(current, (Ciphertext, DecryptedText)) and self.__get__(instance) == value:
+                value = instance.__dict__[attname]
+        instance.__dict__[attname] = value
+
+
+def has_changed(instance, field: "EncryptedTextField") -> bool:
+    """
+    Returns:
+        bool: Whether an encrypted field of an instance was assigned a value other
+        than the one loaded from the database. Deferred fields haven't changed.
+    """
+    if field.attname not in instance.__dict__:
+        return False
+    ciphertext = get_ciphertext(instance.__dict__[field.attname])
+    return ciphertext is None or ciphertext != instance.__dict__.get(LOADED_CIPHERTEXTS, {}).get(field.attname)
+
 
 class EncryptedTextField(TextField):
+    """
+    A TextField encrypted with ENCRYPTION_KEY, see encryption.ciphers.
+
+    Values read through the model attribute are decrypted. With
+    ENCRYPTION_LAZY_DECRYPTION, values read with values() or values_list() are
+    Ciphertext, use decrypt() on them.
+
+    Values can only be filtered on if the model has a BlindIndexField of the
+    field, see BlindIndexExact.
+    """
     description = _("Encrypted text")
+    descriptor_class = DecryptingAttribute
 
     def from_db_value(self, value, expression, connection):
-        try:
-            return decrypt(value)
-        except InvalidToken:
-            logger.warning("Invalid encryption token: %s", value)
+        if value is None:
             return value
+        if getattr(settings, "ENCRYPTION_LAZY_DECRYPTION", True):
+            return Ciphertext(value)
+        return DecryptedText(decrypt(value), value)
+
+    def pre_save(self, model_instance, add):
+        # Reading the attribute would decrypt a value only to encrypt it again.
+        ciphertext = get_ciphertext(model_instance.__dict__.get(self.attname))
+        if ciphertext is not None:
+            return Ciphertext(ciphertext)
+        return super().pre_save(model_instance, add)
 
     def get_prep_value(self, value):
+        ciphertext = get_ciphertext(value)
+        if ciphertext is not None:
+            return ciphertext
         return encrypt(value)
 
     def formfield(self, **kwargs):
         # Use a PasswordInput widget for the form field
         kwargs["widget"] = PasswordInput(render_value=True)
         return super().formfield(**kwargs)
+
+
+class BlindIndexField(CharField):
+    """
+    The blind index of an EncryptedTextField of the same model, see
+    encryption.blind_index. It's computed when the model is saved, update()
+    and bulk_update() leave it as it is; rotate_blind_index_keys --all
+    recomputes it for every row.
+
+    Args:
+        source (str): The name of the EncryptedTextField.
+    """
+    description = _("Blind index of an encrypted field")
+
+    def __init__(self, *args, source: str, **kwargs):
+        self.source = source
+        kwargs.setdefault("max_length", 64)
+        kwargs.setdefault("db_index", True)
+        kwargs.setdefault("editable", False)
+        kwargs.setdefault("blank", True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs["source"] = self.source
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        source = model_instance._meta.get_field(self.source)
+        index = model_instance.__dict__.get(self.attname)
+        if index and not has_changed(model_instance, source):
+            return index
+        value = getattr(model_instance, source.attname)
+        index = blind_indexer.compute(value) if value is not None else ""
+        setattr(model_instance, self.attname, index)
+        return index
+
+
+class EncryptionHeaderField(CharField):
+    """
+    The header of the current cipher and key (see encryption.ciphers) if every
+    EncryptedTextField of the row is encrypted with them, empty otherwise, so
+    that rotate_encryption_keys finds the rows it has to rotate with an index.
+    It's computed when the model is saved, update() and bulk_update() leave it
+    as it is.
+    """
+    description = _("Header of the encrypted fields")
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("max_length", 32)
+        kwargs.setdefault("db_index", True)
+        kwargs.setdefault("editable", False)
+        kwargs.setdefault("blank", True)
+        kwargs.setdefault("default", "")
+        super().__init__(*args, **kwargs)
+
+    def pre_save(self, model_instance, add):
+        fields = [field for field in model_instance._meta.concrete_fields if isinstance(field, EncryptedTextField)]
+        header = model_instance.__dict__.get(self.attname)
+        if not add and header is not None and not any(has_changed(model_instance, field) for field in fields):
+            return header
+        header = keyring.header if all(is_current(model_instance, field) for field in fields) else ""
+        setattr(model_instance, self.attname, header)
+        return header
+
+
+def is_current(instance, field: EncryptedTextField) -> bool:
+    """
+    Returns:
+        bool: Whether the value of an encrypted field of an instance is saved
+        encrypted with the current cipher and key. Deferred fields aren't known to be.
+    """
+    if field.attname not in instance.__dict__:
+        return False
+    ciphertext = get_ciphertext(instance.__dict__[field.attname])
+    # Other values are empty or encrypted when they're saved.
+    return ciphertext is None or keyring.is_current(ciphertext)
+
+
+def get_encryption_header_field(model) -> EncryptionHeaderField | None:
+    for field in model._meta.concrete_fields:
+        if isinstance(field, EncryptionHeaderField):
+            return field
+    return None
+
+
+def get_blind_index_field(field: EncryptedTextField) -> BlindIndexField | None:
+    for other in field.model._meta.concrete_fields:
+        if isinstance(other, BlindIndexField) and other.source == field.name:
+            return other
+    return None
+
+
+class BlindIndexLookupMixin:
+    """
+    Compiles a comparison of an EncryptedTextField with a plaintext value to an
+    indexed lookup of its blind indexes under each key, if the field has a
+    BlindIndexField. Values are compared NFC normalised, but case-sensitively:
+    iexact isn't supported.
+
+    Comparisons with a Ciphertext compare the stored values.
+    """
+    # The value must not be encrypted like a value being saved.
+    prepare_rhs = False
+
+    def as_sql(self, compiler, connection):
+        if isinstance(self.lhs, Col) and isinstance(self.rhs, str) and not isinstance(self.rhs, Ciphertext):
+            blind_index_field = get_blind_index_field(self.lhs.target)
+            if blind_index_field is not None:
+                lookup = In(Col(self.lhs.alias, blind_index_field), blind_indexer.get_candidates(self.rhs))
+                return lookup.as_sql(compiler, connection)
+        return super().as_sql(compiler, connection)
+
+
+@EncryptedTextField.register_lookup
+class BlindIndexExact(BlindIndexLookupMixin, Exact):
+    pass
+
+
+def get_update_fields(instance) -> list[str]:
+    """
+    Returns:
+        list[str]: The fields an UPDATE of a model instance loaded from the
+        database must write: its loaded fields, except the encrypted fields that
+        weren't changed and their blind indexes, and the blind indexes of the
+        encrypted fields that were and the encryption header, even if deferred.
+    """
+    deferred = instance.get_deferred_fields()
+    unchanged, changed = set(), set()
+    header_field = get_encryption_header_field(instance._meta.model)
+    for field in instance._meta.concrete_fields:
+        if not isinstance(field, EncryptedTextField):
+            continue
+        blind_index_field = get_blind_index_field(field)
+        if has_changed(instance, field):
+            if blind_index_field is not None:
+                changed.add(blind_index_field.name)
+            if header_field is not None:
+                changed.add(header_field.name)
+        else:
+            unchanged.add(field.name)
+            if blind_index_field is not None and instance.__dict__.get(blind_index_field.attname):
+                unchanged.add(blind_index_field.name)
+    return [
+        field.name for field in instance._meta.concrete_fields
+        if not field.primary_key and (field.name in changed or (field.attname not in deferred and field.name not in unchanged))
+    ]
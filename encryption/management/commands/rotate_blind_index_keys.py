@@ -0,0 +1,61 @@
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from encryption.blind_index import BlindIndexer, get_keys
+from encryption.fields import BlindIndexField
+
+
+class Command(BaseCommand):
+    help = "Recompute the blind indexes of encrypted fields that aren't computed with ENCRYPTION_BLIND_INDEX_KEY"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of rows read and updated at a time.")
+        parser.add_argument("--all", action="store_true", help="Recompute the blind indexes of every row, e.g. after values were changed with update().")
+
+    def handle(self, *args, **options):
+        indexer = BlindIndexer(get_keys())
+        models_with_blind_indexes = sorted(
+            (model for model in apps.get_models() if any(isinstance(field, BlindIndexField) for field in model._meta.concrete_fields)),
+            key=lambda model: model._meta.label,
+        )
+
+        rows, started = 0, time.perf_counter()
+        for model in models_with_blind_indexes:
+            fields = [field for field in model._meta.concrete_fields if isinstance(field, BlindIndexField)]
+            self.stdout.write(f"Recomputing blind indexes for model {model._meta.verbose_name}, {len(fields)} blind indexes")
+
+            queryset = model._default_manager.order_by("pk")
+            if not options["all"]:
+                # Rows indexed with a fallback key or not at all, so an interrupted run resumes where it stopped.
+                stale = Q()
+                for field in fields:
+                    stale |= ~Q(**{f"{field.attname}__startswith": indexer.prefix})
+                queryset = queryset.filter(stale)
+            queryset = queryset.only("pk", *[field.source for field in fields])
+
+            last_pk, updated = None, 0
+            while True:
+                with transaction.atomic(using=queryset.db):
+                    chunk = queryset.select_for_update()
+                    if last_pk is not None:
+                        chunk = chunk.filter(pk__gt=last_pk)
+                    instances = list(chunk[:options["batch_size"]])
+                    if not instances:
+                        break
+                    for instance in instances:
+                        for field in fields:
+                            value = getattr(instance, field.source)
+                            setattr(instance, field.attname, indexer.compute(value) if value is not None else "")
+                    model._default_manager.bulk_update(instances, [field.name for field in fields])
+                last_pk = instances[-1].pk
+                updated += len(instances)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"Updated {updated} rows, last id {last_pk} ({(rows + updated) / elapsed:.0f} rows/s)")
+            rows += updated
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Blind indexes recomputed, {rows} rows in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/s)"))
@@ -1,49 +1,180 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from cryptography.fernet import InvalidToken
 from django.apps import apps
 from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.db import transaction
+from django.db.models import ExpressionWrapper, F, Q, TextField, Value
+
+from config.workers import get_worker_pool
+from encryption.ciphers import Keyring
+from encryption.fields import Ciphertext, EncryptedTextField, get_encryption_header_field
+
+logger = logging.getLogger("astra.encryption.rotate_encryption_keys")
+
+
+# Only rows with a value that isn't encrypted with the current cipher and primary
+# key are rotated. They are found with the index on the encryption_header column
+# of EncryptedModel, which holds the header of the current cipher and key (see
+# encryption.ciphers) once all the values of the row are encrypted with them,
+# or for other models by the header of their values, which needs a full scan.
+# Their values are decrypted and encrypted again with Keyring.rotate(), without
+# the plaintext going through the model. Rows are read and written back a chunk
+# at a time, each chunk in its own short transaction, with update queries that
+# don't touch updated_at or send signals.
+#
+# --workers spreads the crypto of each chunk across a process pool, and
+# --checkpoint records the last primary key rotated for each model so that an
+# interrupted run can be resumed from there.
 
-from encryption.fields import EncryptedTextField
+_keyring = None
+
+
+def init_worker(keys: list, cipher: str):
+    global _keyring # pylint: disable=global-statement
+    _keyring = Keyring(keys, cipher)
+
+
+def rotate_tokens(tokens: list[str | None]) -> list[str | None]:
+    """
+    Returns:
+        list[str | None]: Each token encrypted with the current cipher and primary key,
+        unchanged if it already is, or None if it's empty or can't be decrypted with any key.
+    """
+    rotated = []
+    for token in tokens:
+        try:
+            rotated.append(token if token and _keyring.is_current(token) else _keyring.rotate(token) if token else None)
+        except InvalidToken:
+            rotated.append(None)
+    return rotated
 
 
 class Command(BaseCommand):
     help = "Rotate encryption keys"
 
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of rows read and updated at a time.")
+        parser.add_argument("--workers", type=int, default=0, help="Number of processes encrypting the values, 0 encrypts them in this process.")
+        parser.add_argument("--checkpoint", help="File recording the progress of the rotation, an interrupted run started with the same file resumes where it stopped.")
+
     def handle(self, *args, **options):
-        # Check if encryption key fallbacks are set in settings
-        if not hasattr(settings, 'ENCRYPTION_KEY_FALLBACKS') or not settings.ENCRYPTION_KEY_FALLBACKS:
-            self.stdout.write(self.style.ERROR("No encryption key fallbacks found in settings"))
-            return
+        keys = [settings.ENCRYPTION_KEY, *(getattr(settings, "ENCRYPTION_KEY_FALLBACKS", None) or [])]
+        cipher = getattr(settings, "ENCRYPTION_CIPHER", "fernet")
+        self.header = Keyring(keys, cipher).header
+        self.checkpoint_path = options["checkpoint"]
+        self.checkpoint = {}
+        if self.checkpoint_path and os.path.isfile(self.checkpoint_path):
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                self.checkpoint = json.load(f)
+            self.stdout.write(f"Resuming from {self.checkpoint_path}")
+
+        # Get all models with EncryptedTextField fields
+        models_with_encrypted_fields = sorted(
+            (model for model in apps.get_models() if any(isinstance(field, EncryptedTextField) for field in model._meta.concrete_fields)),
+            key=lambda model: model._meta.label,
+        )
+
+        pool = None
+        if options["workers"] > 0:
+            pool = get_worker_pool(options["workers"], initializer=init_worker, initargs=(keys, cipher))
+        else:
+            init_worker(keys, cipher)
+        try:
+            rows, started = 0, time.perf_counter()
+            for model in models_with_encrypted_fields:
+                rows += self.rotate_model(model, options["batch_size"], pool, options["workers"])
+        finally:
+            if pool:
+                pool.shutdown()
+
+        if self.checkpoint_path and os.path.isfile(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Encryption keys rotated successfully, {rows} rows in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/s)"))
+
+    def rotate_model(self, model, batch_size: int, pool: ProcessPoolExecutor | None, workers: int) -> int:
+        """
+        Returns:
+            int: The number of rows rotated.
+        """
+        label = model._meta.label
+        fields = [field for field in model._meta.concrete_fields if isinstance(field, EncryptedTextField)]
+        self.stdout.write(f"Rotating encryption keys for model {model._meta.verbose_name}, {len(fields)} encrypted fields")
 
-         # Get all models with EncryptedTextField fields
-        models_with_encrypted_fields = {
-            model for model in apps.get_models()
-            if any(isinstance(field, EncryptedTextField) for field in model._meta.get_fields())
-        }
-
-        # Rotate encryption keys for each model
-        for model in models_with_encrypted_fields:
-            self.stdout.write(f"Rotating encryption keys for model {model._meta.verbose_name}")
-
-            # Get all EncryptedTextField fields on the model
-            encrypted_fields_on_model = [field for field in model._meta.get_fields() if isinstance(field, EncryptedTextField)]
-            self.stdout.write(f"Found {len(encrypted_fields_on_model)} encrypted fields on model {model._meta.verbose_name}")
-
-            # Rotate encryption keys for each instance
-            with transaction.atomic():
-                for instance in model.objects.all():
-                    self.stdout.write(f"Rotating encryption keys for instance {instance.pk}")
-                    # Re-saving the instance is crude but effective.
-                    # A more efficient approach would be to update the field values directly in the database.
-                    # However, this approach is more complex and error-prone.
-                    # The current approach is simple and works well for small datasets.
-                    # For large datasets, consider using a more efficient approach.
-                    # For example, you could use the Django ORM to update the field values directly in the database.
-
-                    # TODO: Implement a more efficient approach for large datasets
-                    # TODO: Implement a rotation that doesn't cause the updated_at field to be updated
-                    instance.save()
-
-            self.stdout.write(self.style.SUCCESS(f"Encryption keys rotated for model {model._meta.verbose_name}"))
-
-        self.stdout.write(self.style.SUCCESS("Encryption keys rotated successfully"))
+        # Read the stored tokens as they are, EncryptedTextField would decrypt them.
+        columns = {field.attname: ExpressionWrapper(F(field.attname), output_field=TextField()) for field in fields}
+        header_field = get_encryption_header_field(model)
+        stale = Q()
+        if header_field is not None:
+            # Two ranges rather than a not equal, which an index can't serve, in a
+            # subquery so that the database doesn't scan the table in primary key order instead.
+            stale_pks = model._default_manager.filter(
+                Q(**{f"{header_field.attname}__lt": self.header}) | Q(**{f"{header_field.attname}__gt": self.header})
+            ).values("pk")
+            stale = Q(pk__in=stale_pks)
+        else:
+            for field in fields:
+                # Wrapped in Ciphertext, the header would be encrypted as a value otherwise.
+                stale |= ~Q(**{f"{field.attname}__startswith": Ciphertext(self.header)})
+        queryset = model._default_manager.filter(stale).order_by("pk")
+        last_pk, rows, failed, started = self.checkpoint.get(label), 0, 0, time.perf_counter()
+        while True:
+            with transaction.atomic(using=queryset.db):
+                chunk = queryset.select_for_update()
+                if last_pk is not None:
+                    chunk = chunk.filter(pk__gt=last_pk)
+                batch = list(chunk.values_list("pk", *columns.values())[:batch_size])
+                if not batch:
+                    break
+                tokens = [token for row in batch for token in row[1:]]
+                if pool:
+                    size = -(-len(tokens) // workers)
+                    rotated = [token for part in pool.map(rotate_tokens, [tokens[i:i + size] for i in range(0, len(tokens), size)]) for token in part]
+                else:
+                    rotated = rotate_tokens(tokens)
+
+                instances = []
+                for i, row in enumerate(batch):
+                    instance = model(pk=row[0])
+                    current = True
+                    for j, field in enumerate(fields):
+                        token = rotated[i * len(fields) + j]
+                        if token is None and row[j + 1]:
+                            failed += 1
+                            current = False
+                            logger.warning("Unable to decrypt %s of %s %s with any key", field.name, label, row[0])
+                        if token and token != row[j + 1]:
+                            # Passed as an expression, bulk_update() would otherwise read the attribute and encrypt it again.
+                            instance.__dict__[field.attname] = Value(Ciphertext(token), output_field=field)
+                        else:
+                            instance.__dict__[field.attname] = F(field.attname)
+                    if header_field is not None:
+                        # Rows with a value that can't be decrypted are left stale.
+                        instance.__dict__[header_field.attname] = self.header if current else ""
+                    instances.append(instance)
+                model._default_manager.bulk_update(instances, [field.name for field in fields] + ([header_field.name] if header_field else []))
+            last_pk = batch[-1][0]
+            rows += len(batch)
+            self.save_checkpoint(label, last_pk)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"Rotated {rows} rows, last id {last_pk} ({rows / elapsed:.0f} rows/s)")
+
+        if failed:
+            self.stdout.write(self.style.WARNING(f"{failed} values of model {model._meta.verbose_name} couldn't be decrypted and were left as they are"))
+        self.stdout.write(self.style.SUCCESS(f"Encryption keys rotated for model {model._meta.verbose_name}"))
+        return rows
+
+    def save_checkpoint(self, label: str, last_pk):
+        if not self.checkpoint_path:
+            return
+        self.checkpoint[label] = last_pk
+        # Replace the file at once, so that an interrupted write can't lose the progress.
+        with open(f"{self.checkpoint_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(self.checkpoint, f)
+        os.replace(f"{self.checkpoint_path}.tmp", self.checkpoint_path)
@@ -0,0 +1,29 @@
+from django.db import models
+
+from .fields import EncryptionHeaderField, get_update_fields
+
+
+class EncryptedModel(models.Model):
+    """
+    A model that leaves the encrypted fields it didn't change out of UPDATEs.
+
+    save() without update_fields on an instance loaded from the database only
+    writes the fields returned by encryption.fields.get_update_fields(). As with
+    any save() with update_fields, it raises DatabaseError if the row was
+    deleted in the meantime rather than inserting it again.
+
+    encryption_header records whether the encrypted fields of the row are
+    encrypted with the current cipher and key, see EncryptionHeaderField.
+    """
+    encryption_header = EncryptionHeaderField()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, update_fields=None, **kwargs):
+        if (
+            update_fields is None and not args and not self._state.adding
+            and not kwargs.get("force_insert") and kwargs.get("using") in (None, self._state.db)
+        ):
+            update_fields = get_update_fields(self)
+        super().save(*args, update_fields=update_fields, **kwargs)
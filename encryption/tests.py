@@ -1,3 +1,426 @@
-from django.test import TestCase
+from io import StringIO
+import json
+import os
+import pickle
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+from cryptography.fernet import Fernet, InvalidToken
+from django.conf import settings
+from django.contrib.admin.sites import site
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from config.lru import LRUCache
+from webhooks.models import GitHubWebhook, GitHubWebhookEvent
+
+from . import ciphers, fields
+from .blind_index import BlindIndexer, derive_key, get_keys
+from .ciphers import Keyring
+from .fields import DecryptedText
+from .fields import Ciphertext
+
+
+class EncryptedTextFieldTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.webhook = GitHubWebhook.objects.create(public_id="test-public-id", client_id="test-client-id", secret_token="test-secret-token")
+
+    def get_ciphertexts(self):
+        return GitHubWebhook.objects.filter(id=self.webhook.id).values_list("client_id", "secret_token").get()
+
+    def test_values_are_stored_encrypted(self):
+        client_id, secret_token = self.get_ciphertexts()
+        self.assertIsInstance(secret_token, Ciphertext)
+        self.assertNotIn("test-secret-token", secret_token)
+        self.assertEqual((fields.decrypt(client_id), fields.decrypt(secret_token)), ("test-client-id", "test-secret-token"))
+
+    def test_values_are_decrypted_when_read(self):
+        with mock.patch.object(fields.keyring, "decrypt", wraps=fields.keyring.decrypt) as decrypt:
+            webhook = GitHubWebhook.objects.get(id=self.webhook.id)
+            self.assertEqual(decrypt.call_count, 0)
+            self.assertEqual(webhook.secret_token, "test-secret-token")
+            self.assertEqual(webhook.secret_token, "test-secret-token")
+            self.assertEqual(decrypt.call_count, 1)
+        self.assertNotIsInstance(webhook.secret_token, Ciphertext)
+
+    @override_settings(ENCRYPTION_LAZY_DECRYPTION=False)
+    def test_eager_decryption(self):
+        with mock.patch.object(fields.keyring, "decrypt", wraps=fields.keyring.decrypt) as decrypt:
+            webhook = GitHubWebhook.objects.get(id=self.webhook.id)
+            self.assertEqual(decrypt.call_count, 2)
+        self.assertEqual(webhook.__dict__["client_id"], "test-client-id")
+
+    def test_save_keeps_values_that_were_not_read(self):
+        ciphertexts = self.get_ciphertexts()
+        webhook = GitHubWebhook.objects.get(id=self.webhook.id)
+        webhook.secret_token = "new-secret-token"
+        webhook.save()
+        client_id, secret_token = self.get_ciphertexts()
+        self.assertEqual(client_id, ciphertexts[0])
+        self.assertEqual(fields.decrypt(secret_token), "new-secret-token")
+        webhook = GitHubWebhook.objects.get(id=self.webhook.id)
+        self.assertEqual((webhook.client_id, webhook.secret_token), ("test-client-id", "new-secret-token"))
+
+
+class DecryptionCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(fields, "decryption_cache", LRUCache(max_size=2, ttl=60))
+        self.cache = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_decrypted_values_are_cached(self):
+        ciphertext = fields.encrypt("test-secret-token")
+        with mock.patch.object(fields.keyring, "decrypt", wraps=fields.keyring.decrypt) as decrypt:
+            self.assertEqual(fields.decrypt(ciphertext), "test-secret-token")
+            self.assertEqual(fields.decrypt(Ciphertext(ciphertext)), "test-secret-token")
+            self.assertEqual(decrypt.call_count, 1)
+            self.cache.clear()
+            fields.decrypt(ciphertext)
+            self.assertEqual(decrypt.call_count, 2)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_cache_is_bounded(self):
+        ciphertexts = [fields.encrypt(str(i)) for i in range(3)]
+        for ciphertext in ciphertexts:
+            fields.decrypt(ciphertext)
+        self.assertIsNone(self.cache.get(ciphertexts[0]))
+        self.assertEqual(self.cache.get(ciphertexts[2]), "2")
+
+    def test_entries_expire(self):
+        ciphertext = fields.encrypt("test-secret-token")
+        fields.decrypt(ciphertext)
+        with mock.patch("time.monotonic", return_value=time.monotonic() + 61):
+            self.assertIsNone(self.cache.get(ciphertext))
+
+    def test_invalid_tokens_are_not_cached(self):
+        self.assertEqual(fields.decrypt("invalid-token"), "Unable to decrypt")
+        self.assertIsNone(self.cache.get("invalid-token"))
+
+    def test_disabled_cache(self):
+        self.cache.max_size = 0
+        fields.decrypt(fields.encrypt("test-secret-token"))
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 0))
+
+
+class RotateEncryptionKeysTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.webhooks = [
+            GitHubWebhook.objects.create(public_id=f"test-public-id-{i}", client_id=f"test-client-id-{i}", secret_token=f"test-secret-token-{i}")
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        self.key = Fernet.generate_key()
+        patcher = override_settings(ENCRYPTION_KEY=self.key, ENCRYPTION_KEY_FALLBACKS=[settings.ENCRYPTION_KEY])
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+    def rotate(self, **options) -> str:
+        stdout = StringIO()
+        call_command("rotate_encryption_keys", batch_size=2, stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def get_plaintexts(self, key) -> list:
+        keyring = Keyring([key])
+        plaintexts = []
+        for client_id, secret_token in GitHubWebhook.objects.order_by("id").values_list("client_id", "secret_token"):
+            try:
+                plaintexts.append((keyring.decrypt(client_id).decode(), keyring.decrypt(secret_token).decode()))
+            except InvalidToken:
+                plaintexts.append(None)
+        return plaintexts
+
+    def test_values_are_reencrypted_with_the_primary_key(self):
+        updated_at = list(GitHubWebhook.objects.order_by("id").values_list("updated_at", flat=True))
+        output = self.rotate()
+        self.assertIn("Rotated 5 rows", output)
+        self.assertEqual(self.get_plaintexts(self.key), [(f"test-client-id-{i}", f"test-secret-token-{i}") for i in range(5)])
+        self.assertEqual(list(GitHubWebhook.objects.order_by("id").values_list("updated_at", flat=True)), updated_at)
+
+    def test_workers(self):
+        self.rotate(workers=2)
+        self.assertEqual(self.get_plaintexts(self.key), [(f"test-client-id-{i}", f"test-secret-token-{i}") for i in range(5)])
+
+    def test_only_stale_rows_are_rotated(self):
+        GitHubWebhook.objects.filter(id=self.webhooks[0].id).update(client_id=Ciphertext(Keyring([self.key]).encrypt(b"test-client-id-0")))
+        self.assertIn("Rotated 5 rows", self.rotate())
+        self.assertIn("Encryption keys rotated successfully, 0 rows", self.rotate())
+
+    @override_settings(ENCRYPTION_CIPHER="aes-gcm")
+    def test_cipher_change(self):
+        self.rotate()
+        for client_id, secret_token in GitHubWebhook.objects.values_list("client_id", "secret_token"):
+            self.assertTrue(client_id.startswith(f"v1:g:{ciphers.get_key_id(self.key)}:"))
+            self.assertTrue(secret_token.startswith(f"v1:g:{ciphers.get_key_id(self.key)}:"))
+        self.assertEqual(self.get_plaintexts(self.key), [(f"test-client-id-{i}", f"test-secret-token-{i}") for i in range(5)])
+
+    def test_resumes_from_checkpoint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, "checkpoint.json")
+            with open(checkpoint, "w", encoding="utf-8") as f:
+                json.dump({"webhooks.GitHubWebhook": self.webhooks[2].id}, f)
+            output = self.rotate(checkpoint=checkpoint)
+            self.assertFalse(os.path.exists(checkpoint))
+        self.assertIn("Rotated 2 rows", output)
+        self.assertEqual(self.get_plaintexts(self.key), [None, None, None, ("test-client-id-3", "test-secret-token-3"), ("test-client-id-4", "test-secret-token-4")])
+
+    def test_values_that_cannot_be_decrypted_are_left_as_they_are(self):
+        GitHubWebhook.objects.filter(id=self.webhooks[0].id).update(client_id=Ciphertext("invalid-token"))
+        output = self.rotate()
+        self.assertIn("1 values of model GitHub Webhook couldn't be decrypted", output)
+        self.assertEqual(GitHubWebhook.objects.filter(id=self.webhooks[0].id).values_list("client_id", flat=True).get(), "invalid-token")
+        self.assertEqual(Keyring([self.key]).decrypt(GitHubWebhook.objects.filter(id=self.webhooks[0].id).values_list("secret_token", flat=True).get()), b"test-secret-token-0")
+
+
+    def test_encryption_header(self):
+        header = Keyring([self.key]).header
+        self.assertFalse(GitHubWebhook.objects.filter(encryption_header=header).exists())
+        GitHubWebhook.objects.filter(id=self.webhooks[0].id).update(client_id=Ciphertext("invalid-token"))
+        with CaptureQueriesContext(connection) as queries:
+            self.rotate()
+        self.assertEqual(set(GitHubWebhook.objects.exclude(id=self.webhooks[0].id).values_list("encryption_header", flat=True)), {header})
+        # Left stale, so that the next run tries it again.
+        self.assertEqual(GitHubWebhook.objects.filter(id=self.webhooks[0].id).values_list("encryption_header", flat=True).get(), "")
+        if connection.vendor == "sqlite":
+            # The stale rows are found through the index instead of scanning the table.
+            select = next(query["sql"] for query in queries.captured_queries if query["sql"].startswith("SELECT"))
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {select}")
+                plan = " ".join(row[-1] for row in cursor.fetchall())
+            self.assertNotIn("SCAN webhooks_githubwebhook", plan)
+
+    def test_save_keeps_the_encryption_header_current(self):
+        webhook = GitHubWebhook.objects.get(id=self.webhooks[0].id)
+        header = fields.keyring.header
+        self.assertEqual(webhook.encryption_header, header)
+        with mock.patch.object(fields, "keyring", Keyring([self.key, *settings.ENCRYPTION_KEY_FALLBACKS])):
+            webhook.enabled = False
+            webhook.save()
+            self.assertEqual(GitHubWebhook.objects.filter(id=webhook.id).values_list("encryption_header", flat=True).get(), header)
+            # Only one of the values is encrypted with the new key.
+            webhook = GitHubWebhook.objects.only("id", "client_id").get(id=webhook.id)
+            webhook.client_id = "new-client-id"
+            webhook.save()
+            self.assertEqual(GitHubWebhook.objects.filter(id=webhook.id).values_list("encryption_header", flat=True).get(), "")
+            webhook = GitHubWebhook.objects.get(id=webhook.id)
+            webhook.secret_token = "new-secret-token"
+            webhook.save()
+            self.assertEqual(GitHubWebhook.objects.filter(id=webhook.id).values_list("encryption_header", flat=True).get(), Keyring([self.key]).header)
+
+
+class KeyringTest(SimpleTestCase):
+
+    def setUp(self):
+        self.old_key, self.key = Fernet.generate_key(), Fernet.generate_key()
+
+    def test_values_name_their_cipher_and_key(self):
+        for cipher, cipher_id in ciphers.CIPHERS.items():
+            keyring = Keyring([self.key, self.old_key], cipher)
+            value = keyring.encrypt(b"test-secret-token")
+            self.assertTrue(value.startswith(f"v1:{cipher_id}:{ciphers.get_key_id(self.key)}:"))
+            self.assertTrue(keyring.is_current(value))
+            self.assertEqual(keyring.decrypt(value), b"test-secret-token")
+
+    def test_values_are_decrypted_with_the_key_they_name(self):
+        value = Keyring([self.old_key], "aes-gcm").encrypt(b"test-secret-token")
+        keyring = Keyring([self.key, self.old_key])
+        self.assertFalse(keyring.is_current(value))
+        with mock.patch.object(keyring, "_legacy") as legacy, mock.patch.object(keyring, "_get_fernet") as get_fernet:
+            self.assertEqual(keyring.decrypt(value), b"test-secret-token")
+        legacy.decrypt.assert_not_called()
+        get_fernet.assert_not_called()
+        self.assertTrue(keyring.is_current(keyring.rotate(value)))
+
+    def test_legacy_fernet_tokens(self):
+        value = Fernet(self.old_key).encrypt(b"test-secret-token").decode()
+        keyring = Keyring([self.key, self.old_key])
+        self.assertEqual(keyring.decrypt(value), b"test-secret-token")
+        self.assertFalse(keyring.is_current(value))
+
+    def test_aes_gcm_is_more_compact(self):
+        fernet, aesgcm = Keyring([self.key], "fernet"), Keyring([self.key], "aes-gcm")
+        self.assertLess(len(aesgcm.encrypt(b"x" * 40)), len(fernet.encrypt(b"x" * 40)))
+
+    def test_invalid_values_raise_invalid_token(self):
+        keyring = Keyring([self.key], "aes-gcm")
+        value = keyring.encrypt(b"test-secret-token")
+        tampered = value[:-2] + ("AA" if value[-2:] != "AA" else "BB")
+        for invalid in [tampered, value.replace(keyring.header, "v1:f:" + keyring.primary_key_id + ":"), Keyring([self.old_key]).encrypt(b"x"), "v1:g", "v1:x:00000000:abc"]:
+            with self.assertRaises(InvalidToken):
+                keyring.decrypt(invalid)
+
+    def test_unknown_cipher_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            Keyring([self.key], "rot13")
+
+
+class BlindIndexTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.webhooks = [GitHubWebhook.objects.create(public_id=f"test-public-id-{i}", client_id=f"test-client-id-{i}") for i in range(3)]
+
+    def test_blind_index_is_computed_on_save(self):
+        index = GitHubWebhook.objects.values_list("client_id_blind_index", flat=True).get(id=self.webhooks[0].id)
+        self.assertEqual(index, fields.blind_indexer.compute("test-client-id-0"))
+        self.assertTrue(index.startswith(fields.blind_indexer.prefix))
+
+        webhook = GitHubWebhook.objects.get(id=self.webhooks[0].id)
+        with mock.patch.object(fields.blind_indexer, "compute", wraps=fields.blind_indexer.compute) as compute:
+            webhook.enabled = False
+            webhook.save()
+            compute.assert_not_called()
+            webhook.client_id = "new-client-id"
+            webhook.save()
+            compute.assert_called_once_with("new-client-id")
+
+    def test_exact_lookups_use_the_blind_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(list(GitHubWebhook.objects.filter(client_id="test-client-id-1")), [self.webhooks[1]])
+        self.assertIn("client_id_blind_index", queries.captured_queries[0]["sql"])
+        self.assertFalse(GitHubWebhook.objects.filter(client_id="test-client-id").exists())
+
+        event = GitHubWebhookEvent.objects.create(webhook=self.webhooks[1], delivery_uuid="00000000-0000-4000-8000-000000000000", event="ping", payload={})
+        self.assertEqual(list(GitHubWebhookEvent.objects.filter(webhook__client_id="test-client-id-1")), [event])
+
+    def test_ciphertext_lookups_compare_stored_values(self):
+        ciphertext = GitHubWebhook.objects.values_list("client_id", flat=True).get(id=self.webhooks[0].id)
+        self.assertEqual(list(GitHubWebhook.objects.filter(client_id=ciphertext)), [self.webhooks[0]])
+
+    def test_admin_search(self):
+        model_admin = site._registry[GitHubWebhook]
+        request = RequestFactory().get("/")
+        request.user = User(is_superuser=True, is_staff=True)
+        queryset, _ = model_admin.get_search_results(request, GitHubWebhook.objects.all(), "test-client-id-2")
+        self.assertEqual(list(queryset), [self.webhooks[2]])
+        queryset, _ = model_admin.get_search_results(request, GitHubWebhook.objects.all(), "TEST-CLIENT-ID-2")
+        self.assertFalse(queryset.exists())
+
+    def test_key_rotation(self):
+        old_keys = [fields.blind_indexer.keys[fields.blind_indexer.primary_key_id]]
+        with override_settings(ENCRYPTION_BLIND_INDEX_KEY="new-blind-index-key", ENCRYPTION_BLIND_INDEX_KEY_FALLBACKS=old_keys):
+            indexer = BlindIndexer([b"new-blind-index-key", *old_keys])
+            with mock.patch.object(fields, "blind_indexer", indexer):
+                # Rows indexed with the fallback key are still found.
+                self.assertTrue(GitHubWebhook.objects.filter(client_id="test-client-id-0").exists())
+                stdout = StringIO()
+                call_command("rotate_blind_index_keys", batch_size=2, stdout=stdout)
+                self.assertIn("Blind indexes recomputed, 3 rows", stdout.getvalue())
+                self.assertEqual(
+                    list(GitHubWebhook.objects.order_by("id").values_list("client_id_blind_index", flat=True)),
+                    [indexer.compute(f"test-client-id-{i}") for i in range(3)],
+                )
+                with mock.patch.object(indexer, "keys", {indexer.primary_key_id: b"new-blind-index-key"}):
+                    self.assertTrue(GitHubWebhook.objects.filter(client_id="test-client-id-0").exists())
+
+                stdout = StringIO()
+                call_command("rotate_blind_index_keys", stdout=stdout)
+                self.assertIn("Blind indexes recomputed, 0 rows", stdout.getvalue())
+
+    @override_settings(ENCRYPTION_BLIND_INDEX_KEY=None, ENCRYPTION_BLIND_INDEX_KEY_FALLBACKS=[])
+    def test_encryption_key_rotation(self):
+        new_key = Fernet.generate_key()
+        with override_settings(ENCRYPTION_KEY=new_key, ENCRYPTION_KEY_FALLBACKS=[settings.ENCRYPTION_KEY]):
+            indexer = BlindIndexer(get_keys())
+            with mock.patch.object(fields, "blind_indexer", indexer):
+                # Rows indexed with the key derived from the old ENCRYPTION_KEY are still found.
+                self.assertEqual(list(GitHubWebhook.objects.filter(client_id="test-client-id-0")), [self.webhooks[0]])
+                stdout = StringIO()
+                call_command("rotate_blind_index_keys", stdout=stdout)
+                self.assertIn("Blind indexes recomputed, 3 rows", stdout.getvalue())
+                self.assertEqual(
+                    GitHubWebhook.objects.values_list("client_id_blind_index", flat=True).get(id=self.webhooks[0].id),
+                    BlindIndexer([derive_key(new_key)]).compute("test-client-id-0"),
+                )
+
+
+class UnchangedEncryptedFieldsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        cls.webhooks = [
+            GitHubWebhook.objects.create(public_id=f"test-public-id-{i}", client_id=f"test-client-id-{i}", secret_token=f"test-secret-token-{i}")
+            for i in range(2)
+        ]
+
+    def get_ciphertexts(self, webhook):
+        return GitHubWebhook.objects.filter(id=webhook.id).values_list("client_id", "secret_token").get()
+
+    def save(self, webhook, **kwargs) -> str:
+        with mock.patch.object(fields.keyring, "encrypt", wraps=fields.keyring.encrypt) as encrypt, CaptureQueriesContext(connection) as queries:
+            webhook.save(**kwargs)
+        self.encrypt_count = encrypt.call_count
+        return [query["sql"] for query in queries.captured_queries if query["sql"].startswith("UPDATE")][0]
+
+    def test_unchanged_values_are_left_out_of_the_update(self):
+        ciphertexts = self.get_ciphertexts(self.webhooks[0])
+        webhook = GitHubWebhook.objects.get(id=self.webhooks[0].id)
+        self.assertEqual(webhook.secret_token, "test-secret-token-0")
+        # Assigned back, like a form does.
+        webhook.client_id = "test-client-id-0"
+        webhook.enabled = False
+        sql = self.save(webhook)
+        self.assertEqual(self.encrypt_count, 0)
+        self.assertNotIn('"client_id"', sql)
+        self.assertNotIn('"secret_token"', sql)
+        self.assertNotIn('"client_id_blind_index"', sql)
+        self.assertIn('"enabled"', sql)
+        self.assertEqual(self.get_ciphertexts(self.webhooks[0]), ciphertexts)
+
+    def test_changed_values_are_encrypted(self):
+        webhook = GitHubWebhook.objects.get(id=self.webhooks[0].id)
+        webhook.secret_token = "new-secret-token"
+        sql = self.save(webhook)
+        self.assertEqual(self.encrypt_count, 1)
+        self.assertIn('"secret_token"', sql)
+        self.assertNotIn('"client_id"', sql)
+        self.assertEqual(GitHubWebhook.objects.get(id=webhook.id).secret_token, "new-secret-token")
+
+    def test_values_of_other_instances_keep_their_ciphertext(self):
+        webhook = GitHubWebhook.objects.get(id=self.webhooks[0].id)
+        webhook.secret_token = GitHubWebhook.objects.get(id=self.webhooks[1].id).secret_token
+        sql = self.save(webhook)
+        self.assertEqual(self.encrypt_count, 0)
+        self.assertIn('"secret_token"', sql)
+        self.assertEqual(self.get_ciphertexts(webhook)[1], self.get_ciphertexts(self.webhooks[1])[1])
+        self.assertEqual(GitHubWebhook.objects.get(id=webhook.id).secret_token, "test-secret-token-1")
+
+    def test_explicit_update_fields(self):
+        webhook = GitHubWebhook.objects.get(id=self.webhooks[0].id)
+        sql = self.save(webhook, update_fields=["secret_token"])
+        self.assertEqual(self.encrypt_count, 0)
+        self.assertIn('"secret_token"', sql)
+
+    @override_settings(ENCRYPTION_LAZY_DECRYPTION=False)
+    def test_eager_decryption(self):
+        webhook = GitHubWebhook.objects.only("id", "client_id").get(id=self.webhooks[0].id)
+        self.assertEqual(fields.get_update_fields(webhook), [])
+        webhook.client_id = "new-client-id"
+        self.assertEqual(fields.get_update_fields(webhook), ["encryption_header", "client_id", "client_id_blind_index"])
+
+    def test_admin_change_form(self):
+        ciphertexts = self.get_ciphertexts(self.webhooks[0])
+        self.client.force_login(self.user)
+        response = self.client.post(f"/admin/webhooks/githubwebhook/{self.webhooks[0].id}/change/", {
+            "public_id": "test-public-id-0",
+            "client_id": "test-client-id-0",
+            "secret_token": "test-secret-token-0",
+            "validate_deliveries": "on",
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(GitHubWebhook.objects.get(id=self.webhooks[0].id).enabled)
+        self.assertEqual(self.get_ciphertexts(self.webhooks[0]), ciphertexts)
+
+    def test_decrypted_text_pickles(self):
+        value = pickle.loads(pickle.dumps(DecryptedText("test-secret-token", "ciphertext")))
+        self.assertEqual((value, value.ciphertext), ("test-secret-token", "ciphertext"))
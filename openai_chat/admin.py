@@ -1,8 +1,9 @@
 import logging
 
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.utils.translation import gettext as _
 
+from .batch import get_responses
 from .models import OpenAIChatCompletion, OpenAIChatCompletionMessage, OpenAIChatCompletionResponse, OpenAIChatCompletionResponseChoice
 
 logger = logging.getLogger("astra.openai_chat.admin")
@@ -11,8 +12,10 @@ logger = logging.getLogger("astra.openai_chat.admin")
 @admin.action(description=_("Get selected OpenAI Chat Completion responses"))
 def get_response_for_selected(modeladmin, request, queryset):
     logger.info("Getting response for selected chat completions")
-    for obj in queryset:
-        obj.get_response()
+    result = get_responses(queryset)
+    modeladmin.message_user(request, _("Got %(responses)d responses, %(skipped)d completions without messages skipped.") % {"responses": result.responses, "skipped": result.skipped})
+    if result.failed:
+        modeladmin.message_user(request, _("%(failed)d requests failed, see the logs.") % {"failed": result.failed}, messages.ERROR)
 
 class OpenAIChatCompletionMessageInline(admin.TabularInline):
     model = OpenAIChatCompletionMessage
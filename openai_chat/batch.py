@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch, QuerySet
+from openai import AsyncOpenAI
+
+from .models import OpenAIChatCompletionMessage, OpenAIChatCompletionResponse, OpenAIChatCompletionResponseChoice
+
+logger = logging.getLogger("astra.openai_chat.batch")
+
+
+# Responses for many chat completions are requested concurrently rather than one
+# after the other:
+#
+#   - the messages of every completion are read in one query up front,
+#   - the requests share one AsyncOpenAI client, and so its connection pool,
+#     with at most OPENAI_MAX_CONCURRENCY of them in flight,
+#   - the responses and their choices are inserted with one bulk_create() each
+#     once every request has finished.
+#
+# A failed request is logged and counted, it doesn't fail the others. With
+# raise_errors, the exception of the first failed request is raised once the
+# responses of the others are stored.
+# OPENAI_BASE_URL points the client at another server, e.g. a proxy or a stub
+# in tests.
+
+
+@dataclass
+class BatchResult:
+    responses: int = 0
+    skipped: int = 0
+    errors: Counter = field(default_factory=Counter)
+
+    @property
+    def failed(self) -> int:
+        return sum(self.errors.values())
+
+
+def get_client() -> AsyncOpenAI:
+    return AsyncOpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        base_url=getattr(settings, "OPENAI_BASE_URL", None),
+        max_retries=getattr(settings, "OPENAI_MAX_RETRIES", 2),
+    )
+
+
+async def create_chat_completions(requests: list[dict], concurrency: int) -> list:
+    """
+    Args:
+        requests (list[dict]): The arguments of each chat completion request.
+        concurrency (int): The maximum number of requests in flight.
+
+    Returns:
+        list: The ChatCompletion of each request, or the exception it raised.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    async with get_client() as client:
+
+        async def create(request: dict):
+            async with semaphore:
+                # https://platform.openai.com/docs/api-reference/chat/create
+                return await client.chat.completions.create(**request)
+
+        return await asyncio.gather(*[create(request) for request in requests], return_exceptions=True)
+
+
+def get_responses(queryset: QuerySet, concurrency: int | None = None, raise_errors: bool = False) -> BatchResult:
+    """
+    Gets a response for each chat completion of a queryset, see module comment.
+
+    Args:
+        queryset (QuerySet): The OpenAIChatCompletion to get responses for.
+        concurrency (int | None): The maximum number of requests in flight, OPENAI_MAX_CONCURRENCY by default.
+        raise_errors (bool): Raise the exception of the first failed request instead of only counting it.
+
+    Returns:
+        BatchResult: The number of responses stored, of completions skipped for
+        having no messages, and the errors of the failed requests.
+
+    Raises:
+        openai.OpenAIError: If a request failed and raise_errors is set.
+    """
+    if concurrency is None:
+        concurrency = getattr(settings, "OPENAI_MAX_CONCURRENCY", 8)
+    result = BatchResult()
+
+    completions, requests = [], []
+    for completion in queryset.prefetch_related(Prefetch("messages", queryset=OpenAIChatCompletionMessage.objects.order_by("id"))):
+        messages = [{"role": message.role, "content": message.content} for message in completion.messages.all()]
+        if not messages:
+            logger.warning("No messages to get response in chat completion %s", completion)
+            result.skipped += 1
+            continue
+        completions.append(completion)
+        requests.append({"model": completion.model, "messages": messages})
+    if not requests:
+        return result
+
+    chat_completions = async_to_sync(create_chat_completions)(requests, concurrency)
+
+    responses, choices, exceptions = [], [], []
+    for completion, chat_completion in zip(completions, chat_completions):
+        if isinstance(chat_completion, Exception):
+            logger.error("Unable to get response in chat completion %s %s: %s", completion.id, completion, chat_completion)
+            result.errors[type(chat_completion).__name__] += 1
+            exceptions.append(chat_completion)
+            continue
+        responses.append(OpenAIChatCompletionResponse(chat_completion=completion, model=chat_completion.model))
+        choices.append([choice.message.content or "" for choice in chat_completion.choices])
+
+    with transaction.atomic():
+        OpenAIChatCompletionResponse.objects.bulk_create(responses)
+        OpenAIChatCompletionResponseChoice.objects.bulk_create([
+            OpenAIChatCompletionResponseChoice(response=response, content=content)
+            for response, contents in zip(responses, choices)
+            for content in contents
+        ])
+    result.responses = len(responses)
+    if raise_errors and exceptions:
+        raise exceptions[0]
+    return result
+
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from openai_chat.batch import get_responses
+from openai_chat.models import OpenAIChatCompletion
+
+
+class Command(BaseCommand):
+    help = "Get responses for OpenAI chat completions concurrently, see openai_chat/batch.py"
+
+    def add_arguments(self, parser):
+        parser.add_argument("ids", nargs="*", type=int, help="Chat completions to get responses for, all of them by default.")
+        parser.add_argument("--pending", action="store_true", help="Only get responses for chat completions without one.")
+        parser.add_argument("--model", default=None, help="Only get responses for chat completions of this model.")
+        parser.add_argument("--concurrency", type=int, default=None, help="Number of requests in flight at once, OPENAI_MAX_CONCURRENCY by default.")
+
+    def handle(self, *args, **options):
+        queryset = OpenAIChatCompletion.objects.order_by("id")
+        if options["ids"]:
+            queryset = queryset.filter(id__in=options["ids"])
+        if options["pending"]:
+            queryset = queryset.filter(responses__isnull=True)
+        if options["model"]:
+            queryset = queryset.filter(model=options["model"])
+
+        started = time.monotonic()
+        result = get_responses(queryset, options["concurrency"])
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(f"Skipped {result.skipped} chat completions without messages")
+        for error, count in result.errors.most_common():
+            self.stdout.write(self.style.ERROR(f"{count} requests failed with {error}"))
+        self.stdout.write(self.style.SUCCESS(f"Got {result.responses} responses in {elapsed:.1f}s"))
@@ -0,0 +1,71 @@
+# Generated by Django 5.1.15 on 2026-10-18 05:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OpenAIChatCompletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('gpt-4o', 'GPT-4o'), ('gpt-4o-mini', 'GPT-4o Mini')], db_index=True, default='gpt-4o-mini', help_text='ID of the model to use.', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'OpenAI Chat Completion',
+                'verbose_name_plural': 'OpenAI Chat Completions',
+            },
+        ),
+        migrations.CreateModel(
+            name='OpenAIChatCompletionMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('developer', 'Developer'), ('user', 'User')], db_index=True, default='user', help_text='Role of the messages author.', max_length=255)),
+                ('content', models.TextField(help_text='Content of the message.')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('chat_completion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='openai_chat.openaichatcompletion')),
+            ],
+            options={
+                'verbose_name': 'OpenAI Chat Completion Message',
+                'verbose_name_plural': 'OpenAI Chat Completion Messages',
+            },
+        ),
+        migrations.CreateModel(
+            name='OpenAIChatCompletionResponse',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(db_index=True, help_text='The model used for the chat completion.', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('chat_completion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='responses', to='openai_chat.openaichatcompletion')),
+            ],
+            options={
+                'verbose_name': 'OpenAI Chat Completion Response',
+                'verbose_name_plural': 'OpenAI Chat Completion Responses',
+            },
+        ),
+        migrations.CreateModel(
+            name='OpenAIChatCompletionResponseChoice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content', models.TextField(help_text='The contents of the message.')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('response', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='choices', to='openai_chat.openaichatcompletionresponse')),
+            ],
+            options={
+                'verbose_name': 'OpenAI Chat Completion Response Choice',
+                'verbose_name_plural': 'OpenAI Chat Completion Response Choices',
+            },
+        ),
+    ]
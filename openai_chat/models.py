@@ -1,11 +1,8 @@
 import logging
 
-from django.conf import settings
 from django.db import models
 from django.utils.translation import gettext as _
 
-from openai import OpenAI
-
 
 logger = logging.getLogger("astra.openai_chat.models")
 
@@ -30,30 +27,14 @@ class OpenAIChatCompletion(models.Model):
         return self.model
 
     def get_response(self):
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
-
-        messages = []
-        for message in self.messages.all():
-            messages.append({"role": message.role, "content": message.content})
-
-        if not messages:
-            logger.warning("No messages to get response in chat completion %s", self)
-            return
-
-        # https://platform.openai.com/docs/api-reference/chat/create
-        chat_completion = client.chat.completions.create(
-            model=self.model,
-            messages=messages
-        )
-
-        response = self.responses.create(
-            model=chat_completion.model
-        )
-
-        for choice in chat_completion.choices:
-            response.choices.create(
-                content=choice.message.content
-            )
+        """
+        Raises:
+            openai.OpenAIError: If the request failed.
+        """
+        # Many completions are better served by batch.get_responses() directly.
+        from .batch import get_responses # pylint: disable=import-outside-toplevel
+
+        get_responses(OpenAIChatCompletion.objects.filter(pk=self.pk), concurrency=1, raise_errors=True)
 
 CHAT_ROLE_CHOICES = {
     "developer": _("Developer"),
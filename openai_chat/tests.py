@@ -1,3 +1,129 @@
-from django.test import TestCase
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+import json
+import threading
+import time
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from openai import InternalServerError
+
+from .batch import get_responses
+from .models import OpenAIChatCompletion, OpenAIChatCompletionResponse, OpenAIChatCompletionResponseChoice
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    """
+    Answers chat completion requests with the content of their last message,
+    and with an error for the "fail" model.
+    """
+
+    def do_POST(self): # pylint: disable=invalid-name
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        # Long enough for the requests of a batch to overlap.
+        time.sleep(0.05)
+        with server.lock:
+            server.in_flight -= 1
+            server.requests.append(request)
+
+        if request["model"] == "fail":
+            status, body = 500, {"error": {"message": "The server had an error", "type": "server_error"}}
+        else:
+            status, body = 200, {
+                "id": f"chatcmpl-{len(server.requests)}",
+                "object": "chat.completion",
+                "created": 0,
+                "model": f"{request['model']}-2024-07-18",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": f"Re: {request['messages'][-1]['content']}"}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            }
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        pass
+
+
+@override_settings(OPENAI_API_KEY="test-api-key", OPENAI_MAX_RETRIES=0)
+class GetResponsesTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenAIHandler)
+        cls.server.lock = threading.Lock()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.enterClassContext(override_settings(OPENAI_BASE_URL=f"http://127.0.0.1:{cls.server.server_address[1]}/v1"))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.in_flight, self.server.max_in_flight, self.server.requests = 0, 0, []
+        self.completions = []
+        for i in range(6):
+            completion = OpenAIChatCompletion.objects.create()
+            completion.messages.create(role="developer", content="Answer briefly.")
+            completion.messages.create(content=f"Question {i}")
+            self.completions.append(completion)
+
+    def test_get_responses(self):
+        OpenAIChatCompletion.objects.create()
+        with CaptureQueriesContext(connection) as queries:
+            result = get_responses(OpenAIChatCompletion.objects.all(), concurrency=3)
+        self.assertEqual((result.responses, result.skipped, result.failed), (6, 1, 0))
+        self.assertEqual(len([query for query in queries.captured_queries if "openai_chat_openaichatcompletionmessage" in query["sql"]]), 1)
+        self.assertGreater(self.server.max_in_flight, 1)
+        self.assertLessEqual(self.server.max_in_flight, 3)
+        self.assertEqual(self.server.requests[0]["messages"][0], {"role": "developer", "content": "Answer briefly."})
+
+        response = self.completions[2].responses.get()
+        self.assertEqual(response.model, "gpt-4o-mini-2024-07-18")
+        self.assertEqual(list(response.choices.values_list("content", flat=True)), ["Re: Question 2"])
+
+    def test_failed_requests_dont_fail_the_batch(self):
+        OpenAIChatCompletion.objects.filter(id=self.completions[0].id).update(model="fail")
+        result = get_responses(OpenAIChatCompletion.objects.all())
+        self.assertEqual((result.responses, dict(result.errors)), (5, {"InternalServerError": 1}))
+        self.assertFalse(self.completions[0].responses.exists())
+
+    def test_get_response(self):
+        self.completions[0].get_response()
+        self.assertEqual(OpenAIChatCompletionResponseChoice.objects.get().content, "Re: Question 0")
+
+    def test_get_response_raises_errors(self):
+        OpenAIChatCompletion.objects.filter(id=self.completions[0].id).update(model="fail")
+        self.completions[0].refresh_from_db()
+        with self.assertRaises(InternalServerError):
+            self.completions[0].get_response()
+        self.assertFalse(OpenAIChatCompletionResponse.objects.exists())
+
+    def test_admin_action(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        response = self.client.post("/admin/openai_chat/openaichatcompletion/", {
+            "action": "get_response_for_selected",
+            "_selected_action": [completion.id for completion in self.completions[:4]],
+        }, follow=True)
+        self.assertContains(response, "Got 4 responses")
+        self.assertEqual(OpenAIChatCompletionResponse.objects.count(), 4)
+
+    def test_command(self):
+        get_responses(OpenAIChatCompletion.objects.filter(id=self.completions[0].id))
+        stdout = StringIO()
+        call_command("get_chat_completion_responses", "--pending", "--concurrency", "2", stdout=stdout)
+        self.assertIn("Got 5 responses", stdout.getvalue())
+        self.assertEqual(OpenAIChatCompletionResponse.objects.count(), 6)
@@ -1,19 +1,26 @@
 from collections.abc import Callable
 from typing import Any
+import uuid
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.db.models import Q
 from django.db.models.query import QuerySet
 from django.http import HttpRequest
+from django.utils.text import smart_split, unescape_string_literal
 
-from .models import GitHubWebhook, GitHubWebhookEvent
+from .changelist import IndexedValuesFieldListFilter, KeysetChangeList
+from .models import GitHubWebhook, GitHubWebhookDelivery, GitHubWebhookEvent, PayloadCompressionDictionary
 
 
 class GitHubWebhookAdmin(admin.ModelAdmin):
     date_hierarchy = 'created_at'
-    list_display = ['id', 'public_id', 'enabled', 'validate_deliveries', 'disallow_duplicate_deliveries', 'created_at', 'updated_at']
+    list_display = ['id', 'public_id', 'enabled', 'validate_deliveries', 'disallow_duplicate_deliveries', 'rate_limit', 'created_at', 'updated_at']
     list_display_links = ['id', 'public_id']
     list_filter = ['enabled', 'created_at', 'updated_at']
     readonly_fields = ("created_at", "updated_at")
-    search_fields = ["public_id"]
+    # Exact matches on client_id are looked up by its blind index.
+    search_fields = ["public_id", "client_id__exact"]
 
     def get_queryset(self, request: HttpRequest) -> QuerySet:
        return super().get_queryset(request).defer("client_id", "secret_token")
@@ -22,12 +29,75 @@ admin.site.register(GitHubWebhook, GitHubWebhookAdmin)
 
 
 class GitHubWebhookEventAdmin(admin.ModelAdmin):
-    date_hierarchy = 'created_at'
-    list_display = ['id', 'webhook__public_id', 'delivery_uuid', 'event', 'action', 'created_at', 'updated_at']
+    list_display = ['id', 'webhook__public_id', 'delivery_uuid', 'event', 'action', 'repository_full_name', 'sender_login', 'created_at', 'updated_at']
     list_display_links = ['id', 'delivery_uuid']
-    list_filter = ['webhook', 'event', 'action', 'created_at', 'updated_at']
+    # The installation and repository are looked up with the search box, their values are too many to list.
+    list_filter = ['webhook', ('event', IndexedValuesFieldListFilter), ('action', IndexedValuesFieldListFilter), 'created_at', 'updated_at']
     list_select_related = ["webhook"]
-    readonly_fields = ("created_at", "updated_at")
-    search_fields = ["webhook__public_id", "delivery_uuid", "event"]
+    readonly_fields = ("installation_id", "repository_id", "repository_full_name", "sender_login", "created_at", "updated_at")
+    # Searches are exact matches on these columns, see get_search_results().
+    search_fields = ["webhook__public_id", "delivery_uuid", "event", "installation_id", "repository_full_name", "sender_login"]
+    # Tens of millions of events can't be counted, sorted or paged by offset, see webhooks/changelist.py.
+    show_full_result_count = False
+    sortable_by = []
+
+    def get_changelist(self, request: HttpRequest, **kwargs) -> type[ChangeList]:
+        if getattr(settings, "WEBHOOKS_ADMIN_KEYSET_PAGINATION", True):
+            return KeysetChangeList
+        return super().get_changelist(request, **kwargs)
+
+    def get_search_results(self, request: HttpRequest, queryset: QuerySet, search_term: str) -> tuple[QuerySet, bool]:
+        # Each term is compared with exact lookups, answered from the indexes of the columns, and only with the
+        # columns it's a valid value of. The "=" prefix of search_fields compiles to iexact, which no index answers.
+        terms = []
+        for term in smart_split(search_term):
+            if term.startswith(('"', "'")) and term[0] == term[-1]:
+                term = unescape_string_literal(term)
+            lookups = Q(event=term) | Q(repository_full_name=term) | Q(sender_login=term)
+            # A subquery on the unique public_id rather than a join, so that the events are still found by index.
+            lookups |= Q(webhook_id__in=GitHubWebhook.objects.filter(public_id=term).values("id"))
+            try:
+                lookups |= Q(delivery_uuid=uuid.UUID(term))
+            except ValueError:
+                pass
+            if term.isdigit() and int(term) < 2 ** 63:
+                lookups |= Q(installation_id=int(term))
+            terms.append(lookups)
+        return queryset.filter(*terms), False
+
+    def get_queryset(self, request: HttpRequest) -> QuerySet:
+        # The payload is only loaded when an event is opened.
+        return super().get_queryset(request).defer("payload", "payload_compressed", "webhook__client_id", "webhook__secret_token")
 
 admin.site.register(GitHubWebhookEvent, GitHubWebhookEventAdmin)
+
+
+class GitHubWebhookDeliveryAdmin(admin.ModelAdmin):
+    list_display = ['id', 'webhook__public_id', 'status', 'attempts', 'claimed_at', 'created_at', 'updated_at']
+    list_filter = ['status']
+    list_select_related = ["webhook"]
+    readonly_fields = ("created_at", "updated_at")
+
+    def get_queryset(self, request: HttpRequest) -> QuerySet:
+       return super().get_queryset(request).defer("body", "webhook__client_id", "webhook__secret_token")
+
+admin.site.register(GitHubWebhookDelivery, GitHubWebhookDeliveryAdmin)
+
+
+class PayloadCompressionDictionaryAdmin(admin.ModelAdmin):
+    list_display = ['id', 'algorithm', 'sample_size', 'created_at']
+    list_filter = ['algorithm']
+    readonly_fields = ("created_at",)
+
+    def get_queryset(self, request: HttpRequest) -> QuerySet:
+       return super().get_queryset(request).defer("data")
+
+    def has_change_permission(self, request: HttpRequest, obj=None) -> bool:
+        # Stored payloads reference dictionaries by id, changing one would corrupt them.
+        return False
+
+    def has_delete_permission(self, request: HttpRequest, obj=None) -> bool:
+        # Deleting one would leave the payloads compressed with it unreadable.
+        return False
+
+admin.site.register(PayloadCompressionDictionary, PayloadCompressionDictionaryAdmin)
@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
+from django.utils.module_loading import autodiscover_modules
 
 
 class WebhooksConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "webhooks"
+
+    def ready(self):
+        from .cache import invalidate_webhook_config_cache
+        from .models import GitHubWebhook
+
+        post_save.connect(invalidate_webhook_config_cache, sender=GitHubWebhook, dispatch_uid="webhooks.invalidate_webhook_config_cache")
+        post_delete.connect(invalidate_webhook_config_cache, sender=GitHubWebhook, dispatch_uid="webhooks.invalidate_webhook_config_cache")
+
+        # Build the handler registry from the webhook_handlers module of every installed app.
+        autodiscover_modules("webhook_handlers")
@@ -0,0 +1,92 @@
+import gzip
+import os
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO
+
+from django.utils import timezone
+
+from . import deduplication
+from .codecs import get_codec
+
+
+# Events are archived and exported as JSON Lines, one event per line with its
+# payload reassembled, see webhooks.deduplication.
+
+EVENT_FIELDS = ["id", "webhook__public_id", "delivery_uuid", "event", "action", "is_redelivery", "created_at", "updated_at", "payload", "payload_compressed"]
+
+
+def serialize_events(rows: list[dict]) -> list[bytes]:
+    """
+    Encodes events read with .values(*EVENT_FIELDS) as JSON lines.
+    """
+    codec = get_codec()
+    payloads = deduplication.reassemble_many([
+        row["payload"] if row["payload"] is not None else row["payload_compressed"] for row in rows
+    ])
+    return [codec.dumps(serialize_event(row, payload)) + b"\n" for row, payload in zip(rows, payloads)]
+
+
+def serialize_event(row: dict, payload) -> dict:
+    return {
+        "id": row["id"],
+        "webhook": row["webhook__public_id"],
+        "delivery_uuid": row["delivery_uuid"],
+        "event": row["event"],
+        "action": row["action"],
+        "is_redelivery": row["is_redelivery"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+        "payload": payload,
+    }
+
+
+class DailyArchive:
+    """
+    Appends events to gzip compressed JSONL files, one per day of creation in TIME_ZONE:
+
+        <directory>/<prefix>-YYYY-MM-DD.jsonl.gz
+
+    Each write appends a gzip member, which gzip readers concatenate.
+    """
+
+    def __init__(self, directory: str | Path, prefix: str = "github_webhook_events"):
+        self.directory = Path(directory)
+        self.prefix = prefix
+
+    def path(self, day) -> Path:
+        return self.directory / f"{self.prefix}-{day.isoformat()}.jsonl.gz"
+
+    def write(self, rows: list[dict]):
+        lines_by_day = defaultdict(list)
+        for row, line in zip(rows, serialize_events(rows)):
+            lines_by_day[timezone.localdate(row["created_at"])].append(line)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for day, lines in lines_by_day.items():
+            write_lines(self.path(day), lines, append=True)
+
+
+@contextmanager
+def open_jsonl(f: BinaryIO, compress: bool, mode: str = "wb") -> Iterator[BinaryIO]:
+    """
+    Wraps a binary file for writing JSON lines, compressed with gzip if compress is set.
+    """
+    if not compress:
+        yield f
+        return
+    with gzip.GzipFile(fileobj=f, mode=mode) as g:
+        yield g
+
+
+def write_lines(path: Path, lines: Iterable[bytes], append: bool = False):
+    """
+    Writes lines to a file, compressed with gzip if its name ends with .gz, and syncs it to disk.
+    """
+    mode = "ab" if append else "wb"
+    with open(path, mode) as f:
+        with open_jsonl(f, path.suffix == ".gz", mode) as output:
+            output.writelines(lines)
+        f.flush()
+        os.fsync(f.fileno())
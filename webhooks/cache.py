@@ -0,0 +1,175 @@
+import logging
+import threading
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.cache import caches
+
+from config.lru import LRUCache
+
+from .models import GitHubWebhook
+
+logger = logging.getLogger("astra.webhooks.cache")
+
+
+# Every delivery needs the configuration of the webhook it was sent to. Looking
+# it up costs a query and a Fernet decrypt of each encrypted column, so the
+# configuration is cached per process, keyed by public_id.
+#
+# Entries are dropped when any GitHubWebhook is saved or deleted (see
+# WebhooksConfig.ready), and expire after WEBHOOKS_CONFIG_CACHE_TTL seconds.
+# Deployments with several workers can set WEBHOOKS_CONFIG_CACHE_VERSION_ALIAS
+# to a shared cache alias; invalidations then bump a version stamp in that cache
+# and every worker drops its entries when it sees the stamp change.
+
+
+@dataclass(frozen=True)
+class WebhookConfig:
+    """
+    The subset of a GitHubWebhook needed to handle a delivery.
+    """
+    id: int
+    public_id: str
+    # Left out of repr(), so that it doesn't end up in logs, tracebacks or debug pages.
+    secret_token: str = field(repr=False)
+    validate_deliveries: bool
+    disallow_duplicate_deliveries: bool
+    rate_limit: int | None
+    rate_limit_burst: int | None
+
+    def __str__(self):
+        return self.public_id
+
+    @classmethod
+    def from_webhook(cls, webhook: GitHubWebhook) -> "WebhookConfig":
+        return cls(
+            id=webhook.id,
+            public_id=webhook.public_id,
+            secret_token=webhook.secret_token,
+            validate_deliveries=webhook.validate_deliveries,
+            disallow_duplicate_deliveries=webhook.disallow_duplicate_deliveries,
+            rate_limit=webhook.rate_limit,
+            rate_limit_burst=webhook.rate_limit_burst,
+        )
+
+
+CONFIG_FIELDS = ["id", "public_id", "secret_token", "validate_deliveries", "disallow_duplicate_deliveries", "rate_limit", "rate_limit_burst"]
+
+VERSION_KEY = "astra.webhooks.config_cache.version"
+
+# Told apart from the None cached for unknown and disabled webhooks.
+MISSING = object()
+
+
+class WebhookConfigCache:
+    """
+    A bounded, TTL-based LRU cache of WebhookConfig keyed by public_id.
+
+    Unknown and disabled webhooks are cached as None, so repeated deliveries to
+    them don't reach the database either.
+    """
+
+    def __init__(self, max_size: int, ttl: float, version_alias: str | None = None):
+        self.version_alias = version_alias
+        self._entries = LRUCache(max_size, ttl)
+        self._version = None
+        self._generation = 0
+        # Held while reading or writing the entries together with the generation.
+        self._lock = threading.Lock()
+
+    @property
+    def hits(self) -> int:
+        # Lookups answered from the cache, reported by webhooks.metrics.
+        return self._entries.hits
+
+    @property
+    def misses(self) -> int:
+        return self._entries.misses
+
+    def get(self, public_id: str) -> WebhookConfig | None:
+        if self.version_alias:
+            self._check_version(caches[self.version_alias].get(VERSION_KEY))
+        hit, config, generation = self._get(public_id)
+        if hit:
+            return config
+        webhook = GitHubWebhook.objects.filter(public_id=public_id, enabled=True).only(*CONFIG_FIELDS).first()
+        return self._set(public_id, webhook, generation)
+
+    async def aget(self, public_id: str) -> WebhookConfig | None:
+        if self.version_alias:
+            self._check_version(await caches[self.version_alias].aget(VERSION_KEY))
+        hit, config, generation = self._get(public_id)
+        if hit:
+            return config
+        webhook = await GitHubWebhook.objects.filter(public_id=public_id, enabled=True).only(*CONFIG_FIELDS).afirst()
+        return self._set(public_id, webhook, generation)
+
+    def invalidate(self):
+        self.clear()
+        if self.version_alias:
+            cache = caches[self.version_alias]
+            # add() is a no-op if the stamp exists, incr() then makes the change visible to other workers.
+            cache.add(VERSION_KEY, 0, timeout=None)
+            cache.incr(VERSION_KEY)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def _check_version(self, version):
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    logger.debug("Webhook configuration version changed from %s to %s", self._version, version)
+                    self._entries.clear()
+                    self._generation += 1
+                    self._version = version
+
+    def _get(self, public_id: str) -> tuple[bool, WebhookConfig | None, int]:
+        with self._lock:
+            config = self._entries.get(public_id, MISSING)
+            if config is MISSING:
+                return False, None, self._generation
+            return True, config, self._generation
+
+    def _set(self, public_id: str, webhook: GitHubWebhook | None, generation: int) -> WebhookConfig | None:
+        config = WebhookConfig.from_webhook(webhook) if webhook else None
+        with self._lock:
+            if generation != self._generation:
+                # The cache was invalidated while the webhook was being fetched, so it may be stale.
+                return config
+            self._entries.set(public_id, config)
+        return config
+
+
+webhook_config_cache = WebhookConfigCache(
+    max_size=getattr(settings, "WEBHOOKS_CONFIG_CACHE_MAX_SIZE", 1024),
+    ttl=getattr(settings, "WEBHOOKS_CONFIG_CACHE_TTL", 60),
+    version_alias=getattr(settings, "WEBHOOKS_CONFIG_CACHE_VERSION_ALIAS", None),
+)
+
+
+def invalidate_webhook_config_cache(sender, **kwargs):
+    webhook_config_cache.invalidate()
+
+
+class RecentDeliveries(LRUCache):
+    """
+    A bounded LRU set of the deliveries recently stored by this process.
+
+    GitHub retries quickly when a delivery times out, so most duplicates arrive
+    shortly after the original and can be rejected without touching the
+    database. An exact set is used rather than a Bloom filter because a false
+    positive would reject a delivery that was never stored. A miss proves
+    nothing, the unique_github_webhook_event_delivery constraint remains the
+    source of truth.
+    """
+
+    def add(self, key: tuple[int, str]):
+        self.set(key)
+
+
+recent_deliveries = RecentDeliveries(
+    max_size=getattr(settings, "WEBHOOKS_RECENT_DELIVERIES_MAX_SIZE", 10000),
+)
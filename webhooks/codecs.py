@@ -0,0 +1,71 @@
+import json
+import logging
+from functools import cache
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger("astra.webhooks.codecs")
+
+
+# The JSON codec used on the webhook hot path: parsing deliveries, storing
+# GitHubWebhookEvent.payload and encoding responses. WEBHOOKS_JSON_CODEC selects
+# it, "auto" (the default) uses orjson when it's installed and the standard
+# library otherwise.
+
+
+class JSONCodec:
+    name = "json"
+
+    def loads(self, data: bytes | str):
+        """
+        Raises:
+            ValueError: If data isn't valid UTF-8 encoded JSON.
+        """
+        return json.loads(data)
+
+    def dumps(self, value) -> bytes:
+        return json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class OrjsonCodec(JSONCodec):
+    name = "orjson"
+
+    def loads(self, data: bytes | str):
+        return orjson.loads(data)
+
+    def dumps(self, value) -> bytes:
+        return orjson.dumps(value, default=DjangoJSONEncoder().default)
+
+
+def get_codec() -> JSONCodec:
+    return _get_codec(getattr(settings, "WEBHOOKS_JSON_CODEC", "auto"))
+
+
+@cache
+def _get_codec(name: str) -> JSONCodec:
+    if name == "auto":
+        name = "orjson" if orjson is not None else "json"
+    if name == "orjson":
+        if orjson is None:
+            raise ValueError("WEBHOOKS_JSON_CODEC is \"orjson\" but orjson is not installed")
+        return OrjsonCodec()
+    if name == "json":
+        return JSONCodec()
+    raise ValueError(f"Unknown JSON codec {name}")
+
+
+class JsonResponse(HttpResponse):
+    """
+    A drop-in for django.http.JsonResponse that encodes data with the configured codec.
+    """
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content=get_codec().dumps(data), **kwargs)
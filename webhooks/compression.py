@@ -0,0 +1,164 @@
+import struct
+import threading
+import zlib
+from collections import Counter
+from collections.abc import Iterable
+
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Compression of stored payloads, see CompressedJSONField.
+#
+# GitHubWebhookEvent.payload is a JSON column. With WEBHOOKS_PAYLOAD_COMPRESSION
+# set, payloads are stored compressed in payload_compressed instead and the JSON
+# column is left NULL, see PayloadJSONField. Rows stored before the setting
+# changed stay where they are and are read from either column, until
+# compress_webhook_event_payloads moves them.
+#
+# Encoded values start with a 5 byte header: the algorithm, then the id of the
+# PayloadCompressionDictionary used (0 for none) as a big-endian unsigned int.
+# The header makes every value self-describing, so changing the algorithm or
+# the dictionary never breaks existing rows.
+#
+# GitHub payloads repeat the same structure (repository, sender and
+# installation blocks, URL templates) in every delivery, which a shared
+# dictionary trained from existing events with train_payload_dictionary lets
+# the compressor reference instead of storing once per row.
+
+NONE = 0
+ZLIB = 1
+ZSTD = 2
+
+ALGORITHMS = {"none": NONE, "zlib": ZLIB, "zstd": ZSTD}
+
+HEADER = struct.Struct(">BI")
+
+# zlib can only reference the last 32 KiB of its dictionary.
+ZLIB_MAX_DICTIONARY_SIZE = 32 * 1024
+
+
+def get_algorithm(name: str | None) -> int:
+    name = name or "none"
+    if name not in ALGORITHMS:
+        raise ValueError(f"Unknown payload compression {name}")
+    if name == "zstd" and zstandard is None:
+        raise ValueError("Payload compression is \"zstd\" but zstandard is not installed")
+    return ALGORITHMS[name]
+
+
+class DictionaryCache:
+    """
+    Trained dictionaries by id. Dictionaries are immutable, so they're loaded once per process.
+    """
+
+    def __init__(self):
+        self._dictionaries: dict[int, bytes] = {}
+        self._lock = threading.Lock()
+
+    def get(self, dictionary_id: int) -> bytes:
+        dictionary = self._dictionaries.get(dictionary_id)
+        if dictionary is None:
+            from .models import PayloadCompressionDictionary # pylint: disable=import-outside-toplevel
+            dictionary = bytes(PayloadCompressionDictionary.objects.values_list("data", flat=True).get(id=dictionary_id))
+            with self._lock:
+                self._dictionaries[dictionary_id] = dictionary
+        return dictionary
+
+    def clear(self):
+        with self._lock:
+            self._dictionaries.clear()
+
+
+dictionaries = DictionaryCache()
+
+
+def compress(data: bytes, algorithm: int, dictionary_id: int = 0, level: int | None = None) -> bytes:
+    dictionary = dictionaries.get(dictionary_id) if dictionary_id else None
+    if algorithm == NONE:
+        dictionary_id, compressed = 0, data
+    elif algorithm == ZLIB:
+        level = level if level is not None else zlib.Z_DEFAULT_COMPRESSION
+        compressor = zlib.compressobj(level, zdict=dictionary) if dictionary else zlib.compressobj(level)
+        compressed = compressor.compress(data) + compressor.flush()
+    elif algorithm == ZSTD:
+        dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        compressed = zstandard.ZstdCompressor(level=level if level is not None else 3, dict_data=dict_data).compress(data)
+    else:
+        raise ValueError(f"Unknown payload compression {algorithm}")
+    return HEADER.pack(algorithm, dictionary_id) + compressed
+
+
+def decompress(value: bytes) -> bytes:
+    algorithm, dictionary_id = HEADER.unpack_from(value)
+    data = value[HEADER.size:]
+    dictionary = dictionaries.get(dictionary_id) if dictionary_id else None
+    if algorithm == NONE:
+        return bytes(data)
+    if algorithm == ZLIB:
+        decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+        return decompressor.decompress(data) + decompressor.flush()
+    if algorithm == ZSTD:
+        if zstandard is None:
+            raise ValueError("Payload is compressed with zstd but zstandard is not installed")
+        dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        return zstandard.ZstdDecompressor(dict_data=dict_data).decompress(data)
+    raise ValueError(f"Unknown payload compression {algorithm}")
+
+
+def get_header(value: bytes) -> tuple[int, int]:
+    """
+    Returns:
+        tuple[int, int]: The algorithm and dictionary id of an encoded value.
+    """
+    return HEADER.unpack_from(value)
+
+
+def get_settings() -> tuple[int, int, int | None]:
+    """
+    Returns:
+        tuple[int, int, int | None]: The configured algorithm, dictionary id and level.
+    """
+    algorithm = get_algorithm(getattr(settings, "WEBHOOKS_PAYLOAD_COMPRESSION", None))
+    dictionary_id = getattr(settings, "WEBHOOKS_PAYLOAD_COMPRESSION_DICTIONARY", None) or 0
+    level = getattr(settings, "WEBHOOKS_PAYLOAD_COMPRESSION_LEVEL", None)
+    return algorithm, dictionary_id if algorithm != NONE else 0, level
+
+
+def is_enabled() -> bool:
+    """
+    Returns:
+        bool: Whether WEBHOOKS_PAYLOAD_COMPRESSION compresses stored payloads.
+    """
+    return get_settings()[0] != NONE
+
+
+def train_dictionary(samples: Iterable[bytes], algorithm: int, size: int) -> bytes:
+    """
+    Trains a compression dictionary from sample encoded payloads.
+
+    zstd has its own trainer. For zlib, which only supports a preset dictionary,
+    the dictionary is made of the fragments of the samples (split after each
+    comma) that occur in the most samples, ordered so that the most common ones
+    are at the end where zlib references them most cheaply.
+    """
+    samples = list(samples)
+    if algorithm == ZSTD:
+        return zstandard.train_dictionary(size, samples).as_bytes()
+    if algorithm != ZLIB:
+        raise ValueError("Dictionaries can only be trained for zlib and zstd")
+
+    size = min(size, ZLIB_MAX_DICTIONARY_SIZE)
+    counts = Counter()
+    for sample in samples:
+        counts.update({fragment for fragment in sample.split(b",") if len(fragment) > 3})
+    dictionary = b""
+    for fragment, count in counts.most_common():
+        if count < 2 or len(dictionary) + len(fragment) + 1 > size:
+            continue
+        dictionary = fragment + b"," + dictionary
+    return dictionary
@@ -0,0 +1,150 @@
+import hashlib
+
+from django.conf import settings
+from django.db import transaction
+
+from config.lru import LRUCache
+
+from .codecs import get_codec
+
+
+# Almost every GitHub payload embeds the full repository, organization, sender
+# and installation objects, which are identical across the deliveries of a
+# repository. When WEBHOOKS_PAYLOAD_DEDUPLICATED_KEYS is set, each of those
+# top-level keys is replaced by a reference to a PayloadObject holding the
+# encoded object, keyed by the SHA-256 digest of its encoding, so each distinct
+# version is stored once:
+#
+#   {"repository": {"$payload_object": "9f86d0..."}, ...}
+#
+# Payloads are deduplicated where events are written: by
+# GitHubWebhookEventManager.create_delivery(), the batch writer and the
+# compress_webhook_event_payloads command. Events saved otherwise store their
+# payload as it is.
+#
+# GitHubWebhookEvent querysets reassemble the payloads of each chunk of rows
+# they fetch, with one query for the objects missing from the cache. Instances
+# loaded otherwise, e.g. by refresh_from_db(), reassemble their payload the
+# first time it's read. PayloadObjects are immutable, so their encodings are
+# cached per process and decoded for each payload, which never share objects.
+# Digests are only remembered as stored once the transaction that inserted them
+# commits.
+
+REFERENCE_KEY = "$payload_object"
+
+# Objects smaller than this aren't worth a reference.
+MIN_SIZE = 128
+
+
+objects = LRUCache(getattr(settings, "WEBHOOKS_PAYLOAD_OBJECT_CACHE_MAX_SIZE", 1024))
+stored = LRUCache(getattr(settings, "WEBHOOKS_PAYLOAD_OBJECT_CACHE_MAX_SIZE", 1024))
+
+
+def get_keys() -> list[str]:
+    return getattr(settings, "WEBHOOKS_PAYLOAD_DEDUPLICATED_KEYS", [])
+
+
+def is_reference(value) -> bool:
+    return isinstance(value, dict) and len(value) == 1 and REFERENCE_KEY in value
+
+
+def has_references(payload) -> bool:
+    return isinstance(payload, dict) and any(is_reference(value) for value in payload.values())
+
+
+def deduplicate(payload, using: str | None = None):
+    """
+    Replaces the deduplicated keys of a payload with references, storing the
+    objects that aren't stored yet.
+
+    Returns:
+        The payload to store.
+    """
+    return deduplicate_many([payload], using=using)[0]
+
+
+def deduplicate_many(payloads: list, using: str | None = None) -> list:
+    """
+    Deduplicates several payloads, storing the objects that aren't stored yet in a single query.
+    """
+    keys = get_keys()
+    if not keys:
+        return list(payloads)
+    from .models import PayloadObject # pylint: disable=import-outside-toplevel
+
+    codec = get_codec()
+    results, new_objects = [], {}
+    for payload in payloads:
+        deduplicated = payload
+        for key in keys if isinstance(payload, dict) else []:
+            value = payload.get(key)
+            if not isinstance(value, dict) or is_reference(value):
+                continue
+            data = codec.dumps(value)
+            if len(data) < MIN_SIZE:
+                continue
+            digest = hashlib.sha256(data).hexdigest()
+            if deduplicated is payload:
+                deduplicated = dict(payload)
+            deduplicated[key] = {REFERENCE_KEY: digest}
+            objects.set(digest, data)
+            if digest not in stored and digest not in new_objects:
+                new_objects[digest] = PayloadObject(digest=digest, key=key, data=value)
+        results.append(deduplicated)
+
+    if new_objects:
+        PayloadObject.objects.using(using).bulk_create(list(new_objects.values()), ignore_conflicts=True)
+        digests = list(new_objects)
+        transaction.on_commit(lambda: [stored.set(digest) for digest in digests], using=using)
+    return results
+
+
+def reassemble(payload, using: str | None = None):
+    """
+    Returns:
+        The payload with its references replaced by the objects they reference.
+    """
+    return reassemble_many([payload], using=using)[0]
+
+
+def reassemble_many(payloads: list, using: str | None = None) -> list:
+    """
+    Reassembles several payloads, fetching the objects missing from the cache in a single query.
+    """
+    missing = {
+        value[REFERENCE_KEY]
+        for payload in payloads if isinstance(payload, dict)
+        for value in payload.values() if is_reference(value) and objects.get(value[REFERENCE_KEY]) is None
+    }
+    found = {}
+    if missing:
+        from .models import PayloadObject # pylint: disable=import-outside-toplevel
+        codec = get_codec()
+        for digest, value in PayloadObject.objects.using(using).filter(digest__in=missing).values_list("digest", "data"):
+            found[digest] = codec.dumps(value)
+            objects.set(digest, found[digest])
+
+    def resolve(value):
+        if not is_reference(value):
+            return value
+        digest = value[REFERENCE_KEY]
+        data = found.get(digest) or objects.get(digest)
+        if data is None:
+            raise LookupError(f"Payload object {digest} does not exist")
+        return get_codec().loads(data)
+
+    return [
+        {key: resolve(value) for key, value in payload.items()} if has_references(payload) else payload
+        for payload in payloads
+    ]
+
+
+def reassemble_instances(instances: list, attname: str, using: str | None = None):
+    """
+    Reassembles the loaded payloads of model instances in place, with reassemble_many().
+    """
+    loaded = [instance for instance in instances if has_references(instance.__dict__.get(attname))]
+    if loaded:
+        payloads = reassemble_many([instance.__dict__[attname] for instance in loaded], using=using)
+        for instance, payload in zip(loaded, payloads):
+            instance.__dict__[attname] = payload
@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+from django.conf import settings
+
+logger = logging.getLogger("astra.webhooks.dispatch")
+
+
+# Deliveries are routed to handlers registered for their (event, action). Apps
+# register handlers in a webhook_handlers module, which WebhooksConfig.ready
+# imports for every installed app, the same way the admin discovers admin
+# modules:
+#
+#     from webhooks.dispatch import registry
+#
+#     @registry.register("installation", "created")
+#     def installation_created(webhook, event, action, delivery, payload):
+#         ...
+#
+# A handler registered for the "*" action handles every action of its event
+# that has no handler of its own. Handlers may raise ingest.DeliveryError to
+# reject a delivery.
+#
+# Handlers are synchronous functions and may use the ORM. The async view runs
+# them with sync_to_async, in the thread where the ORM calls of the request run,
+# so a slow handler holds up that thread but not the event loop.
+
+WILDCARD = "*"
+
+
+@dataclass
+class Handler:
+    """
+    A registered handler and its timing and error counters.
+    """
+    event: str
+    action: str
+    func: Callable
+    calls: int = 0
+    errors: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def name(self) -> str:
+        return f"{self.func.__module__}.{self.func.__qualname__}"
+
+    def __call__(self, webhook, event: str, action: str, delivery: dict, payload: dict):
+        started = time.perf_counter()
+        failed = False
+        try:
+            return self.func(webhook, event, action, delivery, payload)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.calls += 1
+                self.errors += failed
+                self.total_time += elapsed
+                self.max_time = max(self.max_time, elapsed)
+            if elapsed > getattr(settings, "WEBHOOKS_SLOW_HANDLER_THRESHOLD", 1.0):
+                logger.warning("Slow handler %s took %.3fs for %s %s", self.name, elapsed, event, action)
+
+
+class HandlerRegistry:
+    """
+    Maps (event, action) to the handler of a delivery in a single dictionary lookup.
+    """
+
+    def __init__(self):
+        self._handlers: dict[tuple[str, str], Handler] = {}
+        self._events: set[str] = set()
+
+    def register(self, event: str, action: str = WILDCARD) -> Callable[[Callable], Callable]:
+        def decorator(func: Callable) -> Callable:
+            key = (event, action)
+            if key in self._handlers:
+                raise ValueError(f"A handler is already registered for {event} {action}: {self._handlers[key].name}")
+            self._handlers[key] = Handler(event, action, func)
+            self._events.add(event)
+            return func
+        return decorator
+
+    def unregister(self, event: str, action: str = WILDCARD):
+        del self._handlers[(event, action)]
+        self._events = {event for event, _ in self._handlers}
+
+    def get(self, event: str, action: str) -> Handler | None:
+        return self._handlers.get((event, action)) or self._handlers.get((event, WILDCARD))
+
+    def handles_event(self, event: str) -> bool:
+        return event in self._events
+
+    def handlers(self) -> list[Handler]:
+        return sorted(self._handlers.values(), key=lambda handler: (handler.event, handler.action))
+
+
+registry = HandlerRegistry()
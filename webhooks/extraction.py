@@ -0,0 +1,78 @@
+from django.conf import settings
+
+
+# Fields of a payload that are copied into their own indexed columns of
+# GitHubWebhookEvent when it's stored, so that questions like "events for
+# installation X" or "repository Y in the last hour" are answered from an
+# index instead of decoding every payload. Each column has a composite index
+# with created_at, see GitHubWebhookEvent.Meta.indexes.
+#
+# WEBHOOKS_EXTRACTED_FIELDS maps each column to the dotted path of the value in
+# the payload. Removing a column from the setting stops populating it, events
+# stored before a column was populated are filled in by the
+# backfill_webhook_event_fields command.
+
+EXTRACTED_COLUMNS = ["installation_id", "repository_id", "repository_full_name", "sender_login"]
+
+DEFAULT_EXTRACTED_FIELDS = {
+    "installation_id": "installation.id",
+    "repository_id": "repository.id",
+    "repository_full_name": "repository.full_name",
+    "sender_login": "sender.login",
+}
+
+
+def get_extracted_fields() -> dict[str, list[str]]:
+    """
+    Returns:
+        dict[str, list[str]]: The payload path of each extracted column.
+
+    Raises:
+        ValueError: If WEBHOOKS_EXTRACTED_FIELDS names a column that doesn't exist.
+    """
+    fields = getattr(settings, "WEBHOOKS_EXTRACTED_FIELDS", DEFAULT_EXTRACTED_FIELDS)
+    unknown = set(fields) - set(EXTRACTED_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown extracted fields {', '.join(sorted(unknown))}, expected some of {', '.join(EXTRACTED_COLUMNS)}")
+    return {column: path.split(".") for column, path in fields.items()}
+
+
+def _get_path(payload: dict, path: list[str]):
+    value = payload
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def empty_value(column: str):
+    """
+    Returns:
+        The value of an extracted column when the payload doesn't have it.
+    """
+    from .models import GitHubWebhookEvent # pylint: disable=import-outside-toplevel
+
+    return "" if GitHubWebhookEvent._meta.get_field(column).get_internal_type() == "CharField" else None
+
+
+def extract(payload) -> dict:
+    """
+    Returns:
+        dict: The values of the extracted columns for a payload. Values of the
+        wrong type are left out rather than failing the delivery.
+    """
+    from .models import GitHubWebhookEvent # pylint: disable=import-outside-toplevel
+
+    if not isinstance(payload, dict):
+        return {}
+    values = {}
+    for column, path in get_extracted_fields().items():
+        value = _get_path(payload, path)
+        field = GitHubWebhookEvent._meta.get_field(column)
+        if field.get_internal_type() == "CharField":
+            if isinstance(value, str):
+                values[column] = value[:field.max_length]
+        elif isinstance(value, int) and not isinstance(value, bool):
+            values[column] = value
+    return values
@@ -0,0 +1,193 @@
+from django import forms
+from django.db import models
+from django.db.models import JSONField
+from django.db.models.fields.json import KeyTransform
+from django.db.models.query_utils import DeferredAttribute
+from django.utils.translation import gettext as _
+
+from . import compression, deduplication
+from .codecs import get_codec
+
+
+class CodecJSONField(JSONField):
+    """
+    A JSONField that encodes and decodes values with the configured JSON codec.
+
+    On PostgreSQL values are still adapted by the database driver, as jsonb
+    parameters can't be passed as plain text.
+    """
+    description = _("A JSON object encoded with the configured codec")
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or self.decoder is not None:
+            return super().from_db_value(value, expression, connection)
+        # Some backends (SQLite at least) extract non-string values in their SQL datatypes.
+        if isinstance(expression, KeyTransform) and not isinstance(value, str):
+            return value
+        try:
+            return get_codec().loads(value)
+        except ValueError:
+            return value
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        if hasattr(value, "as_sql") or self.encoder is not None or connection.vendor == "postgresql":
+            return super().get_db_prep_value(value, connection, prepared=True)
+        return get_codec().dumps(value).decode("utf-8")
+
+
+class CompressedJSONField(models.Field):
+    """
+    A JSON value stored as compressed bytes, see webhooks.compression.
+
+    Values are compressed with WEBHOOKS_PAYLOAD_COMPRESSION on save and
+    decompressed transparently when loaded. Values are opaque to the database,
+    so JSON lookups aren't supported.
+
+    Args:
+        source (str | None): The name of a PayloadJSONField of the same model
+            whose values this field stores when compression is enabled.
+    """
+    description = _("A JSON object stored compressed")
+    empty_values = [None]
+
+    def __init__(self, *args, source: str | None = None, **kwargs):
+        self.source = source
+        if source is not None:
+            kwargs.setdefault("null", True)
+            kwargs.setdefault("blank", True)
+            kwargs.setdefault("editable", False)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.source is not None:
+            kwargs["source"] = self.source
+        return name, path, args, kwargs
+
+    def get_internal_type(self):
+        return "BinaryField"
+
+    def pre_save(self, model_instance, add):
+        if self.source is None:
+            return super().pre_save(model_instance, add)
+        return get_stored_value(model_instance, model_instance._meta.get_field(self.source)) if compression.is_enabled() else None
+
+    def get_prep_value(self, value):
+        if value is None or hasattr(value, "as_sql"):
+            return value
+        return self.encode(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        if isinstance(value, bytes):
+            return connection.Database.Binary(value)
+        return value
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return self.decode(value)
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            return self.decode(value)
+        return value
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{"form_class": forms.JSONField, **kwargs})
+
+    @staticmethod
+    def encode(value) -> bytes:
+        algorithm, dictionary_id, level = compression.get_settings()
+        return compression.compress(get_codec().dumps(value), algorithm, dictionary_id, level)
+
+    @staticmethod
+    def decode(value):
+        return get_codec().loads(compression.decompress(bytes(value)))
+
+    @staticmethod
+    def is_current(value) -> bool:
+        """
+        Returns:
+            bool: Whether a raw column value is encoded with the current compression settings.
+        """
+        algorithm, dictionary_id, _level = compression.get_settings()
+        return compression.get_header(bytes(value)) == (algorithm, dictionary_id)
+
+
+def get_compressed_field(field: "PayloadJSONField") -> CompressedJSONField | None:
+    for other in field.model._meta.concrete_fields:
+        if isinstance(other, CompressedJSONField) and other.source == field.name:
+            return other
+    return None
+
+
+def get_stored_value(instance, field: "PayloadJSONField"):
+    """
+    Returns:
+        The value of a PayloadJSONField to store, from whichever column it was
+        loaded from, without reassembling it.
+    """
+    value = instance.__dict__.get(field.attname)
+    compressed_field = get_compressed_field(field)
+    if value is None and compressed_field is not None:
+        value = instance.__dict__.get(compressed_field.attname)
+    return value
+
+
+class PayloadAttribute(DeferredAttribute):
+    """
+    Reads a payload from whichever column holds it, and reassembles it the
+    first time it's read from an instance.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        attname, compressed_field = self.field.attname, get_compressed_field(self.field)
+        if compressed_field is not None and attname not in instance.__dict__ and compressed_field.attname not in instance.__dict__:
+            # Deferred, load both columns at once.
+            instance.refresh_from_db(fields=[attname, compressed_field.attname])
+        value = super().__get__(instance, cls)
+        if value is None and compressed_field is not None:
+            value = getattr(instance, compressed_field.attname)
+        if deduplication.has_references(value):
+            value = deduplication.reassemble(value, using=instance._state.db)
+        if value is not None:
+            instance.__dict__[attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        # Defining __set__ makes this a data descriptor, so __get__ is called even once the value is loaded.
+        instance.__dict__[self.field.attname] = value
+
+
+class PayloadJSONField(CodecJSONField):
+    """
+    A CodecJSONField holding a payload, see webhooks.compression and
+    webhooks.deduplication.
+
+    If the model has a CompressedJSONField of the field, payloads are stored
+    there instead while WEBHOOKS_PAYLOAD_COMPRESSION is set, and this column is
+    NULL. JSON lookups only match the rows stored in this column.
+
+    Values read through the model attribute come from either column and are
+    complete. Values read with values() or values_list() come from one column
+    and may still hold references, use deduplication.reassemble_many() on them.
+    """
+    description = _("A JSON object, optionally stored compressed, with its repeated sub-objects deduplicated")
+    descriptor_class = PayloadAttribute
+
+    def pre_save(self, model_instance, add):
+        # Reading the attribute would reassemble a deduplicated payload before it's stored.
+        if self.attname not in model_instance.__dict__:
+            return super().pre_save(model_instance, add)
+        if get_compressed_field(self) is not None and compression.is_enabled():
+            return None
+        return get_stored_value(model_instance, self)
@@ -0,0 +1,340 @@
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+import hashlib
+import hmac
+import logging
+from urllib.parse import parse_qs
+import uuid
+
+from django.conf import settings
+from django.utils.datastructures import CaseInsensitiveMapping
+from django.utils.http import parse_header_parameters
+
+from .cache import WebhookConfig, recent_deliveries
+from .codecs import JsonResponse, get_codec
+from .dispatch import registry
+from .metrics import NULL_TIMINGS, NullTimings, Timings
+
+logger = logging.getLogger("astra.webhooks.ingest")
+
+
+# The ingest pipeline is shared by the sync (WSGI) and async (ASGI) views.
+# Everything in this module is free of database access so that each view can
+# perform the lookups and inserts with the ORM flavour that suits it: a view
+# looks the webhook up, passes the request through read_request() and
+# parse_request(), stores the delivery and returns accept().
+#
+# https://docs.github.com/en/webhooks/using-webhooks/handling-webhook-deliveries
+# https://docs.github.com/en/webhooks/webhook-events-and-payloads#delivery-headers
+
+
+class DeliveryError(Exception):
+    """
+    Raised when a delivery is rejected.
+
+    Attributes:
+        code (int): The HTTP status code returned to GitHub.
+        message (str): The error message returned to GitHub.
+        retry_after (int | None): Seconds to wait before retrying, returned in a Retry-After header.
+    """
+
+    def __init__(self, code: int, message: str, retry_after: int | None = None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.retry_after = retry_after
+
+    def as_response(self) -> JsonResponse:
+        response = JsonResponse(data={"error": { "code": self.code, "message": self.message}}, status=self.code)
+        if self.retry_after is not None:
+            response.headers["Retry-After"] = str(self.retry_after)
+        return response
+
+
+def get_delivery_uuid(webhook, headers) -> str:
+    delivery_uuid = headers.get("X-GitHub-Delivery")
+    if not delivery_uuid:
+        # If the X-GitHub-Delivery header is missing, return a 400 Bad Request response.
+        logger.warning("Missing X-GitHub-Delivery header for webhook %s", webhook)
+        raise DeliveryError(400, "Missing X-GitHub-Delivery header")
+    try:
+        uuid.UUID(delivery_uuid)
+    except ValueError as e:
+        logger.warning("Invalid X-GitHub-Delivery header %s for webhook %s", delivery_uuid, webhook)
+        raise DeliveryError(400, "Invalid X-GitHub-Delivery header") from e
+    return delivery_uuid
+
+
+def read_verified_body(webhook, headers, chunks: Iterable[bytes]) -> bytes:
+    """
+    Reads the request body, verifying its X-Hub-Signature-256 signature as it streams in.
+
+    The signature is the HMAC-SHA256 of the body keyed with the webhook's secret token.
+    Verification is skipped if the webhook doesn't validate deliveries or has no secret
+    token, as GitHub doesn't sign deliveries in that case.
+
+    https://docs.github.com/en/webhooks/using-webhooks/validating-webhook-deliveries
+
+    Raises:
+        DeliveryError: If the signature is missing or doesn't match the body.
+    """
+    if not webhook.validate_deliveries or not webhook.secret_token:
+        if webhook.validate_deliveries:
+            logger.debug("Not validating delivery for webhook %s without a secret token", webhook)
+        return b"".join(chunks)
+
+    signature = headers.get("X-Hub-Signature-256")
+    if not signature:
+        logger.warning("Missing X-Hub-Signature-256 header for webhook %s", webhook)
+        raise DeliveryError(400, "Missing X-Hub-Signature-256 header")
+
+    mac = hmac.new(webhook.secret_token.encode("utf-8"), digestmod=hashlib.sha256)
+    parts = []
+    for chunk in chunks:
+        mac.update(chunk)
+        parts.append(chunk)
+    if not hmac.compare_digest(f"sha256={mac.hexdigest()}", signature):
+        logger.warning("Invalid X-Hub-Signature-256 signature for webhook %s", webhook)
+        raise DeliveryError(403, "Invalid signature")
+    return b"".join(parts)
+
+
+def read_request_chunks(request, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    Reads the body of a request a chunk at a time, bounded by DATA_UPLOAD_MAX_MEMORY_SIZE
+    like request.body is.
+
+    Raises:
+        DeliveryError: If the Content-Length header, or the body as the chunks
+            are read, exceeds DATA_UPLOAD_MAX_MEMORY_SIZE.
+    """
+    max_size = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+    if max_size is not None:
+        try:
+            content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            content_length = 0
+        if content_length > max_size:
+            raise request_too_large(content_length)
+    return _read_chunks(request, chunk_size, max_size)
+
+
+def _read_chunks(request, chunk_size: int, max_size: int | None) -> Iterator[bytes]:
+    size = 0
+    for chunk in iter(lambda: request.read(chunk_size), b""):
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            # Sent without a Content-Length header, or with a wrong one; stop reading it.
+            raise request_too_large(size)
+        yield chunk
+
+
+def request_too_large(size: int) -> DeliveryError:
+    logger.warning("Request body of at least %s bytes exceeds DATA_UPLOAD_MAX_MEMORY_SIZE", size)
+    return DeliveryError(413, "Request body too large")
+
+
+@dataclass
+class RequestDelivery:
+    """
+    A delivery parsed from a request, whose handler runs once its event is stored.
+    """
+    webhook: WebhookConfig
+    delivery_uuid: str
+    event: str
+    action: str
+    payload: dict
+    timings: Timings | NullTimings = NULL_TIMINGS
+
+    @property
+    def columns(self) -> dict:
+        """
+        Returns:
+            dict: The columns of the GitHubWebhookEvent storing the delivery.
+        """
+        return {"event": self.event, "action": self.action, "payload": self.payload}
+
+    def handle(self):
+        handle_delivery(self.webhook, self.delivery_uuid, self.event, self.action, self.payload, timings=self.timings)
+
+
+def read_request(webhook, request, timings: Timings | NullTimings = NULL_TIMINGS) -> bytes:
+    """
+    Reads the body of a delivery request, see read_verified_body().
+
+    Forged deliveries are rejected at the cost of a hash, before anything is parsed or stored.
+
+    Raises:
+        DeliveryError: If the signature is missing or doesn't match the body.
+    """
+    with timings.stage("verify"):
+        return read_verified_body(webhook, request.headers, read_request_chunks(request))
+
+
+def parse_request(webhook, request, body: bytes, timings: Timings | NullTimings = NULL_TIMINGS) -> RequestDelivery:
+    """
+    Validates and parses the delivery of a request, without running its handler.
+
+    Raises:
+        DeliveryError: If the delivery is rejected, or is a quick redelivery of one stored by this process.
+    """
+    delivery_uuid = get_delivery_uuid(webhook, request.headers)
+    with timings.stage("duplicate"):
+        if webhook.disallow_duplicate_deliveries and (webhook.id, delivery_uuid) in recent_deliveries:
+            # Rejected without a query.
+            raise duplicate_delivery(webhook, delivery_uuid)
+    event, action, payload = parse_delivery(webhook, delivery_uuid, request.headers, request.content_type, body, run_handler=False, timings=timings)
+    return RequestDelivery(webhook, delivery_uuid, event, action, payload, timings)
+
+
+def accept(delivery: RequestDelivery | None = None, stored: bool = True) -> JsonResponse:
+    """
+    Returns:
+        JsonResponse: The 202 response to a delivery, remembered as stored by this process.
+
+    Raises:
+        DeliveryError: If the delivery wasn't stored because it's a duplicate.
+    """
+    if delivery is not None:
+        if not stored:
+            raise duplicate_delivery(delivery.webhook, delivery.delivery_uuid)
+        recent_deliveries.add((delivery.webhook.id, delivery.delivery_uuid))
+    return JsonResponse(data={"status": "accepted"}, status=202)
+
+
+def duplicate_delivery(webhook, delivery_uuid: str) -> DeliveryError:
+    logger.warning("Duplicate delivery %s for webhook %s", delivery_uuid, webhook)
+    return DeliveryError(400, "Duplicate delivery")
+
+
+def parse_delivery(webhook, delivery_uuid: str, headers, content_type: str, body: bytes, run_handler: bool = True, timings: Timings | NullTimings = NULL_TIMINGS) -> tuple[str, str, dict]:
+    """
+    Validates and parses a delivery.
+
+    Args:
+        run_handler (bool): Run the handler of the delivery, otherwise only check that there is one.
+        timings (Timings): Timings of the request, which get "parse" and "handler" stages.
+
+    Returns:
+        tuple[str, str, dict]: The event, action and payload of the delivery.
+
+    Raises:
+        DeliveryError: If the delivery is rejected.
+    """
+    event = headers.get("X-GitHub-Event")
+    if not event:
+        # If the X-GitHub-Event header is missing, return a 400 Bad Request response.
+        logger.warning("Missing X-GitHub-Event header for webhook %s", webhook)
+        raise DeliveryError(400, "Missing X-GitHub-Event header")
+    # TODO Verify webhook event types
+
+    logger.info("Received %s event for webhook %s", event, webhook)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Received request body: %s", body.decode("utf-8", errors="replace"))
+
+    # If the content type is "application/x-www-form-urlencoded", extract the payload from the "payload" parameter.
+    if content_type == "application/x-www-form-urlencoded":
+        try:
+            decoded_payload = parse_qs(body.decode("utf-8"), strict_parsing=True)
+        except ValueError as e:
+            logger.warning("Invalid URL-encoded payload for webhook %s: %s", webhook, e)
+            raise DeliveryError(400, "Invalid URL-encoded payload") from e
+
+        data = decoded_payload.get("payload")[0]
+        # TODO Add handling for if the payload isn't present in the request body
+        data = data.replace("'", '"')
+        # TODO Replacing single quotes with double quotes is a workaround for the URL-encoded payload.
+    # If the content type is "application/json", the request body is parsed as is, without decoding it first.
+    elif content_type == "application/json":
+        data = body
+    else:
+        # If the content type is not supported, return a 415 Unsupported Media Type response.
+        logger.warning("Unsupported media type %s for webhook %s", content_type, webhook)
+        raise DeliveryError(415, "Unsupported media type")
+
+    # Parse the payload as JSON.
+    try:
+        with timings.stage("parse"):
+            payload = get_codec().loads(data)
+    except ValueError as e:
+        # If the payload is not valid JSON, return a 400 Bad Request response.
+        logger.warning("Invalid JSON payload for webhook %s: %s", webhook, e)
+        raise DeliveryError(400, "Invalid JSON payload") from e
+
+    if not isinstance(payload, dict):
+        logger.warning("JSON payload for webhook %s is not an object", webhook)
+        raise DeliveryError(400, "Invalid JSON payload")
+
+    if webhook.validate_deliveries:
+        # TODO Validate the user agent
+        # The payload signature is verified by read_verified_body before the payload is parsed.
+        pass
+
+    # Get the delivery from the payload using the delivery UUID.
+    delivery = payload.get(delivery_uuid)
+    if not delivery:
+        logger.warning("Delivery %s not found in payload for webhook %s", delivery_uuid, webhook)
+        raise DeliveryError(400, "X-GitHub-Delivery header must match payload")
+
+    if not run_handler:
+        return event, dispatch(webhook, event, delivery, payload, run_handler=False), payload
+    with timings.stage("handler"):
+        action = dispatch(webhook, event, delivery, payload)
+    return event, action, payload
+
+
+def parse_recorded_delivery(webhook, headers, body: bytes, verify: bool = True, run_handler: bool = True) -> tuple[str, str, str, dict]:
+    """
+    Validates and parses a delivery received outside of a request.
+
+    Args:
+        verify (bool): Verify the signature of the delivery.
+        run_handler (bool): Run the handler of the delivery, otherwise only check that there is one.
+
+    Returns:
+        tuple[str, str, str, dict]: The delivery UUID, event, action and payload of the delivery.
+
+    Raises:
+        DeliveryError: If the delivery is rejected.
+    """
+    headers = CaseInsensitiveMapping(headers)
+    if verify:
+        body = read_verified_body(webhook, headers, [body])
+    content_type, _ = parse_header_parameters(headers.get("Content-Type", ""))
+    delivery_uuid = get_delivery_uuid(webhook, headers)
+    event, action, payload = parse_delivery(webhook, delivery_uuid, headers, content_type, body, run_handler=run_handler)
+    return delivery_uuid, event, action, payload
+
+
+def handle_delivery(webhook, delivery_uuid: str, event: str, action: str, payload: dict, timings: Timings | NullTimings = NULL_TIMINGS):
+    """
+    Runs the handler of a delivery parsed with run_handler=False, once its event is stored.
+
+    Raises:
+        DeliveryError: If the handler rejects the delivery.
+    """
+    with timings.stage("handler"):
+        registry.get(event, action)(webhook, event, action, payload[delivery_uuid], payload)
+
+
+def dispatch(webhook, event: str, delivery: dict, payload: dict, run_handler: bool = True) -> str:
+    """
+    Routes a delivery to the handler registered for its event and action, see webhooks.dispatch.
+
+    Returns:
+        str: The action of the delivery.
+    """
+    action = delivery.get("action") or ""
+    handler = registry.get(event, action)
+    if handler is None:
+        if registry.handles_event(event):
+            logger.warning("Unsupported action %s with event %s for webhook %s", action, event, webhook)
+            logger.debug("Received payload: %s", payload)
+            raise DeliveryError(400, "Unsupported action")
+        logger.warning("Unsupported event %s for webhook %s", event, webhook)
+        raise DeliveryError(400, "Unsupported event")
+
+    logger.info("Received %s action with %s event for webhook %s", action, event, webhook)
+    if run_handler:
+        handler(webhook, event, action, delivery, payload)
+    return action
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from webhooks import deduplication, extraction
+from webhooks.models import GitHubWebhookEvent
+
+
+class Command(BaseCommand):
+    help = "Populate the columns extracted from webhook event payloads (WEBHOOKS_EXTRACTED_FIELDS) for existing events"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of events read and updated at a time.")
+        parser.add_argument("--start-id", type=int, default=0, help="Only update events with a greater id, to resume an interrupted run.")
+        parser.add_argument("--all", action="store_true", help="Also update events that have extracted values, e.g. after changing WEBHOOKS_EXTRACTED_FIELDS.")
+
+    def handle(self, *args, **options):
+        columns = list(extraction.get_extracted_fields())
+        if not columns:
+            self.stdout.write(self.style.WARNING("WEBHOOKS_EXTRACTED_FIELDS is empty, nothing to backfill"))
+            return
+
+        queryset = GitHubWebhookEvent.objects.order_by("id")
+        if not options["all"]:
+            # Events stored since the columns are populated have at least one of them set.
+            empty = Q()
+            for column in columns:
+                empty &= Q(**{f"{column}__isnull": True}) if extraction.empty_value(column) is None else Q(**{column: ""})
+            queryset = queryset.filter(empty)
+
+        last_id, updated = options["start_id"], 0
+        while True:
+            batch = list(queryset.filter(id__gt=last_id).values_list("id", "payload", "payload_compressed")[:options["batch_size"]])
+            if not batch:
+                break
+            # values_list() leaves the deduplicated sub-objects as references, resolve them in one query.
+            payloads = deduplication.reassemble_many([payload if payload is not None else compressed for _, payload, compressed in batch])
+            events = []
+            for (pk, _, _), payload in zip(batch, payloads):
+                values = extraction.extract(payload)
+                if values or options["all"]:
+                    events.append(GitHubWebhookEvent(id=pk, **{column: values.get(column, extraction.empty_value(column)) for column in columns}))
+            if events:
+                with transaction.atomic():
+                    GitHubWebhookEvent.objects.bulk_update(events, columns)
+            last_id = batch[-1][0]
+            updated += len(events)
+            self.stdout.write(f"Updated {updated} events, last id {last_id}")
+
+        self.stdout.write(self.style.SUCCESS(f"Updated {updated} events"))
+
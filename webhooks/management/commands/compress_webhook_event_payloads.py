@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Value
+
+from webhooks import compression, deduplication
+from webhooks.fields import get_compressed_field
+from webhooks.models import GitHubWebhookEvent
+
+
+class Command(BaseCommand):
+    help = (
+        "Move stored webhook event payloads to the column WEBHOOKS_PAYLOAD_COMPRESSION stores them in, payload or payload_compressed, "
+        "and rewrite them with the current WEBHOOKS_PAYLOAD_COMPRESSION and WEBHOOKS_PAYLOAD_DEDUPLICATED_KEYS settings"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of events read and rewritten at a time.")
+        parser.add_argument("--start-id", type=int, default=0, help="Only rewrite events with a greater id, to resume an interrupted run.")
+        parser.add_argument("--all", action="store_true", help="Also rewrite payloads that are stored with the current settings, e.g. to deduplicate them.")
+
+    def handle(self, *args, **options):
+        field = GitHubWebhookEvent._meta.get_field("payload")
+        compressed_field = get_compressed_field(field)
+        compress = compression.is_enabled()
+        table = connection.ops.quote_name(GitHubWebhookEvent._meta.db_table)
+        id_column = connection.ops.quote_name(GitHubWebhookEvent._meta.pk.column)
+        payload_column = connection.ops.quote_name(field.column)
+        compressed_column = connection.ops.quote_name(compressed_field.column)
+        # The raw column values are read so that rows which are already stored
+        # with the current settings can be skipped without decoding them.
+        query = f"SELECT {id_column}, {payload_column}, {compressed_column} FROM {table} WHERE {id_column} > %s ORDER BY {id_column} LIMIT %s"
+
+        def is_current(value, compressed_value) -> bool:
+            if compress:
+                return value is None and compressed_value is not None and compressed_field.is_current(compressed_value)
+            return compressed_value is None
+
+        last_id, scanned, rewritten = options["start_id"], 0, 0
+        while True:
+            with connection.cursor() as cursor:
+                cursor.execute(query, [last_id, options["batch_size"]])
+                batch = cursor.fetchall()
+            if not batch:
+                break
+            rows = [
+                (pk, field.from_db_value(value, None, connection) if value is not None else compressed_field.decode(compressed_value))
+                for pk, value, compressed_value in batch
+                if (value is not None or compressed_value is not None) and (options["all"] or not is_current(value, compressed_value))
+            ]
+            payloads = deduplication.reassemble_many([payload for _, payload in rows])
+            if rows:
+                with transaction.atomic():
+                    payloads = deduplication.deduplicate_many(payloads)
+                    # bulk_update() reads the attributes, which would reassemble the payloads again.
+                    events = [
+                        GitHubWebhookEvent(
+                            id=pk,
+                            payload=Value(None) if compress else Value(payload, output_field=field),
+                            payload_compressed=Value(payload if compress else None, output_field=compressed_field),
+                        )
+                        for (pk, _), payload in zip(rows, payloads)
+                    ]
+                    GitHubWebhookEvent.objects.bulk_update(events, ["payload", "payload_compressed"])
+            last_id = batch[-1][0]
+            scanned += len(batch)
+            rewritten += len(rows)
+            self.stdout.write(f"Rewrote {rewritten} of {scanned} payloads, last id {last_id}")
+
+        self.stdout.write(self.style.SUCCESS(f"Rewrote {rewritten} of {scanned} payloads"))
@@ -0,0 +1,88 @@
+import sys
+import time
+from datetime import datetime, time as datetime_time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from webhooks.archive import EVENT_FIELDS, open_jsonl, serialize_events
+from webhooks.models import GitHubWebhookEvent
+
+
+# Events are read in keyset pages ordered by id, each page streamed from the
+# database cursor with .iterator() and written out before the next one is
+# read, so memory use depends on --batch-size and not on the number of events.
+# Every page is an index range scan starting at the last id written, which
+# unlike OFFSET pagination costs the same at the end of the table as at the
+# start.
+
+
+def parse_time(value: str) -> datetime:
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError(f"Invalid date or time {value}")
+        parsed = datetime.combine(date, datetime_time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = "Export webhook events as JSON Lines, streaming them with constant memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", "-o", default="-", help="The file to write to, - for stdout. Files ending in .gz are compressed.")
+        parser.add_argument("--compress", action="store_true", help="Compress the output with gzip.")
+        parser.add_argument("--webhook", action="append", default=[], metavar="PUBLIC_ID", help="Only export events of this webhook. Can be repeated.")
+        parser.add_argument("--event", action="append", default=[], help="Only export events of this type. Can be repeated.")
+        parser.add_argument("--action", action="append", default=[], help="Only export events with this action. Can be repeated.")
+        parser.add_argument("--since", type=parse_time, default=None, help="Only export events created at or after this date or time.")
+        parser.add_argument("--until", type=parse_time, default=None, help="Only export events created before this date or time.")
+        parser.add_argument("--batch-size", type=int, default=2000, help="Number of events read per query.")
+
+    def handle(self, *args, **options):
+        events = GitHubWebhookEvent.objects.all()
+        if options["webhook"]:
+            events = events.filter(webhook__public_id__in=options["webhook"])
+        if options["event"]:
+            events = events.filter(event__in=options["event"])
+        if options["action"]:
+            events = events.filter(action__in=options["action"])
+        if options["since"]:
+            events = events.filter(created_at__gte=options["since"])
+        if options["until"]:
+            events = events.filter(created_at__lt=options["until"])
+
+        to_stdout = options["output"] == "-"
+        compress = options["compress"] or options["output"].endswith(".gz")
+        if to_stdout and compress and sys.stdout.isatty():
+            raise CommandError("Refusing to write compressed output to a terminal")
+
+        started = time.monotonic()
+        exported = 0
+        f = sys.stdout.buffer if to_stdout else open(options["output"], "wb") # pylint: disable=consider-using-with
+        try:
+            with open_jsonl(f, compress) as output:
+                for lines in self.export(events, options["batch_size"]):
+                    output.writelines(lines)
+                    exported += len(lines)
+                    elapsed = time.monotonic() - started
+                    self.stderr.write(f"Exported {exported} events, {exported / elapsed:.0f} rows/s")
+        finally:
+            f.flush()
+            if not to_stdout:
+                f.close()
+        self.stderr.write(self.style.SUCCESS(f"Exported {exported} events"))
+
+    def export(self, events, batch_size: int):
+        last_id = 0
+        while True:
+            page = events.filter(id__gt=last_id).order_by("id").values(*EVENT_FIELDS)[:batch_size]
+            rows = list(page.iterator(chunk_size=batch_size))
+            if not rows:
+                return
+            yield serialize_events(rows)
+            last_id = rows[-1]["id"]
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from config.workers import get_worker_pool
+from webhooks.spool import DrainResult, drain
+
+
+class Command(BaseCommand):
+    help = "Process webhook deliveries spooled by the webhook view when WEBHOOKS_INGEST_MODE is \"spool\""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=1, help="Number of worker processes.")
+        parser.add_argument("--batch-size", type=int, default=100, help="Number of deliveries claimed at a time by each worker.")
+        parser.add_argument("--lease", type=float, default=300, help="Seconds after which a claimed delivery is considered abandoned and retried.")
+        parser.add_argument("--max-attempts", type=int, default=5, help="Number of attempts before a delivery is marked as failed.")
+        parser.add_argument("--poll-interval", type=float, default=1, help="Seconds to wait for new deliveries when the spool is empty.")
+        parser.add_argument("--once", action="store_true", help="Exit once the spool is drained instead of waiting for new deliveries.")
+
+    def handle(self, *args, **options):
+        drain_options = {
+            "batch_size": options["batch_size"],
+            "lease": options["lease"],
+            "max_attempts": options["max_attempts"],
+            "poll_interval": options["poll_interval"],
+            "once": options["once"],
+        }
+
+        self.stdout.write(f"Processing webhook deliveries with {options['workers']} worker(s)")
+        if options["workers"] > 1:
+            with get_worker_pool(options["workers"]) as pool:
+                futures = [pool.submit(drain, **drain_options) for _ in range(options["workers"])]
+                result = sum((future.result() for future in futures), DrainResult())
+        else:
+            result = drain(**drain_options)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {result.processed} deliveries: {result.accepted} accepted, {result.rejected} rejected, "
+            f"{result.failed} failed, {result.retried} to be retried"
+        ))
@@ -0,0 +1,93 @@
+import json
+import os
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from webhooks.archive import EVENT_FIELDS, DailyArchive
+from webhooks.models import GitHubWebhookEvent
+from webhooks.retention import get_expired_events
+
+
+# Expired events are deleted in batches in id order, each batch in its own
+# short transaction followed by an optional pause, so that SQLite's write lock
+# is never held for long and the webhook view keeps up while pruning.
+#
+# With --archive-dir each batch is appended to the archive before it's deleted.
+# The ids of an archived batch are recorded in a marker file until the batch is
+# deleted, so a run that is interrupted in between deletes that batch without
+# archiving it again when it's resumed. Otherwise an interrupted run simply
+# starts over, as deleted events no longer match.
+
+PENDING_FILE = ".prune_webhook_events.pending"
+
+
+def parse_event_days(value: str) -> tuple[str, int | None]:
+    event, _, days = value.partition("=")
+    if not event or not days:
+        raise ValueError(f"Expected EVENT=DAYS, got {value}")
+    return event, None if days == "forever" else int(days)
+
+
+class Command(BaseCommand):
+    help = "Delete webhook events older than their retention window, optionally archiving them first"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None, help="Overrides WEBHOOKS_EVENT_RETENTION_DAYS.")
+        parser.add_argument("--event-days", type=parse_event_days, action="append", default=None, metavar="EVENT=DAYS",
+                            help="Overrides WEBHOOKS_EVENT_RETENTION_DAYS_BY_EVENT, e.g. push=30 or installation=forever. Can be repeated.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of events deleted per transaction.")
+        parser.add_argument("--sleep", type=float, default=0.1, help="Seconds to pause between batches.")
+        parser.add_argument("--archive-dir", default=None, help="Archive events to gzip compressed JSONL files in this directory, one per day, before deleting them.")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the expired events.")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        days_by_event = dict(options["event_days"]) if options["event_days"] is not None else None
+        expired = get_expired_events(now, default_days=options["days"], days_by_event=days_by_event)
+
+        if options["dry_run"]:
+            self.stdout.write(f"{expired.count()} expired events")
+            return
+
+        archive = DailyArchive(options["archive_dir"]) if options["archive_dir"] else None
+        pending = Path(options["archive_dir"]) / PENDING_FILE if archive else None
+        if pending and pending.exists():
+            ids = json.loads(pending.read_text(encoding="utf-8"))
+            self.stdout.write(f"Resuming: deleting {len(ids)} events archived by an interrupted run")
+            self.delete(ids, pending)
+
+        started = time.monotonic()
+        last_id, deleted = 0, 0
+        while True:
+            ids = list(expired.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:options["batch_size"]])
+            if not ids:
+                break
+            if archive:
+                archive.write(list(GitHubWebhookEvent.objects.filter(id__in=ids).order_by("id").values(*EVENT_FIELDS)))
+                write_pending(pending, ids)
+            deleted += self.delete(ids, pending)
+            last_id = ids[-1]
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(f"Deleted {deleted} events, {deleted / elapsed:.0f} rows/s, last id {last_id}")
+            if options["sleep"]:
+                time.sleep(options["sleep"])
+
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} events" + (f" archived to {options['archive_dir']}" if archive else "")))
+
+    def delete(self, ids: list[int], pending: Path | None) -> int:
+        with transaction.atomic():
+            count, _ = GitHubWebhookEvent.objects.filter(id__in=ids).delete()
+        if pending:
+            pending.unlink(missing_ok=True)
+        return count
+
+
+def write_pending(path: Path, ids: list[int]):
+    temporary = path.with_suffix(".tmp")
+    temporary.write_text(json.dumps(ids), encoding="utf-8")
+    os.replace(temporary, path)
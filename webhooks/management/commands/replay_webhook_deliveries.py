@@ -0,0 +1,52 @@
+import time
+from collections import deque
+from itertools import batched
+
+from django.core.management.base import BaseCommand
+
+from config.workers import get_worker_pool
+from webhooks.replay import ReplayResult, read_lines, replay
+
+
+class Command(BaseCommand):
+    help = "Replay recorded webhook deliveries from a JSONL file through the ingest pipeline, see webhooks/replay.py"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="The JSONL file of recorded deliveries, optionally gzip compressed.")
+        parser.add_argument("--webhook", default=None, metavar="PUBLIC_ID", help="The webhook of deliveries recorded without one.")
+        parser.add_argument("--workers", type=int, default=1, help="Number of worker processes.")
+        parser.add_argument("--batch-size", type=int, default=500, help="Number of deliveries replayed and inserted at a time.")
+        parser.add_argument("--no-verify", action="store_true", help="Don't verify the signatures of the deliveries.")
+        parser.add_argument("--dry-run", action="store_true", help="Validate the deliveries without running their handlers or storing them.")
+
+    def handle(self, *args, **options):
+        replay_options = {"default_webhook": options["webhook"], "verify": not options["no_verify"], "dry_run": options["dry_run"]}
+        batches = (list(batch) for batch in batched(read_lines(options["path"]), options["batch_size"]))
+
+        started = time.monotonic()
+        result = ReplayResult()
+        if options["workers"] > 1:
+            with get_worker_pool(options["workers"]) as pool:
+                # Keep a bounded number of batches in flight so the file is never read into memory at once.
+                pending = deque()
+                for batch in batches:
+                    pending.append(pool.submit(replay, batch, **replay_options))
+                    if len(pending) >= options["workers"] * 2:
+                        result += self.report(pending.popleft().result(), result, started)
+                while pending:
+                    result += self.report(pending.popleft().result(), result, started)
+        else:
+            for batch in batches:
+                result += self.report(replay(batch, **replay_options), result, started)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Checked' if options['dry_run'] else 'Replayed'} {result.replayed} deliveries: {result.accepted} accepted, "
+            f"{result.duplicate} duplicate, {result.rejected} rejected, {result.failed} failed"
+        ))
+        for message, count in result.errors.most_common():
+            self.stdout.write(f"  {count} rejected: {message}")
+
+    def report(self, batch_result: ReplayResult, result: ReplayResult, started: float) -> ReplayResult:
+        replayed = result.replayed + batch_result.replayed
+        self.stderr.write(f"Replayed {replayed} deliveries, {replayed / (time.monotonic() - started):.0f} deliveries/s")
+        return batch_result
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from webhooks import compression
+from webhooks.codecs import get_codec
+from webhooks.models import GitHubWebhookEvent, PayloadCompressionDictionary
+
+
+class Command(BaseCommand):
+    help = "Train a payload compression dictionary from a sample of the most recent webhook events"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--algorithm", choices=["zlib", "zstd"], default=getattr(settings, "WEBHOOKS_PAYLOAD_COMPRESSION", None) or "zlib", help="The compression algorithm the dictionary is trained for.")
+        parser.add_argument("--samples", type=int, default=1000, help="Number of events to sample.")
+        parser.add_argument("--size", type=int, default=None, help="Maximum size of the dictionary in bytes. Defaults to 32 KiB for zlib and 112 KiB for zstd.")
+
+    def handle(self, *args, **options):
+        try:
+            algorithm = compression.get_algorithm(options["algorithm"])
+        except ValueError as e:
+            raise CommandError(e) from e
+        size = options["size"] or (compression.ZLIB_MAX_DICTIONARY_SIZE if algorithm == compression.ZLIB else 112 * 1024)
+
+        codec = get_codec()
+        rows = GitHubWebhookEvent.objects.order_by("-id").values_list("payload", "payload_compressed")[:options["samples"]]
+        samples = [codec.dumps(payload if payload is not None else compressed) for payload, compressed in rows.iterator()]
+        if len(samples) < 2:
+            raise CommandError("At least 2 webhook events are needed to train a dictionary")
+
+        data = compression.train_dictionary(samples, algorithm, size)
+        dictionary = PayloadCompressionDictionary.objects.create(algorithm=options["algorithm"], data=data, sample_size=len(samples))
+        self.stdout.write(self.style.SUCCESS(
+            f"Trained {options['algorithm']} dictionary {dictionary.id} of {len(data)} bytes from {len(samples)} events. "
+            f"Set WEBHOOKS_PAYLOAD_COMPRESSION_DICTIONARY = {dictionary.id} to use it."
+        ))
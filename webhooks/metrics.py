@@ -0,0 +1,333 @@
+import bisect
+import contextlib
+import threading
+import time
+from collections.abc import Callable, Iterable
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from django.conf import settings
+from django.http import Http404, HttpRequest, HttpResponse
+
+
+# Instrumentation of the ingest views.
+#
+# The views time each stage of a delivery: the configuration lookup (a query
+# and a Fernet decrypt on a cache miss), reading and verifying the body,
+# parsing the JSON, running the handler, the recent delivery check and the
+# insert. With WEBHOOKS_SERVER_TIMING the timings are returned in a
+# Server-Timing header, which browsers and most HTTP clients display. With
+# WEBHOOKS_METRICS they are aggregated into histograms and counters per
+# webhook, event and status, served in the Prometheus text format by the
+# metrics view.
+#
+# Aggregates are kept per process, so with several workers each one reports
+# its own. When both settings are off, views get NULL_TIMINGS whose stages are
+# a shared no-op context manager, and nothing is recorded.
+
+# Upper bounds of the histogram buckets, in seconds.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Label sets past this many per metric are aggregated under "other", so that
+# event headers sent with forged deliveries can't grow the metrics unbounded.
+MAX_SERIES = 1000
+
+OTHER = "other"
+
+
+class Timings:
+    """
+    The durations of the stages of a request, in the order they ran.
+    """
+    __slots__ = ("started", "stages")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: list[tuple[str, float]] = []
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - started))
+
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self, total: float) -> str:
+        """
+        Returns:
+            str: The value of a Server-Timing header, with durations in milliseconds.
+        """
+        metrics = [f"{name};dur={elapsed * 1000:.3f}" for name, elapsed in self.stages]
+        metrics.append(f"total;dur={total * 1000:.3f}")
+        return ", ".join(metrics)
+
+
+class NullTimings:
+    """
+    Timings that record nothing, used when instrumentation is disabled.
+    """
+    stages = ()
+
+    def __init__(self):
+        self._stage = contextlib.nullcontext()
+
+    def stage(self, name: str):
+        return self._stage
+
+
+NULL_TIMINGS = NullTimings()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    labels = [f"{name}=\"{_escape(value)}\"" for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    The series of a metric, keyed by their label values.
+    """
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: tuple[str, ...]) -> tuple[str, ...]:
+        # Called with the lock held.
+        if labels not in self._series and len(self._series) >= MAX_SERIES:
+            return (OTHER,) * len(self.labels)
+        return labels
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            series = sorted(self._series.items())
+            for labels, value in series:
+                lines.extend(self._render_series(labels, value))
+        return lines
+
+    def _render_series(self, labels: tuple[str, ...], value) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            key = self._key(labels)
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def get(self, *labels: str) -> float:
+        with self._lock:
+            return self._series.get(labels, 0)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (), buckets: tuple[float, ...] = BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            key = self._key(labels)
+            series = self._series.get(key)
+            if series is None:
+                # The count of each bucket (and +Inf), the sum and the count.
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def get(self, *labels: str) -> tuple[float, int]:
+        """
+        Returns:
+            tuple[float, int]: The sum and count of the observations of a series.
+        """
+        with self._lock:
+            series = self._series.get(labels)
+            return (series[1], series[2]) if series else (0.0, 0)
+
+    def _render_series(self, labels: tuple[str, ...], value) -> list[str]:
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+            cumulative += bucket_count
+            le = f"le=\"{bound}\""
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {count}")
+        return lines
+
+
+requests_total = Counter(
+    "webhooks_requests_total", "Requests to the webhook ingest endpoint.", ["webhook", "event", "status"])
+request_duration = Histogram(
+    "webhooks_request_duration_seconds", "Time to handle a request to the webhook ingest endpoint.", ["webhook", "event", "status"])
+stage_duration = Histogram(
+    "webhooks_stage_duration_seconds", "Time spent in each stage of the webhook ingest endpoint.", ["stage"])
+
+METRICS = [requests_total, request_duration, stage_duration]
+
+
+def is_enabled() -> bool:
+    return getattr(settings, "WEBHOOKS_METRICS", False)
+
+
+def is_server_timing_enabled() -> bool:
+    return getattr(settings, "WEBHOOKS_SERVER_TIMING", False)
+
+
+def get_timings(request: HttpRequest) -> Timings | NullTimings:
+    """
+    Returns:
+        Timings | NullTimings: The timings of a request to an instrumented view.
+    """
+    return getattr(request, "timings", NULL_TIMINGS)
+
+
+def record(timings: Timings, webhook: str, event: str, status: int, response: HttpResponse | None = None):
+    """
+    Aggregates the timings of a request and adds them to its response.
+
+    Args:
+        webhook (str): The public_id of the webhook, or an empty string if there isn't one.
+        event (str): The event of the delivery, or an empty string if it doesn't have one.
+        status (int): The status code of the response.
+        response (HttpResponse | None): The response, if the view returned one.
+    """
+    total = timings.total()
+    if response is not None and is_server_timing_enabled():
+        response.headers["Server-Timing"] = timings.server_timing(total)
+    if is_enabled():
+        status = str(status)
+        requests_total.inc(webhook, event, status)
+        request_duration.observe(total, webhook, event, status)
+        for name, elapsed in timings.stages:
+            stage_duration.observe(elapsed, name)
+
+
+def instrument(view: Callable) -> Callable:
+    """
+    Decorates an ingest view to time its requests, see get_timings().
+
+    Requests for unknown webhooks are recorded without webhook and event
+    labels, as anyone can make them.
+    """
+    def start(request: HttpRequest) -> Timings | NullTimings:
+        timings = Timings() if is_enabled() or is_server_timing_enabled() else NULL_TIMINGS
+        request.timings = timings
+        return timings
+
+    def finish(timings: Timings | NullTimings, request: HttpRequest, public_id: str, status: int, response=None):
+        if timings is NULL_TIMINGS:
+            return
+        if status == 404:
+            record(timings, "", "", status, response)
+        else:
+            record(timings, public_id, request.headers.get("X-GitHub-Event", ""), status, response)
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request: HttpRequest, public_id: str) -> HttpResponse:
+            timings = start(request)
+            try:
+                response = await view(request, public_id)
+            except Http404:
+                finish(timings, request, public_id, 404)
+                raise
+            except Exception:
+                finish(timings, request, public_id, 500)
+                raise
+            finish(timings, request, public_id, response.status_code, response)
+            return response
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request: HttpRequest, public_id: str) -> HttpResponse:
+        timings = start(request)
+        try:
+            response = view(request, public_id)
+        except Http404:
+            finish(timings, request, public_id, 404)
+            raise
+        except Exception:
+            finish(timings, request, public_id, 500)
+            raise
+        finish(timings, request, public_id, response.status_code, response)
+        return response
+    return wrapper
+
+
+def _render_handlers() -> list[str]:
+    from .dispatch import registry # pylint: disable=import-outside-toplevel
+
+    handlers = registry.handlers()
+    lines = []
+    for name, documentation, attribute, metric_type in [
+        ("webhooks_handler_calls_total", "Calls of each delivery handler.", "calls", "counter"),
+        ("webhooks_handler_errors_total", "Calls of each delivery handler that raised.", "errors", "counter"),
+        ("webhooks_handler_seconds_total", "Time spent in each delivery handler.", "total_time", "counter"),
+        ("webhooks_handler_max_seconds", "Longest call of each delivery handler.", "max_time", "gauge"),
+    ]:
+        lines += [f"# HELP {name} {documentation}", f"# TYPE {name} {metric_type}"]
+        for handler in handlers:
+            labels = _format_labels(("event", "action", "handler"), (handler.event, handler.action, handler.name))
+            lines.append(f"{name}{labels} {_format_value(getattr(handler, attribute))}")
+    return lines
+
+
+def _render_config_cache() -> list[str]:
+    from .cache import webhook_config_cache # pylint: disable=import-outside-toplevel
+
+    name = "webhooks_config_cache_requests_total"
+    return [
+        f"# HELP {name} Webhook configuration lookups, by whether they were cached.",
+        f"# TYPE {name} counter",
+        f"{name}{{result=\"hit\"}} {webhook_config_cache.hits}",
+        f"{name}{{result=\"miss\"}} {webhook_config_cache.misses}",
+    ]
+
+
+def render() -> str:
+    """
+    Returns:
+        str: The metrics of this process in the Prometheus text format.
+    """
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    lines += _render_handlers()
+    lines += _render_config_cache()
+    return "\n".join(lines) + "\n"
+
+
+def clear():
+    for metric in METRICS:
+        metric.clear()
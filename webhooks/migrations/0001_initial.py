@@ -0,0 +1,123 @@
+# Generated by Django 5.1.15 on 2026-10-18 05:17
+
+import django.db.models.deletion
+import encryption.fields
+import webhooks.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GitHubWebhook',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('encryption_header', encryption.fields.EncryptionHeaderField(blank=True, db_index=True, default='', editable=False, max_length=32)),
+                ('public_id', models.SlugField(help_text='A unique public identifier for the webhook.', unique=True)),
+                ('client_id', encryption.fields.EncryptedTextField()),
+                ('client_id_blind_index', encryption.fields.BlindIndexField(blank=True, db_index=True, editable=False, max_length=64, source='client_id')),
+                ('secret_token', encryption.fields.EncryptedTextField(help_text='A secret token used to sign the webhook requests.')),
+                ('validate_deliveries', models.BooleanField(default=True, help_text='Validate delivery payload using the secret token.')),
+                ('disallow_duplicate_deliveries', models.BooleanField(default=True, help_text='Disallow duplicate deliveries for the same event.')),
+                ('enabled', models.BooleanField(db_index=True, default=True, help_text='Enable or disable the webhook.')),
+                ('rate_limit', models.PositiveIntegerField(blank=True, help_text='Deliveries per minute accepted for the webhook, further ones get a 429 response. Leave empty for the WEBHOOKS_RATE_LIMIT setting.', null=True)),
+                ('rate_limit_burst', models.PositiveIntegerField(blank=True, help_text='Deliveries accepted at once before the rate limit applies. Leave empty for the WEBHOOKS_RATE_LIMIT_BURST setting.', null=True)),
+                ('retention_days', models.PositiveIntegerField(blank=True, help_text='Days the events of the webhook are kept by prune_webhook_events. Leave empty for the WEBHOOKS_EVENT_RETENTION_DAYS settings.', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'GitHub Webhook',
+                'verbose_name_plural': 'GitHub Webhooks',
+                'ordering': ['-updated_at'],
+                'get_latest_by': 'updated_at',
+            },
+        ),
+        migrations.CreateModel(
+            name='PayloadCompressionDictionary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('algorithm', models.CharField(choices=[('zlib', 'zlib'), ('zstd', 'zstd')], max_length=255)),
+                ('data', models.BinaryField(help_text='The dictionary.')),
+                ('sample_size', models.PositiveIntegerField(help_text='The number of payloads the dictionary was trained from.')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Payload Compression Dictionary',
+                'verbose_name_plural': 'Payload Compression Dictionaries',
+                'ordering': ['-created_at'],
+                'get_latest_by': 'created_at',
+            },
+        ),
+        migrations.CreateModel(
+            name='PayloadObject',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(help_text='The SHA-256 digest of the encoded object.', max_length=64, unique=True)),
+                ('key', models.CharField(db_index=True, help_text='The payload key the object was first stored under.', max_length=255)),
+                ('data', webhooks.fields.CompressedJSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Payload Object',
+                'verbose_name_plural': 'Payload Objects',
+                'ordering': ['-created_at'],
+                'get_latest_by': 'created_at',
+            },
+        ),
+        migrations.CreateModel(
+            name='GitHubWebhookDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('headers', webhooks.fields.CodecJSONField(help_text='The request headers of the delivery.')),
+                ('body', models.BinaryField(help_text='The raw request body of the delivery.')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('rejected', 'Rejected'), ('failed', 'Failed')], db_index=True, default='pending', max_length=255)),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='The number of times processing the delivery was attempted.')),
+                ('claimed_by', models.CharField(blank=True, db_index=True, help_text='The claim of the worker processing the delivery.', max_length=32)),
+                ('claimed_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('webhook', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='webhooks.githubwebhook')),
+            ],
+            options={
+                'verbose_name': 'GitHub Webhook Delivery',
+                'verbose_name_plural': 'GitHub Webhook Deliveries',
+                'ordering': ['created_at'],
+                'get_latest_by': 'created_at',
+            },
+        ),
+        migrations.CreateModel(
+            name='GitHubWebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delivery_uuid', models.UUIDField(db_index=True, help_text='A globally unique identifier (GUID) to identify the event.')),
+                ('event', models.CharField(db_index=True, help_text='The name of the event that triggered the delivery.', max_length=255)),
+                ('action', models.CharField(blank=True, db_index=True, max_length=255)),
+                ('payload', webhooks.fields.PayloadJSONField(help_text="The payload of the delivery, unless it's stored in payload_compressed.", null=True)),
+                ('payload_compressed', webhooks.fields.CompressedJSONField(blank=True, editable=False, help_text='The payload of the delivery, compressed with WEBHOOKS_PAYLOAD_COMPRESSION.', null=True, source='payload')),
+                ('is_redelivery', models.BooleanField(default=False, help_text='Whether the delivery was received before. Only stored for webhooks that allow duplicate deliveries.')),
+                ('installation_id', models.BigIntegerField(blank=True, help_text='The id of the GitHub App installation in the payload.', null=True)),
+                ('repository_id', models.BigIntegerField(blank=True, help_text='The id of the repository in the payload.', null=True)),
+                ('repository_full_name', models.CharField(blank=True, help_text='The full name of the repository in the payload.', max_length=255)),
+                ('sender_login', models.CharField(blank=True, help_text='The login of the sender in the payload.', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('webhook', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='webhooks.githubwebhook')),
+            ],
+            options={
+                'verbose_name': 'GitHub Webhook Event',
+                'verbose_name_plural': 'GitHub Webhook Events',
+                'ordering': ['-updated_at'],
+                'get_latest_by': 'updated_at',
+                'indexes': [models.Index(fields=['installation_id', 'created_at'], name='webhooks_event_installation'), models.Index(fields=['repository_id', 'created_at'], name='webhooks_event_repository'), models.Index(fields=['repository_full_name', 'created_at'], name='webhooks_event_repository_name'), models.Index(fields=['sender_login', 'created_at'], name='webhooks_event_sender')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('is_redelivery', False)), fields=('webhook', 'delivery_uuid'), name='unique_github_webhook_event_delivery')],
+            },
+        ),
+    ]
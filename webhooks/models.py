@@ -1,15 +1,27 @@
-from django.db import models
+from contextlib import nullcontext
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, models, transaction
+from django.db.models.query import ModelIterable
 from django.utils.translation import gettext as _
 
-from encryption.fields import EncryptedTextField
+from encryption.fields import BlindIndexField, EncryptedTextField
+from encryption.models import EncryptedModel
+
+from . import deduplication, extraction
+from .fields import CodecJSONField, CompressedJSONField, PayloadJSONField
 
-class GitHubWebhook(models.Model):
+class GitHubWebhook(EncryptedModel):
     public_id = models.SlugField(unique=True, db_index=True, help_text=_("A unique public identifier for the webhook."))
     client_id = EncryptedTextField() # TODO: Is this field needed? Consider removing it.
+    client_id_blind_index = BlindIndexField(source="client_id")
     secret_token = EncryptedTextField(help_text=_("A secret token used to sign the webhook requests."))
     validate_deliveries = models.BooleanField(default=True, help_text=_("Validate delivery payload using the secret token."))
     disallow_duplicate_deliveries = models.BooleanField(default=True, help_text=_("Disallow duplicate deliveries for the same event."))
     enabled = models.BooleanField(default=True, db_index=True, help_text=_("Enable or disable the webhook."))
+    rate_limit = models.PositiveIntegerField(null=True, blank=True, help_text=_("Deliveries per minute accepted for the webhook, further ones get a 429 response. Leave empty for the WEBHOOKS_RATE_LIMIT setting."))
+    rate_limit_burst = models.PositiveIntegerField(null=True, blank=True, help_text=_("Deliveries accepted at once before the rate limit applies. Leave empty for the WEBHOOKS_RATE_LIMIT_BURST setting."))
+    retention_days = models.PositiveIntegerField(null=True, blank=True, help_text=_("Days the events of the webhook are kept by prune_webhook_events. Leave empty for the WEBHOOKS_EVENT_RETENTION_DAYS settings."))
     created_at = models.DateTimeField(auto_now_add=True, editable=False, db_index=True)
     updated_at = models.DateTimeField(auto_now=True, editable=False, db_index=True)
 
@@ -25,18 +37,116 @@ class GitHubWebhook(models.Model):
         return self.public_id
 
 
+class GitHubWebhookEventIterable(ModelIterable):
+    """
+    Yields events with their payloads reassembled, see webhooks.deduplication.
+    """
+
+    def __iter__(self):
+        chunk = []
+        for event in super().__iter__():
+            chunk.append(event)
+            if len(chunk) >= self.chunk_size:
+                yield from self.reassemble(chunk)
+                chunk = []
+        yield from self.reassemble(chunk)
+
+    def reassemble(self, events: list) -> list:
+        for event in events:
+            # Payloads stored compressed are loaded in payload_compressed, see PayloadJSONField.
+            if event.__dict__.get("payload", False) is None:
+                event.__dict__["payload"] = event.__dict__.get("payload_compressed")
+        deduplication.reassemble_instances(events, "payload", using=self.queryset.db)
+        return events
+
+
+class GitHubWebhookEventQuerySet(models.QuerySet):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._iterable_class = GitHubWebhookEventIterable
+
+
+class GitHubWebhookEventManager(models.Manager.from_queryset(GitHubWebhookEventQuerySet)):
+
+    def create_delivery(self, webhook_id: int, delivery_uuid: str, allow_duplicates: bool, **kwargs) -> "GitHubWebhookEvent | None":
+        """
+        Inserts the event for a delivery in a single round trip, relying on the
+        unique_github_webhook_event_delivery constraint to detect duplicates.
+
+        Returns:
+            GitHubWebhookEvent | None: The created event, or None if the delivery is a
+            duplicate and duplicates are not allowed.
+        """
+        kwargs = {**extraction.extract(kwargs.get("payload")), **kwargs}
+        if "payload" in kwargs:
+            # Outside the savepoint, a redelivery references the same objects.
+            kwargs["payload"] = deduplication.deduplicate(kwargs["payload"], using=self.db)
+        try:
+            return self._create_in_savepoint(webhook_id=webhook_id, delivery_uuid=delivery_uuid, **kwargs)
+        except IntegrityError:
+            if not allow_duplicates:
+                return None
+        # The original delivery is already stored, keep this one as a redelivery.
+        return self.create(webhook_id=webhook_id, delivery_uuid=delivery_uuid, is_redelivery=True, **kwargs)
+
+    async def acreate_delivery(self, webhook_id: int, delivery_uuid: str, allow_duplicates: bool, **kwargs) -> "GitHubWebhookEvent | None":
+        """
+        The async version of create_delivery(), only the inserts leave the event loop.
+        """
+        kwargs = {**extraction.extract(kwargs.get("payload")), **kwargs}
+        if "payload" in kwargs and deduplication.get_keys():
+            kwargs["payload"] = await sync_to_async(deduplication.deduplicate)(kwargs["payload"], using=self.db)
+        try:
+            # Like acreate(), with the savepoint of create_delivery().
+            return await sync_to_async(self._create_in_savepoint)(webhook_id=webhook_id, delivery_uuid=delivery_uuid, **kwargs)
+        except IntegrityError:
+            if not allow_duplicates:
+                return None
+        # The original delivery is already stored, keep this one as a redelivery.
+        return await self.acreate(webhook_id=webhook_id, delivery_uuid=delivery_uuid, is_redelivery=True, **kwargs)
+
+    def _create_in_savepoint(self, **kwargs) -> "GitHubWebhookEvent":
+        # In autocommit mode a failed INSERT leaves nothing to roll back, a savepoint is
+        # only needed to keep a surrounding transaction usable.
+        if transaction.get_connection(self.db).in_atomic_block:
+            atomic = transaction.atomic(using=self.db)
+        else:
+            atomic = nullcontext()
+        with atomic:
+            return self.create(**kwargs)
+
+
 class GitHubWebhookEvent(models.Model):
     webhook = models.ForeignKey(GitHubWebhook, on_delete=models.CASCADE)
     delivery_uuid = models.UUIDField(db_index=True, help_text=_("A globally unique identifier (GUID) to identify the event."))
     event = models.CharField(max_length=255, db_index=True, help_text=_("The name of the event that triggered the delivery."))
     action = models.CharField(max_length=255, blank=True, db_index=True)
-    payload = models.JSONField()
+    payload = PayloadJSONField(null=True, help_text=_("The payload of the delivery, unless it's stored in payload_compressed."))
+    payload_compressed = CompressedJSONField(source="payload", help_text=_("The payload of the delivery, compressed with WEBHOOKS_PAYLOAD_COMPRESSION."))
+    is_redelivery = models.BooleanField(default=False, help_text=_("Whether the delivery was received before. Only stored for webhooks that allow duplicate deliveries."))
+    # Copied from the payload when the event is stored, see webhooks/extraction.py.
+    installation_id = models.BigIntegerField(null=True, blank=True, help_text=_("The id of the GitHub App installation in the payload."))
+    repository_id = models.BigIntegerField(null=True, blank=True, help_text=_("The id of the repository in the payload."))
+    repository_full_name = models.CharField(max_length=255, blank=True, help_text=_("The full name of the repository in the payload."))
+    sender_login = models.CharField(max_length=255, blank=True, help_text=_("The login of the sender in the payload."))
     created_at = models.DateTimeField(auto_now_add=True, editable=False, db_index=True)
     updated_at = models.DateTimeField(auto_now=True, editable=False, db_index=True)
 
-    objects = models.Manager()
+    objects = GitHubWebhookEventManager()
 
     class Meta:
+        constraints = [
+            # Each delivery is stored once, redeliveries are only kept when the webhook allows duplicate deliveries.
+            models.UniqueConstraint(fields=["webhook", "delivery_uuid"], condition=models.Q(is_redelivery=False), name="unique_github_webhook_event_delivery"),
+        ]
+        # The extracted columns are queried for the recent events of an installation, repository or sender.
+        indexes = [
+            models.Index(fields=["installation_id", "created_at"], name="webhooks_event_installation"),
+            models.Index(fields=["repository_id", "created_at"], name="webhooks_event_repository"),
+            models.Index(fields=["repository_full_name", "created_at"], name="webhooks_event_repository_name"),
+            models.Index(fields=["sender_login", "created_at"], name="webhooks_event_sender"),
+        ]
         get_latest_by = "updated_at"
         ordering = ["-updated_at"]
         verbose_name = _("GitHub Webhook Event")
@@ -44,3 +154,93 @@ class GitHubWebhookEvent(models.Model):
 
     def __str__(self):
         return f"{self.delivery_uuid} - {self.event}"
+
+
+DELIVERY_STATUS_CHOICES = {
+    "pending": _("Pending"),
+    "rejected": _("Rejected"),
+    "failed": _("Failed"),
+}
+
+class GitHubWebhookDelivery(models.Model):
+    """
+    A raw delivery spooled by the webhook view when WEBHOOKS_INGEST_MODE is "spool".
+
+    Spooled deliveries are processed by the process_webhook_deliveries command,
+    which deletes them once their event is stored. Deliveries that are rejected
+    or keep failing are kept for inspection.
+    """
+    webhook = models.ForeignKey(GitHubWebhook, on_delete=models.CASCADE)
+    headers = CodecJSONField(help_text=_("The request headers of the delivery."))
+    body = models.BinaryField(help_text=_("The raw request body of the delivery."))
+    status = models.CharField(max_length=255, choices=DELIVERY_STATUS_CHOICES, default="pending", db_index=True)
+    attempts = models.PositiveIntegerField(default=0, help_text=_("The number of times processing the delivery was attempted."))
+    claimed_by = models.CharField(max_length=32, blank=True, db_index=True, help_text=_("The claim of the worker processing the delivery."))
+    claimed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, editable=False, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, editable=False, db_index=True)
+
+    objects = models.Manager()
+
+    class Meta:
+        get_latest_by = "created_at"
+        ordering = ["created_at"]
+        verbose_name = _("GitHub Webhook Delivery")
+        verbose_name_plural = _("GitHub Webhook Deliveries")
+
+    def __str__(self):
+        return f"{self.id} - {self.status}"
+
+
+class PayloadObject(models.Model):
+    """
+    A sub-object shared by stored payloads, such as a repository, see webhooks.deduplication.
+
+    Payload objects are content-addressed and immutable. They're referenced from
+    stored payloads, so they're kept when events are deleted.
+    """
+    digest = models.CharField(max_length=64, unique=True, help_text=_("The SHA-256 digest of the encoded object."))
+    key = models.CharField(max_length=255, db_index=True, help_text=_("The payload key the object was first stored under."))
+    data = CompressedJSONField()
+    created_at = models.DateTimeField(auto_now_add=True, editable=False, db_index=True)
+
+    objects = models.Manager()
+
+    class Meta:
+        get_latest_by = "created_at"
+        ordering = ["-created_at"]
+        verbose_name = _("Payload Object")
+        verbose_name_plural = _("Payload Objects")
+
+    def __str__(self):
+        return f"{self.key} - {self.digest}"
+
+
+PAYLOAD_COMPRESSION_ALGORITHM_CHOICES = {
+    "zlib": "zlib",
+    "zstd": "zstd",
+}
+
+class PayloadCompressionDictionary(models.Model):
+    """
+    A dictionary trained from stored payloads by the train_payload_dictionary command.
+
+    Compressed payloads reference the dictionary they were compressed with, so
+    dictionaries must be kept for as long as any payload uses them.
+    """
+    algorithm = models.CharField(max_length=255, choices=PAYLOAD_COMPRESSION_ALGORITHM_CHOICES)
+    data = models.BinaryField(help_text=_("The dictionary."))
+    sample_size = models.PositiveIntegerField(help_text=_("The number of payloads the dictionary was trained from."))
+    created_at = models.DateTimeField(auto_now_add=True, editable=False, db_index=True)
+
+    objects = models.Manager()
+
+    class Meta:
+        get_latest_by = "created_at"
+        ordering = ["-created_at"]
+        verbose_name = _("Payload Compression Dictionary")
+        verbose_name_plural = _("Payload Compression Dictionaries")
+
+    def __str__(self):
+        return f"{self.id} - {self.algorithm}"
@@ -0,0 +1,209 @@
+import logging
+import math
+import threading
+import time
+from collections.abc import Callable
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpRequest, HttpResponse
+
+from .ingest import DeliveryError
+
+logger = logging.getLogger("astra.webhooks.ratelimit")
+
+
+# Load shedding for the ingest views, so that one flooding webhook can't starve
+# the others of workers and database time. Over-limit deliveries are rejected
+# with a 429 and a Retry-After header before they're parsed or stored, which
+# GitHub treats as a failed delivery that can be redelivered later. They are
+# charged once their signature is verified, so that anyone who knows a
+# webhook's public_id can't drain its bucket with unsigned requests and get
+# GitHub's deliveries rejected; forged requests only cost a hash of the body.
+#
+# Each webhook has a token bucket refilled at GitHubWebhook.rate_limit (or
+# WEBHOOKS_RATE_LIMIT) deliveries per minute, holding up to rate_limit_burst
+# (or WEBHOOKS_RATE_LIMIT_BURST, or a minute's worth) deliveries. Buckets are
+# kept per process unless WEBHOOKS_RATE_LIMIT_CACHE_ALIAS names a cache shared
+# by the workers. As caches have no compare-and-set, the shared limiter
+# approximates the bucket with a counter per window of burst / rate seconds,
+# which allows the same average rate but up to twice the burst across a window
+# boundary. Its backend must increment atomically (Redis or Memcached, not the
+# database or file based caches).
+#
+# Independently, WEBHOOKS_MAX_IN_FLIGHT caps the requests each process handles
+# at once. With the batch writer these include the deliveries waiting for their
+# batch to be written, so the cap also bounds the writer's queue.
+
+KEY_PREFIX = "astra.webhooks.ratelimit"
+
+
+class TokenBucketLimiter:
+    """
+    Token buckets kept in this process, keyed by public_id.
+    """
+
+    def __init__(self):
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, rate: float, burst: int) -> float:
+        """
+        Takes a token from a bucket.
+
+        Args:
+            rate (float): Tokens added to the bucket per second.
+            burst (int): Capacity of the bucket.
+
+        Returns:
+            float: 0 if a token was taken, otherwise the seconds until one is available.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+        return (1 - tokens) / rate
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheLimiter:
+    """
+    Fixed window counters kept in a cache shared by the workers.
+    """
+
+    def __init__(self, alias: str):
+        self.alias = alias
+
+    def _window(self, key: str, rate: float, burst: int) -> tuple[str, int, float]:
+        window = burst / rate
+        now = time.time()
+        index = int(now // window)
+        return f"{KEY_PREFIX}:{key}:{index}", math.ceil(window), (index + 1) * window - now
+
+    def acquire(self, key: str, rate: float, burst: int) -> float:
+        cache = caches[self.alias]
+        key, timeout, remaining = self._window(key, rate, burst)
+        # add() is a no-op if the counter exists, incr() then counts this delivery atomically.
+        cache.add(key, 0, timeout=timeout + 1)
+        return 0.0 if cache.incr(key) <= burst else remaining
+
+    async def aacquire(self, key: str, rate: float, burst: int) -> float:
+        cache = caches[self.alias]
+        key, timeout, remaining = self._window(key, rate, burst)
+        await cache.aadd(key, 0, timeout=timeout + 1)
+        return 0.0 if await cache.aincr(key) <= burst else remaining
+
+
+local_limiter = TokenBucketLimiter()
+
+
+def get_limiter() -> TokenBucketLimiter | CacheLimiter:
+    alias = getattr(settings, "WEBHOOKS_RATE_LIMIT_CACHE_ALIAS", None)
+    return CacheLimiter(alias) if alias else local_limiter
+
+
+def get_rate_limit(webhook) -> tuple[float, int] | None:
+    """
+    Returns:
+        tuple[float, int] | None: The rate in deliveries per second and the burst of a
+        webhook, or None if it isn't rate limited.
+    """
+    per_minute = webhook.rate_limit or getattr(settings, "WEBHOOKS_RATE_LIMIT", None)
+    if not per_minute:
+        return None
+    burst = webhook.rate_limit_burst or getattr(settings, "WEBHOOKS_RATE_LIMIT_BURST", None) or per_minute
+    return per_minute / 60, burst
+
+
+def rate_limited(webhook, retry_after: float) -> DeliveryError:
+    logger.warning("Rate limit exceeded for webhook %s, retry after %.1fs", webhook, retry_after)
+    return DeliveryError(429, "Rate limit exceeded", retry_after=max(1, math.ceil(retry_after)))
+
+
+def check_rate_limit(webhook):
+    """
+    Raises:
+        DeliveryError: If the webhook is over its rate limit.
+    """
+    rate_limit = get_rate_limit(webhook)
+    if rate_limit is None:
+        return
+    retry_after = get_limiter().acquire(webhook.public_id, *rate_limit)
+    if retry_after:
+        raise rate_limited(webhook, retry_after)
+
+
+async def acheck_rate_limit(webhook):
+    rate_limit = get_rate_limit(webhook)
+    if rate_limit is None:
+        return
+    limiter = get_limiter()
+    if isinstance(limiter, CacheLimiter):
+        retry_after = await limiter.aacquire(webhook.public_id, *rate_limit)
+    else:
+        retry_after = limiter.acquire(webhook.public_id, *rate_limit)
+    if retry_after:
+        raise rate_limited(webhook, retry_after)
+
+
+class InFlight:
+    """
+    Counts the requests being handled by this process.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, limit: int | None) -> bool:
+        with self._lock:
+            if limit and self.count >= limit:
+                return False
+            self.count += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.count -= 1
+
+
+in_flight = InFlight()
+
+
+def overloaded() -> HttpResponse:
+    return DeliveryError(429, "Too many deliveries in flight", retry_after=1).as_response()
+
+
+def shed_load(view: Callable) -> Callable:
+    """
+    Decorates an ingest view to reject deliveries past WEBHOOKS_MAX_IN_FLIGHT.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request: HttpRequest, *args, **kwargs) -> HttpResponse:
+            if not in_flight.acquire(getattr(settings, "WEBHOOKS_MAX_IN_FLIGHT", None)):
+                return overloaded()
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                in_flight.release()
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        if not in_flight.acquire(getattr(settings, "WEBHOOKS_MAX_IN_FLIGHT", None)):
+            return overloaded()
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            in_flight.release()
+    return wrapper
@@ -0,0 +1,206 @@
+import base64
+import gzip
+import json
+import logging
+import uuid
+from collections import Counter
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+
+from django.db import transaction
+
+from . import ingest
+from .cache import webhook_config_cache
+from .models import GitHubWebhookEvent
+from .writer import BatchWriter
+
+logger = logging.getLogger("astra.webhooks.replay")
+
+
+# Recorded deliveries are replayed through the same validation, dispatch and
+# duplicate detection as the webhook view, from JSON Lines with one delivery
+# per line:
+#
+#   {"webhook": "<public_id>", "headers": {"X-GitHub-Delivery": ...}, "body": "<raw body>"}
+#
+# "body_base64" can be given instead of "body" for bodies that aren't UTF-8,
+# and "webhook" can be left out in favour of the replay_webhook_deliveries
+# --webhook option. Signatures are verified against the exact body, so bodies
+# must be recorded as received.
+#
+# Deliveries that are already stored, or that appear earlier in the batch, are
+# counted as duplicates up front. The events of the others are inserted
+# together by a BatchWriter, which looks the stored deliveries up again if the
+# insert hits the unique constraint, e.g. because the view stored one of them
+# meanwhile, and those count as duplicates too. As with store_and_handle(),
+# handlers only run for the events that were inserted, so replaying a range
+# that was already ingested doesn't run its handlers again. The insert and the
+# handlers share a transaction, and the event of a delivery its handler rejects
+# is deleted again. A batch that fails to insert counts as failed, the
+# following batches are still replayed.
+
+
+@dataclass
+class ReplayResult:
+    accepted: int = 0
+    duplicate: int = 0
+    rejected: int = 0
+    failed: int = 0
+    errors: Counter = field(default_factory=Counter)
+
+    def __add__(self, other: "ReplayResult") -> "ReplayResult":
+        return ReplayResult(
+            accepted=self.accepted + other.accepted,
+            duplicate=self.duplicate + other.duplicate,
+            rejected=self.rejected + other.rejected,
+            failed=self.failed + other.failed,
+            errors=self.errors + other.errors,
+        )
+
+    @property
+    def replayed(self) -> int:
+        return self.accepted + self.duplicate + self.rejected + self.failed
+
+    def reject(self, message: str):
+        self.rejected += 1
+        self.errors[message] += 1
+
+
+def read_lines(path: str) -> Iterator[str]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield line
+
+
+def parse_record(line: str, default_webhook: str | None) -> tuple[str, dict, bytes]:
+    """
+    Returns:
+        tuple[str, dict, bytes]: The webhook public_id, headers and body of a recorded delivery.
+
+    Raises:
+        ValueError: If the record is invalid.
+    """
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError("Record is not an object")
+    public_id = record.get("webhook") or default_webhook
+    if not public_id:
+        raise ValueError("Record has no webhook")
+    if "body_base64" in record:
+        body = base64.b64decode(record["body_base64"])
+    else:
+        body = record.get("body", "").encode("utf-8")
+    return public_id, record.get("headers") or {}, body
+
+
+def replay(lines: list[str], default_webhook: str | None = None, verify: bool = True, dry_run: bool = False) -> ReplayResult:
+    """
+    Replays a batch of recorded deliveries.
+
+    Args:
+        default_webhook (str | None): The public_id of the webhook of records without one.
+        verify (bool): Verify the signatures of the deliveries.
+        dry_run (bool): Validate the deliveries without running their handlers or storing them.
+    """
+    result = ReplayResult()
+    accepted = []
+    for line in lines:
+        try:
+            public_id, headers, body = parse_record(line, default_webhook)
+        except (ValueError, TypeError, AttributeError) as e:
+            logger.warning("Invalid record: %s", e)
+            result.reject("Invalid record")
+            continue
+        webhook = webhook_config_cache.get(public_id)
+        if webhook is None:
+            result.reject("Unknown or disabled webhook")
+            continue
+        try:
+            delivery_uuid, event, action, payload = ingest.parse_recorded_delivery(webhook, headers, body, verify=verify, run_handler=False)
+        except ingest.DeliveryError as e:
+            result.reject(e.message)
+            continue
+        accepted.append((webhook, delivery_uuid, event, action, payload))
+
+    deliveries = []
+    for delivery, duplicate in zip(accepted, find_duplicates(accepted)):
+        if duplicate:
+            result.duplicate += 1
+        elif dry_run:
+            result.accepted += 1
+        else:
+            deliveries.append(delivery)
+    if deliveries:
+        with transaction.atomic():
+            handle(store(deliveries, result), result)
+    return result
+
+
+def find_duplicates(deliveries: list[tuple]) -> list[bool]:
+    """
+    Returns:
+        list[bool]: Whether each delivery is a duplicate of a stored event or of an earlier delivery in the
+        batch, for webhooks that disallow duplicate deliveries.
+    """
+    stored = set(
+        GitHubWebhookEvent.objects.filter(
+            webhook_id__in={webhook.id for webhook, *_ in deliveries},
+            delivery_uuid__in={delivery_uuid for _, delivery_uuid, *_ in deliveries},
+        ).values_list("webhook_id", "delivery_uuid")
+    ) if deliveries else set()
+    seen = {(webhook_id, str(delivery_uuid)) for webhook_id, delivery_uuid in stored}
+    duplicates = []
+    for webhook, delivery_uuid, *_ in deliveries:
+        key = (webhook.id, str(uuid.UUID(delivery_uuid)))
+        duplicates.append(key in seen and webhook.disallow_duplicate_deliveries)
+        seen.add(key)
+    return duplicates
+
+
+def store(deliveries: list[tuple], result: ReplayResult) -> list[tuple]:
+    """
+    Inserts the events of the deliveries in one batch.
+
+    Returns:
+        list[tuple]: The deliveries whose event was inserted, with the event.
+    """
+    writer = BatchWriter(max_size=max(len(deliveries), 1), autostart=False)
+    futures = [
+        writer.submit(webhook.id, delivery_uuid, not webhook.disallow_duplicate_deliveries, event=event, action=action, payload=payload)
+        for webhook, delivery_uuid, event, action, payload in deliveries
+    ]
+    writer.flush()
+    stored = []
+    for delivery, future in zip(deliveries, futures):
+        try:
+            event = future.result()
+        except Exception: # pylint: disable=broad-exception-caught
+            # Logged by the BatchWriter.
+            result.failed += 1
+            continue
+        if event is None:
+            result.duplicate += 1
+        else:
+            stored.append((delivery, event))
+    return stored
+
+
+def handle(stored: list[tuple], result: ReplayResult):
+    """
+    Runs the handlers of the stored deliveries, deleting the events of those they reject.
+    """
+    rejected = []
+    for (webhook, delivery_uuid, event, action, payload), stored_event in stored:
+        try:
+            # A savepoint, so that a rejecting handler leaves nothing behind.
+            with transaction.atomic():
+                ingest.handle_delivery(webhook, delivery_uuid, event, action, payload)
+        except ingest.DeliveryError as e:
+            result.reject(e.message)
+            rejected.append(stored_event.pk)
+            continue
+        result.accepted += 1
+    if rejected:
+        GitHubWebhookEvent.objects.filter(pk__in=rejected).delete()
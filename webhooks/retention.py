@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q, QuerySet
+
+from .models import GitHubWebhook, GitHubWebhookEvent
+
+
+# Events are kept for the first retention window that applies to them:
+#
+#   1. GitHubWebhook.retention_days of their webhook
+#   2. WEBHOOKS_EVENT_RETENTION_DAYS_BY_EVENT for their event type
+#   3. WEBHOOKS_EVENT_RETENTION_DAYS
+#
+# A window of None keeps events forever. Expired events are deleted by the
+# prune_webhook_events command.
+
+
+def get_expired_events(now: datetime, default_days: int | None = None, days_by_event: dict[str, int | None] | None = None) -> QuerySet:
+    """
+    Returns:
+        QuerySet: The events whose retention window ended before now.
+
+    Args:
+        default_days (int | None): Overrides WEBHOOKS_EVENT_RETENTION_DAYS.
+        days_by_event (dict[str, int | None] | None): Overrides WEBHOOKS_EVENT_RETENTION_DAYS_BY_EVENT.
+    """
+    if default_days is None:
+        default_days = getattr(settings, "WEBHOOKS_EVENT_RETENTION_DAYS", None)
+    if days_by_event is None:
+        days_by_event = getattr(settings, "WEBHOOKS_EVENT_RETENTION_DAYS_BY_EVENT", {})
+
+    webhook_days = dict(GitHubWebhook.objects.filter(retention_days__isnull=False).values_list("id", "retention_days"))
+    expired = Q(pk__in=[])
+    for webhook_id, days in webhook_days.items():
+        expired |= Q(webhook_id=webhook_id, created_at__lt=now - timedelta(days=days))
+
+    other_webhooks = ~Q(webhook_id__in=webhook_days)
+    for event, days in days_by_event.items():
+        if days is not None:
+            expired |= other_webhooks & Q(event=event, created_at__lt=now - timedelta(days=days))
+    if default_days is not None:
+        expired |= other_webhooks & ~Q(event__in=days_by_event) & Q(created_at__lt=now - timedelta(days=default_days))
+    return GitHubWebhookEvent.objects.filter(expired)
@@ -0,0 +1,149 @@
+import logging
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Subquery
+from django.utils import timezone
+
+from . import ingest
+from .cache import webhook_config_cache
+from .models import GitHubWebhookDelivery, GitHubWebhookEvent
+
+logger = logging.getLogger("astra.webhooks.spool")
+
+
+# When WEBHOOKS_INGEST_MODE is "spool" the webhook view only appends the raw
+# delivery to GitHubWebhookDelivery and returns 202, keeping the response well
+# inside GitHub's 10 second timeout regardless of how long processing takes.
+#
+# Workers claim pending deliveries in batches by stamping them with a claim
+# token. A delivery is deleted in the same transaction that stores its event,
+# so a worker that crashes mid-batch leaves its deliveries claimed and they are
+# picked up again once the lease expires (at-least-once processing). Redoing a
+# delivery is harmless for webhooks that disallow duplicate deliveries, as the
+# unique_github_webhook_event_delivery constraint rejects the second insert
+# before the handler of the delivery runs again.
+
+
+def get_ingest_mode() -> str:
+    return getattr(settings, "WEBHOOKS_INGEST_MODE", "inline")
+
+
+def ingest_delivery(webhook, headers, body: bytes, verify: bool = True) -> GitHubWebhookEvent:
+    """
+    Runs a delivery received outside of a request through the ingest pipeline.
+
+    Args:
+        verify (bool): Verify the signature of the delivery. Spooled deliveries were verified by the view.
+
+    Raises:
+        DeliveryError: If the delivery is rejected.
+    """
+    delivery_uuid, event, action, payload = ingest.parse_recorded_delivery(webhook, headers, body, verify=verify, run_handler=False)
+    allow_duplicates = not webhook.disallow_duplicate_deliveries
+    github_webhook_event = GitHubWebhookEvent.objects.create_delivery(webhook.id, delivery_uuid, allow_duplicates, event=event, action=action, payload=payload)
+    if github_webhook_event is None:
+        raise ingest.duplicate_delivery(webhook, delivery_uuid)
+    # Only once the event is stored, so that the handler of a delivery processed again doesn't run twice.
+    ingest.handle_delivery(webhook, delivery_uuid, event, action, payload)
+    return github_webhook_event
+
+
+@dataclass
+class DrainResult:
+    accepted: int = 0
+    rejected: int = 0
+    failed: int = 0
+    retried: int = 0
+
+    def __add__(self, other: "DrainResult") -> "DrainResult":
+        return DrainResult(
+            accepted=self.accepted + other.accepted,
+            rejected=self.rejected + other.rejected,
+            failed=self.failed + other.failed,
+            retried=self.retried + other.retried,
+        )
+
+    @property
+    def processed(self) -> int:
+        return self.accepted + self.rejected + self.failed + self.retried
+
+
+def claim_deliveries(batch_size: int, lease: timedelta) -> list[GitHubWebhookDelivery]:
+    """
+    Claims up to batch_size pending deliveries that are unclaimed or whose claim has expired.
+    """
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    claimable = Q(status="pending") & (Q(claimed_at__isnull=True) | Q(claimed_at__lt=now - lease))
+    candidates = GitHubWebhookDelivery.objects.filter(claimable).order_by("id").values("id")[:batch_size]
+    # The claimable condition is repeated outside the subquery so that it is re-checked
+    # against rows that another worker updated concurrently.
+    GitHubWebhookDelivery.objects.filter(claimable, id__in=Subquery(candidates)).update(
+        claimed_by=token, claimed_at=now, attempts=F("attempts") + 1,
+    )
+    return list(
+        GitHubWebhookDelivery.objects.filter(claimed_by=token).order_by("id")
+        .select_related("webhook").only("id", "headers", "body", "attempts", "webhook__public_id")
+    )
+
+
+def process_delivery(delivery: GitHubWebhookDelivery, max_attempts: int) -> str:
+    """
+    Processes a claimed delivery.
+
+    Returns:
+        str: The outcome, one of "accepted", "rejected", "failed" or "retried".
+    """
+    if delivery.attempts > max_attempts:
+        logger.error("Giving up on delivery %s after %s attempts", delivery.id, max_attempts)
+        GitHubWebhookDelivery.objects.filter(id=delivery.id).update(status="failed", claimed_by="", claimed_at=None)
+        return "failed"
+
+    webhook = webhook_config_cache.get(delivery.webhook.public_id)
+    if webhook is None:
+        logger.warning("Webhook %s of delivery %s is disabled", delivery.webhook.public_id, delivery.id)
+        GitHubWebhookDelivery.objects.filter(id=delivery.id).update(status="rejected", last_error="Webhook is disabled", claimed_by="", claimed_at=None)
+        return "rejected"
+
+    try:
+        with transaction.atomic():
+            ingest_delivery(webhook, delivery.headers, bytes(delivery.body), verify=False)
+            GitHubWebhookDelivery.objects.filter(id=delivery.id).delete()
+    except ingest.DeliveryError as e:
+        GitHubWebhookDelivery.objects.filter(id=delivery.id).update(status="rejected", last_error=e.message, claimed_by="", claimed_at=None)
+        return "rejected"
+    except Exception as e: # pylint: disable=broad-exception-caught
+        # Leave the claim in place, the delivery is retried once the lease expires as it would be after a crash.
+        logger.exception("Failed to process delivery %s", delivery.id)
+        GitHubWebhookDelivery.objects.filter(id=delivery.id).update(last_error=repr(e))
+        return "retried"
+    return "accepted"
+
+
+def drain(batch_size: int = 100, lease: float = 300, max_attempts: int = 5, poll_interval: float = 1, once: bool = True) -> DrainResult:
+    """
+    Processes spooled deliveries until no claimable delivery is left, or forever unless once is set.
+
+    Args:
+        batch_size (int): The number of deliveries claimed at a time.
+        lease (float): Seconds after which a claim is considered abandoned.
+        max_attempts (int): The number of attempts before a delivery is marked as failed.
+        poll_interval (float): Seconds to wait for new deliveries when the spool is empty.
+        once (bool): Return when the spool is empty instead of polling.
+    """
+    result = DrainResult()
+    while True:
+        deliveries = claim_deliveries(batch_size, timedelta(seconds=lease))
+        if not deliveries:
+            if once:
+                return result
+            time.sleep(poll_interval)
+            continue
+        for delivery in deliveries:
+            outcome = process_delivery(delivery, max_attempts)
+            setattr(result, outcome, getattr(result, outcome) + 1)
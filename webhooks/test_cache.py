@@ -0,0 +1,83 @@
+from django.test import TestCase, override_settings
+
+from .cache import WebhookConfigCache, webhook_config_cache
+from .models import GitHubWebhook
+
+
+class WebhookConfigCacheTest(TestCase):
+    public_id = "test-public-id"
+
+    def setUp(self):
+        webhook_config_cache.clear()
+
+    def test_get_returns_config(self):
+        webhook = GitHubWebhook.objects.create(public_id=self.public_id, client_id="client-id", secret_token="secret-token")
+        config = webhook_config_cache.get(self.public_id)
+        self.assertEqual(config.id, webhook.id)
+        self.assertEqual(config.secret_token, "secret-token")
+        self.assertEqual(str(config), self.public_id)
+        self.assertNotIn("secret-token", repr(config))
+
+    def test_get_cached_config_makes_no_queries(self):
+        GitHubWebhook.objects.create(public_id=self.public_id)
+        webhook_config_cache.get(self.public_id)
+        with self.assertNumQueries(0):
+            self.assertIsNotNone(webhook_config_cache.get(self.public_id))
+
+    def test_get_unknown_or_disabled_returns_none(self):
+        GitHubWebhook.objects.create(public_id=self.public_id, enabled=False)
+        self.assertIsNone(webhook_config_cache.get(self.public_id))
+        self.assertIsNone(webhook_config_cache.get("unknown"))
+        with self.assertNumQueries(0):
+            self.assertIsNone(webhook_config_cache.get("unknown"))
+
+    def test_save_invalidates(self):
+        webhook = GitHubWebhook.objects.create(public_id=self.public_id)
+        self.assertTrue(webhook_config_cache.get(self.public_id).disallow_duplicate_deliveries)
+        webhook.disallow_duplicate_deliveries = False
+        webhook.save()
+        self.assertFalse(webhook_config_cache.get(self.public_id).disallow_duplicate_deliveries)
+        webhook.enabled = False
+        webhook.save()
+        self.assertIsNone(webhook_config_cache.get(self.public_id))
+
+    def test_delete_invalidates(self):
+        webhook = GitHubWebhook.objects.create(public_id=self.public_id)
+        self.assertIsNotNone(webhook_config_cache.get(self.public_id))
+        webhook.delete()
+        self.assertIsNone(webhook_config_cache.get(self.public_id))
+
+    def test_expired_entries_are_refetched(self):
+        cache = WebhookConfigCache(max_size=10, ttl=0)
+        GitHubWebhook.objects.create(public_id=self.public_id)
+        cache.get(self.public_id)
+        with self.assertNumQueries(1):
+            cache.get(self.public_id)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = WebhookConfigCache(max_size=2, ttl=60)
+        for public_id in ["a", "b", "a", "c"]:
+            cache.get(public_id)
+        with self.assertNumQueries(0):
+            cache.get("a")
+            cache.get("c")
+        with self.assertNumQueries(1):
+            cache.get("b")
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "test-webhook-config-version"}})
+    def test_version_stamp_invalidates_other_workers(self):
+        worker_a = WebhookConfigCache(max_size=10, ttl=60, version_alias="default")
+        worker_b = WebhookConfigCache(max_size=10, ttl=60, version_alias="default")
+        GitHubWebhook.objects.create(public_id=self.public_id)
+        worker_a.get(self.public_id)
+        worker_b.get(self.public_id)
+        worker_a.invalidate()
+        with self.assertNumQueries(1):
+            worker_b.get(self.public_id)
+        with self.assertNumQueries(0):
+            worker_b.get(self.public_id)
+
+    async def test_aget_returns_cached_config(self):
+        await GitHubWebhook.objects.acreate(public_id=self.public_id)
+        config = await webhook_config_cache.aget(self.public_id)
+        self.assertIs(await webhook_config_cache.aget(self.public_id), config)
@@ -0,0 +1,62 @@
+import json
+import unittest
+import uuid
+
+from django.test import TestCase, override_settings
+
+from .codecs import JsonResponse, get_codec, orjson
+from .models import GitHubWebhook, GitHubWebhookDelivery
+
+
+class JSONCodecTest(TestCase):
+
+    @override_settings(WEBHOOKS_JSON_CODEC="json")
+    def test_json_codec(self):
+        codec = get_codec()
+        self.assertEqual(codec.name, "json")
+        self.assertEqual(codec.loads(b'{"a": [1, "\\u00e9"]}'), {"a": [1, "é"]})
+        self.assertEqual(codec.dumps({"a": [1, "é"]}), '{"a":[1,"é"]}'.encode("utf-8"))
+
+    @unittest.skipIf(orjson is None, "orjson is not installed")
+    @override_settings(WEBHOOKS_JSON_CODEC="orjson")
+    def test_orjson_codec(self):
+        codec = get_codec()
+        self.assertEqual(codec.name, "orjson")
+        self.assertEqual(codec.loads(b'{"a": [1, "\\u00e9"]}'), {"a": [1, "é"]})
+        self.assertEqual(json.loads(codec.dumps({"a": uuid.UUID(int=0)})), {"a": "00000000-0000-0000-0000-000000000000"})
+
+    @override_settings(WEBHOOKS_JSON_CODEC="auto")
+    def test_auto_codec_prefers_orjson(self):
+        self.assertEqual(get_codec().name, "json" if orjson is None else "orjson")
+
+    def test_invalid_json_raises_value_error(self):
+        for name in ["json"] + ([] if orjson is None else ["orjson"]):
+            with self.subTest(codec=name), override_settings(WEBHOOKS_JSON_CODEC=name):
+                with self.assertRaises(ValueError):
+                    get_codec().loads(b"invalid")
+                with self.assertRaises(ValueError):
+                    get_codec().loads(b"\xff")
+
+    @override_settings(WEBHOOKS_JSON_CODEC="unknown")
+    def test_unknown_codec_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            get_codec()
+
+    def test_json_response(self):
+        response = JsonResponse(data={"status": "accepted"}, status=202)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(json.loads(response.content), {"status": "accepted"})
+
+
+class CodecJSONFieldTest(TestCase):
+
+    def test_headers_round_trip(self):
+        webhook = GitHubWebhook.objects.create(public_id="test_id")
+        headers = {"Content-Type": "application/json", "X-GitHub-Event": "installation", "nested": {"id": 1, "values": [None, True, 1.5, "é"]}}
+        for name in ["json"] + ([] if orjson is None else ["orjson"]):
+            with self.subTest(codec=name), override_settings(WEBHOOKS_JSON_CODEC=name):
+                delivery = GitHubWebhookDelivery.objects.create(webhook=webhook, headers=headers, body=b"")
+                self.assertEqual(GitHubWebhookDelivery.objects.get(pk=delivery.pk).headers, headers)
+                self.assertTrue(GitHubWebhookDelivery.objects.filter(pk=delivery.pk, **{"headers__X-GitHub-Event": "installation"}).exists())
+                self.assertEqual(GitHubWebhookDelivery.objects.filter(pk=delivery.pk).values_list("headers__nested__id", flat=True).get(), 1)
@@ -0,0 +1,143 @@
+from io import StringIO
+import json
+import unittest
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from . import codecs, compression
+from .models import GitHubWebhook, GitHubWebhookEvent, PayloadCompressionDictionary
+
+
+PAYLOAD = {
+    "action": "created",
+    "installation": {"id": 1, "account": {"login": "octocat", "url": "https://api.github.com/users/octocat"}},
+    "nested": [None, True, 1.5, "é"],
+}
+
+
+def read_raw_payload(event: GitHubWebhookEvent) -> tuple:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT payload, payload_compressed FROM webhooks_githubwebhookevent WHERE id = %s", [event.id])
+        return cursor.fetchone()
+
+
+class CompressedJSONFieldTest(TestCase):
+
+    def setUp(self):
+        compression.dictionaries.clear()
+        self.webhook = GitHubWebhook.objects.create(public_id="test_id")
+
+    def create_event(self, payload=None) -> GitHubWebhookEvent:
+        return GitHubWebhookEvent.objects.create(webhook=self.webhook, delivery_uuid=uuid.uuid4(), event="installation", payload=payload or PAYLOAD)
+
+    def test_json_column_by_default(self):
+        event = self.create_event()
+        payload, compressed = read_raw_payload(event)
+        self.assertEqual(json.loads(payload), PAYLOAD)
+        self.assertIsNone(compressed)
+        self.assertTrue(GitHubWebhookEvent.objects.filter(pk=event.pk, payload__installation__account__login="octocat").exists())
+
+    def test_round_trip(self):
+        for algorithm in ["zlib"] + ([] if compression.zstandard is None else ["zstd"]):
+            with self.subTest(algorithm=algorithm), override_settings(WEBHOOKS_PAYLOAD_COMPRESSION=algorithm):
+                event = self.create_event()
+                self.assertEqual(GitHubWebhookEvent.objects.get(pk=event.pk).payload, PAYLOAD)
+                payload, compressed = read_raw_payload(event)
+                self.assertIsNone(payload)
+                self.assertEqual(compression.get_header(compressed), (compression.get_algorithm(algorithm), 0))
+
+    @override_settings(WEBHOOKS_PAYLOAD_COMPRESSION="zlib")
+    def test_deferred_payload_loads_both_columns(self):
+        event = self.create_event()
+        event = GitHubWebhookEvent.objects.defer("payload", "payload_compressed").get(pk=event.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(event.payload, PAYLOAD)
+
+    @override_settings(WEBHOOKS_PAYLOAD_COMPRESSION="unknown")
+    def test_unknown_compression_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            self.create_event()
+
+    def test_payloads_remain_readable_when_settings_change(self):
+        with override_settings(WEBHOOKS_PAYLOAD_COMPRESSION="zlib"):
+            compressed = self.create_event()
+        uncompressed = self.create_event({"action": "created"})
+        for algorithm in [None, "zlib"]:
+            with self.subTest(algorithm=algorithm), override_settings(WEBHOOKS_PAYLOAD_COMPRESSION=algorithm):
+                self.assertEqual(
+                    [event.payload for event in GitHubWebhookEvent.objects.order_by("id")],
+                    [PAYLOAD, {"action": "created"}],
+                )
+        self.assertEqual(GitHubWebhookEvent.objects.get(pk=compressed.pk).payload, PAYLOAD)
+        self.assertEqual(GitHubWebhookEvent.objects.get(pk=uncompressed.pk).payload, {"action": "created"})
+
+    def test_save_moves_payload_to_current_column(self):
+        event = self.create_event()
+        with override_settings(WEBHOOKS_PAYLOAD_COMPRESSION="zlib"):
+            GitHubWebhookEvent.objects.get(pk=event.pk).save()
+            self.assertIsNone(read_raw_payload(event)[0])
+        GitHubWebhookEvent.objects.get(pk=event.pk).save()
+        self.assertEqual(read_raw_payload(event), (codecs.get_codec().dumps(PAYLOAD).decode("utf-8"), None))
+
+    @override_settings(WEBHOOKS_PAYLOAD_COMPRESSION="zlib")
+    def test_train_payload_dictionary(self):
+        for i in range(10):
+            self.create_event({**PAYLOAD, "number": i})
+        stdout = StringIO()
+        call_command("train_payload_dictionary", "--algorithm", "zlib", stdout=stdout)
+        dictionary = PayloadCompressionDictionary.objects.get()
+        self.assertEqual(dictionary.sample_size, 10)
+        self.assertIn(b'"login":"octocat"', bytes(dictionary.data))
+        self.assertIn(f"WEBHOOKS_PAYLOAD_COMPRESSION_DICTIONARY = {dictionary.id}", stdout.getvalue())
+
+        with override_settings(WEBHOOKS_PAYLOAD_COMPRESSION_DICTIONARY=dictionary.id):
+            event = self.create_event()
+            with_dictionary = read_raw_payload(event)[1]
+        self.assertEqual(compression.get_header(with_dictionary), (compression.ZLIB, dictionary.id))
+        self.assertLess(len(with_dictionary), len(read_raw_payload(self.create_event())[1]))
+        compression.dictionaries.clear()
+        self.assertEqual(GitHubWebhookEvent.objects.get(pk=event.pk).payload, PAYLOAD)
+
+    def test_admin_cannot_delete_dictionaries(self):
+        dictionary = PayloadCompressionDictionary.objects.create(algorithm="zlib", data=b"dictionary", sample_size=2)
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        self.assertEqual(self.client.post(f"/admin/webhooks/payloadcompressiondictionary/{dictionary.id}/delete/", {"post": "yes"}).status_code, 403)
+        self.assertTrue(PayloadCompressionDictionary.objects.exists())
+
+    def test_train_payload_dictionary_requires_events(self):
+        with self.assertRaises(CommandError):
+            call_command("train_payload_dictionary", "--algorithm", "zlib", stdout=StringIO())
+
+    @unittest.skipIf(compression.zstandard is not None, "zstandard is installed")
+    def test_zstd_requires_zstandard(self):
+        with self.assertRaises(ValueError):
+            compression.get_algorithm("zstd")
+
+    def test_compress_webhook_event_payloads(self):
+        events = [self.create_event() for _ in range(3)]
+        updated_at = GitHubWebhookEvent.objects.get(pk=events[1].pk).updated_at
+
+        with override_settings(WEBHOOKS_PAYLOAD_COMPRESSION="zlib"):
+            stdout = StringIO()
+            call_command("compress_webhook_event_payloads", "--batch-size", "2", stdout=stdout)
+            self.assertIn("Rewrote 3 of 3 payloads", stdout.getvalue())
+            for event in events:
+                payload, compressed = read_raw_payload(event)
+                self.assertIsNone(payload)
+                self.assertEqual(compression.get_header(compressed), (compression.ZLIB, 0))
+            self.assertEqual(GitHubWebhookEvent.objects.get(pk=events[1].pk).payload, PAYLOAD)
+            self.assertEqual(GitHubWebhookEvent.objects.get(pk=events[1].pk).updated_at, updated_at)
+
+            stdout = StringIO()
+            call_command("compress_webhook_event_payloads", "--start-id", str(events[0].id), stdout=stdout)
+            self.assertIn("Rewrote 0 of 2 payloads", stdout.getvalue())
+
+        stdout = StringIO()
+        call_command("compress_webhook_event_payloads", stdout=stdout)
+        self.assertIn("Rewrote 3 of 3 payloads", stdout.getvalue())
+        self.assertEqual(read_raw_payload(events[0]), (codecs.get_codec().dumps(PAYLOAD).decode("utf-8"), None))
+        self.assertEqual(GitHubWebhookEvent.objects.filter(payload__action="created").count(), 3)
@@ -0,0 +1,164 @@
+from io import StringIO
+from unittest import mock
+import uuid
+
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from . import deduplication
+from .codecs import get_codec
+from .models import GitHubWebhook, GitHubWebhookEvent, PayloadObject
+from .writer import BatchWriter
+
+
+def repository(name: str = "astra") -> dict:
+    url = f"https://api.github.com/repos/octo-org/{name}"
+    return {"id": 1, "name": name, "full_name": f"octo-org/{name}", "url": url, "hooks_url": f"{url}/hooks", "issues_url": f"{url}/issues{{/number}}"}
+
+
+def payload(name: str = "astra") -> dict:
+    return {
+        "action": "created",
+        "repository": repository(name),
+        "sender": {"login": "octocat", "id": 2, "url": "https://api.github.com/users/octocat", "html_url": "https://github.com/octocat", "repos_url": "https://api.github.com/users/octocat/repos", "type": "User"},
+        "installation": {"id": 3},
+    }
+
+
+def read_raw_payload(event: GitHubWebhookEvent):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT payload FROM webhooks_githubwebhookevent WHERE id = %s", [event.id])
+        return get_codec().loads(cursor.fetchone()[0])
+
+
+@override_settings(WEBHOOKS_PAYLOAD_DEDUPLICATED_KEYS=["repository", "organization", "sender", "installation"])
+class PayloadDeduplicationTest(TestCase):
+
+    def setUp(self):
+        deduplication.objects.clear()
+        deduplication.stored.clear()
+        self.webhook = GitHubWebhook.objects.create(public_id="test_id")
+
+    def create_event(self, data: dict) -> GitHubWebhookEvent:
+        return GitHubWebhookEvent.objects.create_delivery(self.webhook.id, str(uuid.uuid4()), False, event="installation", payload=data)
+
+    def test_sub_objects_are_stored_once(self):
+        events = [self.create_event(payload()) for _ in range(3)]
+        self.create_event(payload("other"))
+        self.assertEqual(PayloadObject.objects.filter(key="repository").count(), 2)
+        self.assertEqual(PayloadObject.objects.filter(key="sender").count(), 1)
+        # The installation is smaller than a reference.
+        self.assertFalse(PayloadObject.objects.filter(key="installation").exists())
+
+        stored = read_raw_payload(events[0])
+        self.assertTrue(deduplication.is_reference(stored["repository"]))
+        self.assertEqual(stored["installation"], {"id": 3})
+        self.assertEqual(GitHubWebhookEvent.objects.get(pk=events[0].pk).payload, payload())
+
+    def test_querysets_reassemble_payloads_in_one_query(self):
+        for name in ["astra", "astra", "other"]:
+            self.create_event(payload(name))
+        deduplication.objects.clear()
+        with self.assertNumQueries(2):
+            events = list(GitHubWebhookEvent.objects.order_by("id"))
+        with self.assertNumQueries(0):
+            self.assertEqual([event.payload for event in events], [payload(), payload(), payload("other")])
+
+    @override_settings(WEBHOOKS_PAYLOAD_COMPRESSION="zlib")
+    def test_querysets_reassemble_compressed_payloads(self):
+        for name in ["astra", "other"]:
+            self.create_event(payload(name))
+        deduplication.objects.clear()
+        with self.assertNumQueries(2):
+            events = list(GitHubWebhookEvent.objects.order_by("id"))
+        with self.assertNumQueries(0):
+            self.assertEqual([event.payload for event in events], [payload(), payload("other")])
+
+    def test_payload_is_reassembled_lazily(self):
+        event = self.create_event(payload())
+        deduplication.objects.clear()
+        with self.assertNumQueries(1):
+            event = GitHubWebhookEvent.objects.defer("payload").get(pk=event.pk)
+        with self.assertNumQueries(2):
+            self.assertEqual(event.payload, payload())
+        with self.assertNumQueries(0):
+            self.assertEqual(event.payload, payload())
+
+    def test_lookups_do_not_store_objects(self):
+        self.assertFalse(GitHubWebhookEvent.objects.filter(payload=payload()).exists())
+        self.assertFalse(PayloadObject.objects.exists())
+
+    def test_save_stores_payload_as_it_is(self):
+        event = GitHubWebhookEvent.objects.create(webhook=self.webhook, delivery_uuid=uuid.uuid4(), event="installation", payload=payload())
+        self.assertFalse(PayloadObject.objects.exists())
+        self.assertEqual(read_raw_payload(event), payload())
+
+    def test_batch_writer_deduplicates(self):
+        writer = BatchWriter(autostart=False)
+        futures = [writer.submit(self.webhook.id, str(uuid.uuid4()), False, event="installation", payload=payload()) for _ in range(3)]
+        with CaptureQueriesContext(connection) as queries:
+            writer.flush()
+        self.assertEqual(len([query for query in queries.captured_queries if "webhooks_payloadobject" in query["sql"]]), 1)
+        self.assertEqual(PayloadObject.objects.count(), 2)
+        self.assertTrue(deduplication.is_reference(read_raw_payload(futures[0].result())["repository"]))
+        self.assertEqual(futures[0].result().payload, payload())
+
+    def test_reassembled_payloads_do_not_share_objects(self):
+        first, second = self.create_event(payload()), self.create_event(payload())
+        first, second = GitHubWebhookEvent.objects.get(pk=first.pk), GitHubWebhookEvent.objects.get(pk=second.pk)
+        first.payload["repository"]["name"] = "changed"
+        self.assertEqual(second.payload["repository"]["name"], "astra")
+
+    def test_reassemble_many(self):
+        self.create_event(payload())
+        self.create_event(payload("other"))
+        deduplication.objects.clear()
+        with self.assertNumQueries(2):
+            payloads = deduplication.reassemble_many(list(GitHubWebhookEvent.objects.order_by("id").values_list("payload", flat=True)))
+        self.assertEqual(payloads, [payload(), payload("other")])
+
+    @override_settings(WEBHOOKS_PAYLOAD_DEDUPLICATED_KEYS=[])
+    def test_deduplication_disabled(self):
+        event = self.create_event(payload())
+        self.assertFalse(PayloadObject.objects.exists())
+        self.assertEqual(read_raw_payload(event), payload())
+
+    def test_sub_objects_are_stored_again_after_rollback(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.create_event(payload())
+            raise RuntimeError
+        self.assertFalse(PayloadObject.objects.exists())
+        event = self.create_event(payload())
+        self.assertEqual(PayloadObject.objects.count(), 2)
+        self.assertEqual(GitHubWebhookEvent.objects.get(pk=event.pk).payload, payload())
+
+    def test_batch_writer_fallback_keeps_extracted_columns(self):
+        writer = BatchWriter(autostart=False)
+        future = writer.submit(self.webhook.id, str(uuid.uuid4()), False, event="installation", payload=payload())
+        # As if another writer stored one of the deliveries between the lookup and the insert.
+        with mock.patch.object(GitHubWebhookEvent.objects, "bulk_create", side_effect=IntegrityError):
+            writer.flush()
+        event = GitHubWebhookEvent.objects.get(pk=future.result().pk)
+        self.assertEqual((event.installation_id, event.repository_id, event.repository_full_name, event.sender_login), (3, 1, "octo-org/astra", "octocat"))
+        self.assertEqual(event.payload, payload())
+
+    def test_stored_sub_objects_are_remembered_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_event(payload())
+        with CaptureQueriesContext(connection) as queries:
+            self.create_event(payload())
+        self.assertFalse([query for query in queries.captured_queries if "webhooks_payloadobject" in query["sql"]])
+
+    def test_compress_webhook_event_payloads_deduplicates(self):
+        event = self.create_event({"action": "created"})
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE webhooks_githubwebhookevent SET payload = %s WHERE id = %s", [get_codec().dumps(payload()).decode("utf-8"), event.id])
+        self.assertEqual(read_raw_payload(event), payload())
+
+        call_command("compress_webhook_event_payloads", stdout=StringIO())
+        self.assertEqual(read_raw_payload(event), payload())
+        call_command("compress_webhook_event_payloads", "--all", stdout=StringIO())
+        self.assertTrue(deduplication.is_reference(read_raw_payload(event)["repository"]))
+        self.assertEqual(GitHubWebhookEvent.objects.get(pk=event.pk).payload, payload())
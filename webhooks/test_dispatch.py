@@ -0,0 +1,131 @@
+import json
+import uuid
+
+from django.test import Client, TestCase, override_settings
+
+from .cache import webhook_config_cache
+from .dispatch import HandlerRegistry, registry
+from .ingest import DeliveryError
+from .models import GitHubWebhook, GitHubWebhookEvent
+
+
+def noop(webhook, event, action, delivery, payload):
+    pass
+
+
+class HandlerRegistryTest(TestCase):
+
+    def setUp(self):
+        self.registry = HandlerRegistry()
+
+    def test_get_prefers_exact_action_over_wildcard(self):
+        self.registry.register("issues", "opened")(noop)
+        self.registry.register("issues")(lambda *args: None)
+        self.assertEqual(self.registry.get("issues", "opened").action, "opened")
+        self.assertEqual(self.registry.get("issues", "closed").action, "*")
+        self.assertIsNone(self.registry.get("push", ""))
+        self.assertTrue(self.registry.handles_event("issues"))
+        self.assertFalse(self.registry.handles_event("push"))
+
+    def test_register_twice_raises_value_error(self):
+        self.registry.register("issues", "opened")(noop)
+        with self.assertRaises(ValueError):
+            self.registry.register("issues", "opened")(noop)
+
+    def test_unregister(self):
+        self.registry.register("issues", "opened")(noop)
+        self.registry.unregister("issues", "opened")
+        self.assertIsNone(self.registry.get("issues", "opened"))
+        self.assertFalse(self.registry.handles_event("issues"))
+
+    def test_handler_counts_calls_errors_and_time(self):
+        def failing(webhook, event, action, delivery, payload):
+            raise RuntimeError("boom")
+
+        self.registry.register("issues", "opened")(noop)
+        self.registry.register("issues", "closed")(failing)
+        self.registry.get("issues", "opened")(None, "issues", "opened", {}, {})
+        with self.assertRaises(RuntimeError):
+            self.registry.get("issues", "closed")(None, "issues", "closed", {}, {})
+        opened, closed = self.registry.get("issues", "opened"), self.registry.get("issues", "closed")
+        self.assertEqual((opened.calls, opened.errors), (1, 0))
+        self.assertEqual((closed.calls, closed.errors), (1, 1))
+        self.assertGreater(opened.total_time, 0)
+        self.assertEqual(opened.name, "webhooks.test_dispatch.noop")
+
+    @override_settings(WEBHOOKS_SLOW_HANDLER_THRESHOLD=0)
+    def test_slow_handler_is_logged(self):
+        self.registry.register("issues", "opened")(noop)
+        with self.assertLogs("astra.webhooks.dispatch", level="WARNING") as logs:
+            self.registry.get("issues", "opened")(None, "issues", "opened", {}, {})
+        self.assertIn("Slow handler webhooks.test_dispatch.noop", logs.output[0])
+
+    def test_installation_handlers_are_discovered(self):
+        for action in ["created", "deleted", "new_permissions_accepted", "suspend", "unsuspend"]:
+            self.assertEqual(registry.get("installation", action).action, action)
+
+
+class DispatchViewTest(TestCase):
+    public_id = "test-public-id"
+    url = f"/webhooks/github/{public_id}/handle"
+
+    def setUp(self):
+        self.client = Client()
+        webhook_config_cache.clear()
+        GitHubWebhook.objects.create(public_id=self.public_id)
+
+    def post(self, event: str, action: str):
+        delivery_uuid = str(uuid.uuid4())
+        headers = {"X-GitHub-Delivery": delivery_uuid, "X-GitHub-Event": event}
+        return self.client.post(self.url, data=json.dumps({delivery_uuid: {"action": action}}), content_type="application/json", headers=headers)
+
+    def register(self, event: str, action: str, func):
+        registry.register(event, action)(func)
+        self.addCleanup(registry.unregister, event, action)
+
+    def test_registered_wildcard_handler_receives_delivery(self):
+        calls = []
+        self.register("issues", "*", lambda webhook, event, action, delivery, payload: calls.append((str(webhook), event, action)))
+        self.assertEqual(self.post("issues", "opened").status_code, 202)
+        self.assertEqual(calls, [(self.public_id, "issues", "opened")])
+        self.assertEqual(GitHubWebhookEvent.objects.get().action, "opened")
+
+    def test_unsupported_action_returns_400(self):
+        response = self.post("installation", "unknown")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": {"code": 400, "message": "Unsupported action"}})
+
+    def test_handler_can_reject_delivery(self):
+        def reject(webhook, event, action, delivery, payload):
+            raise DeliveryError(422, "Rejected by handler")
+
+        self.register("issues", "opened", reject)
+        response = self.post("issues", "opened")
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.json(), {"error": {"code": 422, "message": "Rejected by handler"}})
+        self.assertFalse(GitHubWebhookEvent.objects.exists())
+
+    def test_rejected_delivery_rolls_back_handler_writes(self):
+        def reject(webhook, event, action, delivery, payload):
+            GitHubWebhook.objects.create(public_id="created-by-handler")
+            raise DeliveryError(422, "Rejected by handler")
+
+        self.register("issues", "opened", reject)
+        self.assertEqual(self.post("issues", "opened").status_code, 422)
+        self.assertFalse(GitHubWebhook.objects.filter(public_id="created-by-handler").exists())
+        self.assertFalse(GitHubWebhookEvent.objects.exists())
+
+    def test_handler_can_use_the_orm(self):
+        def count_events(webhook, event, action, delivery, payload):
+            counts.append(GitHubWebhookEvent.objects.filter(webhook_id=webhook.id).count())
+
+        counts = []
+        self.register("issues", "opened", count_events)
+        self.assertEqual(self.post("issues", "opened").status_code, 202)
+        self.assertEqual(counts, [1])
+
+
+# Runs the view tests above against the native async view served by config/asgi.py.
+@override_settings(ROOT_URLCONF="config.asgi_urls")
+class AsyncDispatchViewTest(DispatchViewTest):
+    pass
@@ -0,0 +1,68 @@
+from datetime import timedelta
+import gzip
+import io
+from io import StringIO
+import json
+from pathlib import Path
+import tempfile
+from unittest import mock
+import uuid
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from .models import GitHubWebhook, GitHubWebhookEvent
+
+
+class ExportWebhookEventsTest(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.webhook = GitHubWebhook.objects.create(public_id="test_id")
+        self.other_webhook = GitHubWebhook.objects.create(public_id="other_id")
+
+    def create_event(self, webhook: GitHubWebhook, event: str = "push", action: str = "", days_old: int = 0) -> GitHubWebhookEvent:
+        github_webhook_event = GitHubWebhookEvent.objects.create(webhook=webhook, delivery_uuid=uuid.uuid4(), event=event, action=action, payload={"event": event})
+        GitHubWebhookEvent.objects.filter(pk=github_webhook_event.pk).update(created_at=self.now - timedelta(days=days_old))
+        return github_webhook_event
+
+    def export(self, *args, filename: str = "events.jsonl") -> list[dict]:
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / filename
+            call_command("export_webhook_events", "--output", str(path), *args, stderr=StringIO())
+            opener = gzip.open if filename.endswith(".gz") else open
+            with opener(path, "rb") as f:
+                return [json.loads(line) for line in f]
+
+    def test_export_all_events_in_batches(self):
+        events = [self.create_event(self.webhook) for _ in range(5)]
+        records = self.export("--batch-size", "2")
+        self.assertEqual([record["id"] for record in records], [event.id for event in events])
+        self.assertEqual(records[0]["webhook"], "test_id")
+        self.assertEqual(records[0]["delivery_uuid"], str(events[0].delivery_uuid))
+        self.assertEqual(records[0]["payload"], {"event": "push"})
+
+    def test_filters(self):
+        expected = self.create_event(self.webhook, event="installation", action="created", days_old=2)
+        self.create_event(self.other_webhook, event="installation", action="created", days_old=2)
+        self.create_event(self.webhook, event="push", days_old=2)
+        self.create_event(self.webhook, event="installation", action="deleted", days_old=2)
+        self.create_event(self.webhook, event="installation", action="created", days_old=5)
+        self.create_event(self.webhook, event="installation", action="created")
+        records = self.export(
+            "--webhook", "test_id", "--event", "installation", "--action", "created",
+            "--since", (self.now - timedelta(days=3)).isoformat(), "--until", (self.now - timedelta(days=1)).date().isoformat(),
+        )
+        self.assertEqual([record["id"] for record in records], [expected.id])
+
+    def test_compressed_export(self):
+        event = self.create_event(self.webhook)
+        self.assertEqual([record["id"] for record in self.export(filename="events.jsonl.gz")], [event.id])
+
+    def test_export_to_stdout(self):
+        event = self.create_event(self.webhook)
+        stdout = io.TextIOWrapper(io.BytesIO())
+        with mock.patch("sys.stdout", stdout):
+            call_command("export_webhook_events", stderr=StringIO())
+        self.assertEqual([json.loads(line)["id"] for line in stdout.buffer.getvalue().splitlines()], [event.id])
@@ -0,0 +1,94 @@
+from io import StringIO
+import uuid
+
+from django.contrib.admin.sites import site
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+
+from . import extraction
+from .models import GitHubWebhook, GitHubWebhookEvent
+from .writer import BatchWriter
+
+
+PAYLOAD = {
+    "action": "opened",
+    "installation": {"id": 42, "node_id": "MDIzOkludGVncmF0aW9uSW5zdGFsbGF0aW9uNDI="},
+    "repository": {"id": 1296269, "full_name": "octocat/Hello-World", "private": False, "description": "x" * 200},
+    "sender": {"login": "octocat", "id": 1, "type": "User", "site_admin": False, "url": "https://api.github.com/users/octocat"},
+}
+
+
+class ExtractTest(TestCase):
+
+    def test_extract(self):
+        self.assertEqual(extraction.extract(PAYLOAD), {
+            "installation_id": 42,
+            "repository_id": 1296269,
+            "repository_full_name": "octocat/Hello-World",
+            "sender_login": "octocat",
+        })
+
+    def test_missing_and_mistyped_values_are_left_out(self):
+        self.assertEqual(extraction.extract({"installation": {"id": "42"}, "repository": "octocat/Hello-World", "sender": {"login": "octocat"}}), {"sender_login": "octocat"})
+        self.assertEqual(extraction.extract([]), {})
+
+    @override_settings(WEBHOOKS_EXTRACTED_FIELDS={"sender_login": "sender.login"})
+    def test_configured_fields(self):
+        self.assertEqual(extraction.extract(PAYLOAD), {"sender_login": "octocat"})
+
+    @override_settings(WEBHOOKS_EXTRACTED_FIELDS={"organization_login": "organization.login"})
+    def test_unknown_field_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            extraction.extract(PAYLOAD)
+
+
+class ExtractedColumnsTest(TestCase):
+
+    def setUp(self):
+        self.webhook = GitHubWebhook.objects.create(public_id="test-public-id")
+
+    def test_create_delivery_populates_columns(self):
+        event = GitHubWebhookEvent.objects.create_delivery(self.webhook.id, str(uuid.uuid4()), False, event="pull_request", payload=PAYLOAD)
+        event.refresh_from_db()
+        self.assertEqual((event.installation_id, event.repository_id, event.repository_full_name, event.sender_login), (42, 1296269, "octocat/Hello-World", "octocat"))
+
+    def test_batch_writer_populates_columns(self):
+        batch_writer = BatchWriter(autostart=False)
+        future = batch_writer.submit(self.webhook.id, str(uuid.uuid4()), False, event="pull_request", payload=PAYLOAD)
+        batch_writer.flush()
+        self.assertEqual(GitHubWebhookEvent.objects.get(id=future.result().id).sender_login, "octocat")
+
+    def test_backfill_webhook_event_fields(self):
+        events = [
+            GitHubWebhookEvent.objects.create(webhook=self.webhook, delivery_uuid=uuid.uuid4(), event="pull_request", payload=payload)
+            for payload in [PAYLOAD, {"zen": "Keep it logically awesome."}, PAYLOAD]
+        ]
+        stdout = StringIO()
+        call_command("backfill_webhook_event_fields", batch_size=2, stdout=stdout)
+        self.assertIn("Updated 2 events", stdout.getvalue())
+        self.assertEqual(
+            list(GitHubWebhookEvent.objects.order_by("id").values_list("installation_id", "sender_login")),
+            [(42, "octocat"), (None, ""), (42, "octocat")],
+        )
+        self.assertEqual(events[0].payload, PAYLOAD)
+
+        stdout = StringIO()
+        call_command("backfill_webhook_event_fields", start_id=events[1].id, stdout=stdout)
+        self.assertIn("Updated 0 events", stdout.getvalue())
+
+    def test_admin_search_uses_extracted_columns(self):
+        GitHubWebhookEvent.objects.create_delivery(self.webhook.id, str(uuid.uuid4()), False, event="pull_request", payload=PAYLOAD)
+        GitHubWebhookEvent.objects.create_delivery(self.webhook.id, str(uuid.uuid4()), False, event="ping", payload={"zen": "Design for failure."})
+        model_admin = site._registry[GitHubWebhookEvent]
+        request = RequestFactory().get("/")
+        request.user = User(is_superuser=True, is_staff=True)
+        delivery_uuid = str(GitHubWebhookEvent.objects.get(event="ping").delivery_uuid)
+        for term, count in [("octocat", 1), ("octocat/Hello-World", 1), ("42", 1), (delivery_uuid, 1), ("ping", 1), (self.webhook.public_id, 2), ("octo", 0), ("Octocat", 0), ("99999999999999999999", 0)]:
+            queryset, _ = model_admin.get_search_results(request, GitHubWebhookEvent.objects.all(), term)
+            self.assertEqual(queryset.count(), count, term)
+            if connection.vendor == "sqlite":
+                # Each column is looked up through its index instead of scanning the table.
+                plan = queryset.explain()
+                self.assertNotIn("SCAN webhooks_githubwebhookevent", plan, term)
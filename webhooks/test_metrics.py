@@ -0,0 +1,104 @@
+import json
+import uuid
+
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+
+from . import metrics
+from .cache import recent_deliveries, webhook_config_cache
+from .models import GitHubWebhook
+
+
+class HistogramTest(SimpleTestCase):
+
+    def test_render_cumulative_buckets(self):
+        histogram = metrics.Histogram("test_seconds", "Test.", ["stage"], buckets=(0.1, 1.0))
+        for value in [0.05, 0.5, 0.5, 5.0]:
+            histogram.observe(value, "parse")
+        self.assertEqual(histogram.render(), [
+            "# HELP test_seconds Test.",
+            "# TYPE test_seconds histogram",
+            "test_seconds_bucket{stage=\"parse\",le=\"0.1\"} 1",
+            "test_seconds_bucket{stage=\"parse\",le=\"1.0\"} 3",
+            "test_seconds_bucket{stage=\"parse\",le=\"+Inf\"} 4",
+            "test_seconds_sum{stage=\"parse\"} 6.05",
+            "test_seconds_count{stage=\"parse\"} 4",
+        ])
+
+    def test_labels_are_escaped(self):
+        counter = metrics.Counter("test_total", "Test.", ["event"])
+        counter.inc("a\"b\\c\nd")
+        self.assertEqual(counter.render()[-1], "test_total{event=\"a\\\"b\\\\c\\nd\"} 1")
+
+    def test_series_past_limit_are_aggregated(self):
+        counter = metrics.Counter("test_total", "Test.", ["event"])
+        for i in range(metrics.MAX_SERIES + 5):
+            counter.inc(f"event-{i}")
+        self.assertEqual(counter.get(metrics.OTHER), 5)
+        self.assertEqual(counter.get("event-0"), 1)
+
+
+class InstrumentedViewTest(TestCase):
+    public_id = "test-public-id"
+    url = f"/webhooks/github/{public_id}/handle"
+
+    def setUp(self):
+        self.client = Client()
+        webhook_config_cache.clear()
+        recent_deliveries.clear()
+        metrics.clear()
+        self.addCleanup(metrics.clear)
+        GitHubWebhook.objects.create(public_id=self.public_id)
+
+    def post(self, url: str | None = None, event: str = "installation"):
+        delivery_uuid = str(uuid.uuid4())
+        headers = {"X-GitHub-Delivery": delivery_uuid, "X-GitHub-Event": event}
+        data = json.dumps({delivery_uuid: {"action": "created"}})
+        return self.client.post(url or self.url, data=data, content_type="application/json", headers=headers)
+
+    def test_disabled_by_default(self):
+        response = self.post()
+        self.assertEqual(response.status_code, 202)
+        self.assertNotIn("Server-Timing", response.headers)
+        self.assertEqual(metrics.requests_total.get(self.public_id, "installation", "202"), 0)
+        self.assertEqual(self.client.get("/webhooks/metrics").status_code, 404)
+
+    @override_settings(WEBHOOKS_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = self.post()
+        stages = [metric.split(";")[0] for metric in response.headers["Server-Timing"].split(", ")]
+        self.assertEqual(stages, ["lookup", "verify", "duplicate", "parse", "insert", "handler", "total"])
+        self.assertEqual(metrics.requests_total.get(self.public_id, "installation", "202"), 0)
+
+    @override_settings(WEBHOOKS_METRICS=True)
+    def test_requests_are_aggregated(self):
+        self.post()
+        self.post()
+        self.post(url="/webhooks/github/unknown/handle", event="forged")
+        self.assertNotIn("Server-Timing", self.post().headers)
+        self.assertEqual(metrics.requests_total.get(self.public_id, "installation", "202"), 3)
+        self.assertEqual(metrics.requests_total.get("", "", "404"), 1)
+        self.assertEqual(metrics.request_duration.get(self.public_id, "installation", "202")[1], 3)
+        self.assertEqual(metrics.stage_duration.get("insert")[1], 3)
+        self.assertEqual(metrics.stage_duration.get("lookup")[1], 4)
+
+    @override_settings(WEBHOOKS_METRICS=True)
+    def test_metrics_endpoint(self):
+        self.post()
+        response = self.client.get("/webhooks/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Content-Type"], "text/plain; version=0.0.4; charset=utf-8")
+        content = response.content.decode()
+        self.assertIn(f"webhooks_requests_total{{webhook=\"{self.public_id}\",event=\"installation\",status=\"202\"}} 1\n", content)
+        self.assertIn("# TYPE webhooks_stage_duration_seconds histogram\n", content)
+        self.assertIn("webhooks_handler_calls_total{event=\"installation\",action=\"created\"", content)
+        self.assertIn("webhooks_config_cache_requests_total{result=\"miss\"}", content)
+
+    @override_settings(WEBHOOKS_METRICS=True, WEBHOOKS_METRICS_ALLOWED_IPS=["10.0.0.1"])
+    def test_metrics_endpoint_rejects_other_clients(self):
+        self.assertEqual(self.client.get("/webhooks/metrics").status_code, 404)
+
+
+# Runs the tests above against the native async view served by config/asgi.py.
+@override_settings(ROOT_URLCONF="config.asgi_urls")
+class AsyncInstrumentedViewTest(InstrumentedViewTest):
+    pass
@@ -1,5 +1,8 @@
+import uuid
+
+from django.db import IntegrityError
 from django.test import TestCase
-from .models import GitHubWebhook
+from .models import GitHubWebhook, GitHubWebhookEvent
 
 class GitHubWebhookModelTest(TestCase):
 
@@ -16,3 +19,42 @@ class GitHubWebhookModelTest(TestCase):
     def test_default_enabled(self):
         webhook = GitHubWebhook.objects.create(public_id="another_test_id")
         self.assertTrue(webhook.enabled)
+
+
+class GitHubWebhookEventManagerTest(TestCase):
+
+    def setUp(self):
+        self.webhook = GitHubWebhook.objects.create(public_id="test_id")
+        self.delivery_uuid = str(uuid.uuid4())
+
+    def test_create_delivery_returns_event(self):
+        event = GitHubWebhookEvent.objects.create_delivery(self.webhook.id, self.delivery_uuid, False, event="installation", payload={})
+        self.assertEqual(event.webhook, self.webhook)
+        self.assertFalse(event.is_redelivery)
+
+    def test_create_delivery_duplicate_returns_none(self):
+        GitHubWebhookEvent.objects.create_delivery(self.webhook.id, self.delivery_uuid, False, event="installation", payload={})
+        self.assertIsNone(GitHubWebhookEvent.objects.create_delivery(self.webhook.id, self.delivery_uuid, False, event="installation", payload={}))
+        self.assertEqual(GitHubWebhookEvent.objects.count(), 1)
+
+    def test_create_delivery_duplicate_allowed_stores_redelivery(self):
+        GitHubWebhookEvent.objects.create_delivery(self.webhook.id, self.delivery_uuid, True, event="installation", payload={})
+        event = GitHubWebhookEvent.objects.create_delivery(self.webhook.id, self.delivery_uuid, True, event="installation", payload={})
+        self.assertTrue(event.is_redelivery)
+        self.assertEqual(GitHubWebhookEvent.objects.count(), 2)
+
+    def test_unique_delivery_per_webhook(self):
+        GitHubWebhookEvent.objects.create(webhook=self.webhook, delivery_uuid=self.delivery_uuid, event="installation", payload={})
+        other_webhook = GitHubWebhook.objects.create(public_id="other_id")
+        GitHubWebhookEvent.objects.create(webhook=other_webhook, delivery_uuid=self.delivery_uuid, event="installation", payload={})
+        with self.assertRaises(IntegrityError):
+            GitHubWebhookEvent.objects.create(webhook=self.webhook, delivery_uuid=self.delivery_uuid, event="installation", payload={})
+
+    async def test_acreate_delivery(self):
+        event = await GitHubWebhookEvent.objects.acreate_delivery(self.webhook.id, self.delivery_uuid, False, event="installation", payload={"repository": {"id": 1}})
+        self.assertFalse(event.is_redelivery)
+        self.assertEqual(event.repository_id, 1)
+        self.assertIsNone(await GitHubWebhookEvent.objects.acreate_delivery(self.webhook.id, self.delivery_uuid, False, event="installation", payload={}))
+        redelivery = await GitHubWebhookEvent.objects.acreate_delivery(self.webhook.id, self.delivery_uuid, True, event="installation", payload={})
+        self.assertTrue(redelivery.is_redelivery)
+        self.assertEqual(await GitHubWebhookEvent.objects.acount(), 2)
@@ -0,0 +1,116 @@
+import hashlib
+import hmac
+import json
+from unittest import mock
+import uuid
+
+from django.core.cache import caches
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+
+from . import ingest, ratelimit
+from .cache import recent_deliveries, webhook_config_cache
+from .models import GitHubWebhook, GitHubWebhookEvent
+from .ratelimit import CacheLimiter, TokenBucketLimiter
+
+
+class TokenBucketLimiterTest(SimpleTestCase):
+
+    def test_burst_then_refill(self):
+        limiter = TokenBucketLimiter()
+        with mock.patch("time.monotonic", return_value=100.0):
+            self.assertEqual([limiter.acquire("a", 0.5, 2) for _ in range(3)], [0.0, 0.0, 2.0])
+            self.assertEqual(limiter.acquire("b", 0.5, 2), 0.0)
+        with mock.patch("time.monotonic", return_value=101.0):
+            self.assertEqual(limiter.acquire("a", 0.5, 2), 1.0)
+        with mock.patch("time.monotonic", return_value=102.0):
+            self.assertEqual(limiter.acquire("a", 0.5, 2), 0.0)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "test-webhook-ratelimit"}})
+class CacheLimiterTest(SimpleTestCase):
+
+    def setUp(self):
+        caches["default"].clear()
+
+    def test_counts_per_window(self):
+        limiter = CacheLimiter("default")
+        with mock.patch("time.time", return_value=1000.0):
+            self.assertEqual([limiter.acquire("a", 1, 2) for _ in range(3)], [0.0, 0.0, 2.0])
+        with mock.patch("time.time", return_value=1002.5):
+            self.assertEqual(limiter.acquire("a", 1, 2), 0.0)
+
+
+class RateLimitedViewTest(TestCase):
+    public_id = "test-public-id"
+    url = f"/webhooks/github/{public_id}/handle"
+
+    def setUp(self):
+        self.client = Client()
+        webhook_config_cache.clear()
+        recent_deliveries.clear()
+        ratelimit.local_limiter.clear()
+        self.webhook = GitHubWebhook.objects.create(public_id=self.public_id, rate_limit=60, rate_limit_burst=2)
+
+    def post(self, secret_token: str | None = None):
+        delivery_uuid = str(uuid.uuid4())
+        headers = {"X-GitHub-Delivery": delivery_uuid, "X-GitHub-Event": "installation"}
+        data = json.dumps({delivery_uuid: {"action": "created"}})
+        if secret_token:
+            signature = hmac.new(secret_token.encode("utf-8"), data.encode("utf-8"), hashlib.sha256).hexdigest()
+            headers["X-Hub-Signature-256"] = f"sha256={signature}"
+        return self.client.post(self.url, data=data, content_type="application/json", headers=headers)
+
+    def test_over_limit_deliveries_get_429_before_they_are_parsed(self):
+        self.assertEqual([self.post().status_code for _ in range(2)], [202, 202])
+        with mock.patch.object(ingest, "parse_delivery") as parse_delivery:
+            response = self.post()
+        parse_delivery.assert_not_called()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "1")
+        self.assertEqual(response.json(), {"error": {"code": 429, "message": "Rate limit exceeded"}})
+        self.assertEqual(GitHubWebhookEvent.objects.count(), 2)
+
+    def test_forged_deliveries_are_not_charged(self):
+        self.webhook.secret_token = "test-secret-token"
+        self.webhook.save()
+        self.assertEqual({self.post("forged-secret-token").status_code for _ in range(5)}, {403})
+        self.assertEqual([self.post("test-secret-token").status_code for _ in range(3)], [202, 202, 429])
+
+    @override_settings(WEBHOOKS_RATE_LIMIT=1)
+    def test_default_rate_limit(self):
+        GitHubWebhook.objects.filter(id=self.webhook.id).update(rate_limit=None, rate_limit_burst=None)
+        responses = [self.post() for _ in range(2)]
+        self.assertEqual([response.status_code for response in responses], [202, 429])
+        self.assertEqual(responses[1].headers["Retry-After"], "60")
+
+    def test_not_limited_by_default(self):
+        GitHubWebhook.objects.filter(id=self.webhook.id).update(rate_limit=None, rate_limit_burst=None)
+        self.assertEqual({self.post().status_code for _ in range(5)}, {202})
+
+    @override_settings(
+        CACHES={"shared": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "test-webhook-ratelimit-shared"}},
+        WEBHOOKS_RATE_LIMIT_CACHE_ALIAS="shared",
+    )
+    def test_shared_rate_limit(self):
+        caches["shared"].clear()
+        # In one window, the deliveries would otherwise be counted in two when they straddle its end.
+        with mock.patch("time.time", return_value=1000.0):
+            self.assertEqual([self.post().status_code for _ in range(3)], [202, 202, 429])
+        self.assertEqual(len(ratelimit.local_limiter._buckets), 0)
+
+    @override_settings(WEBHOOKS_MAX_IN_FLIGHT=2)
+    def test_deliveries_past_max_in_flight_get_429(self):
+        ratelimit.in_flight.count = 2
+        self.addCleanup(setattr, ratelimit.in_flight, "count", 0)
+        response = self.post()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "1")
+        ratelimit.in_flight.count = 1
+        self.assertEqual(self.post().status_code, 202)
+        self.assertEqual(ratelimit.in_flight.count, 1)
+
+
+# Runs the tests above against the native async view served by config/asgi.py.
+@override_settings(ROOT_URLCONF="config.asgi_urls")
+class AsyncRateLimitedViewTest(RateLimitedViewTest):
+    pass
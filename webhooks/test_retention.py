@@ -0,0 +1,108 @@
+from datetime import timedelta
+import gzip
+from io import StringIO
+import json
+from pathlib import Path
+import tempfile
+import uuid
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .management.commands.prune_webhook_events import PENDING_FILE
+from .models import GitHubWebhook, GitHubWebhookEvent
+from .retention import get_expired_events
+
+
+class EventsTestCase(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.webhook = GitHubWebhook.objects.create(public_id="test_id")
+
+    def create_event(self, days_old: int, event: str = "push", webhook: GitHubWebhook | None = None) -> GitHubWebhookEvent:
+        github_webhook_event = GitHubWebhookEvent.objects.create(
+            webhook=webhook or self.webhook, delivery_uuid=uuid.uuid4(), event=event, payload={"days_old": days_old},
+        )
+        GitHubWebhookEvent.objects.filter(pk=github_webhook_event.pk).update(created_at=self.now - timedelta(days=days_old))
+        return github_webhook_event
+
+
+class RetentionTest(EventsTestCase):
+
+    def assertExpired(self, expected: list[GitHubWebhookEvent], **kwargs):
+        self.assertQuerySetEqual(get_expired_events(self.now, **kwargs).order_by("id"), expected)
+
+    def test_events_are_kept_forever_by_default(self):
+        self.create_event(1000)
+        self.assertExpired([])
+
+    @override_settings(WEBHOOKS_EVENT_RETENTION_DAYS=30, WEBHOOKS_EVENT_RETENTION_DAYS_BY_EVENT={"installation": None, "ping": 1})
+    def test_retention_windows(self):
+        expired = self.create_event(31)
+        self.create_event(29)
+        self.create_event(1000, event="installation")
+        ping = self.create_event(2, event="ping")
+        webhook = GitHubWebhook.objects.create(public_id="other_id", retention_days=60)
+        self.create_event(31, webhook=webhook)
+        self.create_event(31, event="ping", webhook=webhook)
+        other_expired = self.create_event(61, event="installation", webhook=webhook)
+        self.assertExpired([expired, ping, other_expired])
+
+    def test_overrides(self):
+        expired = self.create_event(11)
+        self.create_event(9)
+        push = self.create_event(6, event="installation")
+        self.assertExpired([expired, push], default_days=10, days_by_event={"installation": 5})
+
+
+@override_settings(WEBHOOKS_EVENT_RETENTION_DAYS=30)
+class PruneWebhookEventsTest(EventsTestCase):
+
+    def test_prune_webhook_events(self):
+        for _ in range(5):
+            self.create_event(31)
+        kept = self.create_event(29)
+        stdout = StringIO()
+        call_command("prune_webhook_events", "--batch-size", "2", "--sleep", "0", stdout=stdout)
+        self.assertQuerySetEqual(GitHubWebhookEvent.objects.all(), [kept])
+        self.assertIn("Deleted 4 events", stdout.getvalue())
+        self.assertIn("Deleted 5 events", stdout.getvalue())
+
+    def test_dry_run(self):
+        self.create_event(31)
+        stdout = StringIO()
+        call_command("prune_webhook_events", "--dry-run", stdout=stdout)
+        self.assertIn("1 expired events", stdout.getvalue())
+        self.assertEqual(GitHubWebhookEvent.objects.count(), 1)
+
+    def test_archive(self):
+        first, second = self.create_event(31), self.create_event(32)
+        self.create_event(29)
+        with tempfile.TemporaryDirectory() as directory:
+            call_command("prune_webhook_events", "--archive-dir", directory, "--sleep", "0", stdout=StringIO())
+            files = sorted(Path(directory).iterdir())
+            self.assertEqual([path.name for path in files], [
+                f"github_webhook_events-{timezone.localdate(self.now - timedelta(days=32)).isoformat()}.jsonl.gz",
+                f"github_webhook_events-{timezone.localdate(self.now - timedelta(days=31)).isoformat()}.jsonl.gz",
+            ])
+            records = [json.loads(line) for path in files for line in gzip.open(path)]
+        self.assertEqual([(record["id"], record["webhook"], record["payload"]) for record in records], [
+            (second.id, "test_id", {"days_old": 32}), (first.id, "test_id", {"days_old": 31}),
+        ])
+        self.assertEqual(records[0]["delivery_uuid"], str(second.delivery_uuid))
+        self.assertEqual(GitHubWebhookEvent.objects.count(), 1)
+
+    def test_resume_after_interruption(self):
+        archived = self.create_event(31)
+        expired = self.create_event(31)
+        with tempfile.TemporaryDirectory() as directory:
+            (Path(directory) / PENDING_FILE).write_text(json.dumps([archived.id]), encoding="utf-8")
+            stdout = StringIO()
+            call_command("prune_webhook_events", "--archive-dir", directory, "--sleep", "0", stdout=stdout)
+            self.assertIn("Resuming: deleting 1 events", stdout.getvalue())
+            self.assertFalse((Path(directory) / PENDING_FILE).exists())
+            records = [json.loads(line) for path in Path(directory).glob("*.jsonl.gz") for line in gzip.open(path)]
+        self.assertEqual([record["id"] for record in records], [expired.id])
+        self.assertFalse(GitHubWebhookEvent.objects.exists())
@@ -0,0 +1,127 @@
+from datetime import timedelta
+from io import StringIO
+import json
+from unittest import mock
+import uuid
+
+from django.core.management import call_command
+from django.db import OperationalError
+from django.test import Client, TestCase, override_settings
+from django.utils import timezone
+
+from .cache import recent_deliveries, webhook_config_cache
+from .models import GitHubWebhook, GitHubWebhookDelivery, GitHubWebhookEvent
+from .spool import claim_deliveries, drain
+
+
+def delivery_headers(delivery_uuid: str, event: str = "installation") -> dict:
+    return {"Content-Type": "application/json", "X-Github-Delivery": delivery_uuid, "X-Github-Event": event}
+
+
+def delivery_body(delivery_uuid: str, action: str = "created") -> bytes:
+    return json.dumps({delivery_uuid: {"action": action}}).encode("utf-8")
+
+
+@override_settings(WEBHOOKS_INGEST_MODE="spool")
+class SpoolViewTest(TestCase):
+    public_id = "test-public-id"
+    url = f"/webhooks/github/{public_id}/handle"
+
+    def setUp(self):
+        self.client = Client()
+        webhook_config_cache.clear()
+
+    def test_handle_github_webhook_event_spools_delivery(self):
+        webhook = GitHubWebhook.objects.create(public_id=self.public_id)
+        webhook_config_cache.get(self.public_id)
+        delivery_uuid = str(uuid.uuid4())
+        headers = {"X-GitHub-Delivery": delivery_uuid, "X-GitHub-Event": "installation"}
+        with self.assertNumQueries(1):
+            response = self.client.post(self.url, data=delivery_body(delivery_uuid), content_type="application/json", headers=headers)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {"status": "accepted"})
+        self.assertFalse(GitHubWebhookEvent.objects.exists())
+        delivery = GitHubWebhookDelivery.objects.get()
+        self.assertEqual(delivery.webhook, webhook)
+        self.assertEqual(delivery.headers["X-Github-Delivery"], delivery_uuid)
+        self.assertEqual(bytes(delivery.body), delivery_body(delivery_uuid))
+
+    def test_handle_github_webhook_event_disabled_returns_404(self):
+        GitHubWebhook.objects.create(public_id=self.public_id, enabled=False)
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(GitHubWebhookDelivery.objects.exists())
+
+
+class DrainTest(TestCase):
+
+    def setUp(self):
+        webhook_config_cache.clear()
+        recent_deliveries.clear()
+        self.webhook = GitHubWebhook.objects.create(public_id="test-public-id")
+
+    def spool(self, delivery_uuid: str, **kwargs) -> GitHubWebhookDelivery:
+        return GitHubWebhookDelivery.objects.create(
+            webhook=self.webhook, headers=delivery_headers(delivery_uuid), body=delivery_body(delivery_uuid), **kwargs,
+        )
+
+    def test_drain_stores_events_and_deletes_deliveries(self):
+        delivery_uuids = [str(uuid.uuid4()) for _ in range(3)]
+        for delivery_uuid in delivery_uuids:
+            self.spool(delivery_uuid)
+        result = drain(batch_size=2)
+        self.assertEqual(result.accepted, 3)
+        self.assertFalse(GitHubWebhookDelivery.objects.exists())
+        self.assertEqual(
+            sorted(str(value) for value in GitHubWebhookEvent.objects.values_list("delivery_uuid", flat=True)),
+            sorted(delivery_uuids),
+        )
+
+    def test_drain_rejects_invalid_deliveries(self):
+        delivery_uuid = str(uuid.uuid4())
+        GitHubWebhookDelivery.objects.create(webhook=self.webhook, headers=delivery_headers(delivery_uuid, event="unsupported"), body=delivery_body(delivery_uuid))
+        result = drain()
+        self.assertEqual(result.rejected, 1)
+        delivery = GitHubWebhookDelivery.objects.get()
+        self.assertEqual(delivery.status, "rejected")
+        self.assertEqual(delivery.last_error, "Unsupported event")
+
+    def test_drain_rejects_duplicate_deliveries(self):
+        delivery_uuid = str(uuid.uuid4())
+        self.spool(delivery_uuid)
+        self.spool(delivery_uuid)
+        result = drain()
+        self.assertEqual((result.accepted, result.rejected), (1, 1))
+        self.assertEqual(GitHubWebhookEvent.objects.count(), 1)
+
+    def test_drain_retries_after_lease_expires(self):
+        delivery_uuid = str(uuid.uuid4())
+        self.spool(delivery_uuid)
+        with mock.patch.object(GitHubWebhookEvent.objects, "create_delivery", side_effect=OperationalError("database is locked")):
+            result = drain()
+        self.assertEqual(result.retried, 1)
+        delivery = GitHubWebhookDelivery.objects.get()
+        self.assertEqual(delivery.attempts, 1)
+        self.assertIn("database is locked", delivery.last_error)
+        # The claim is still held, so the delivery isn't retried until the lease expires.
+        self.assertEqual(drain().processed, 0)
+        self.assertEqual(drain(lease=0).accepted, 1)
+        self.assertTrue(GitHubWebhookEvent.objects.filter(delivery_uuid=delivery_uuid).exists())
+
+    def test_claim_deliveries_skips_deliveries_claimed_by_live_workers(self):
+        self.spool(str(uuid.uuid4()), claimed_by="other", claimed_at=timezone.now())
+        abandoned = self.spool(str(uuid.uuid4()), claimed_by="crashed", claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual([delivery.id for delivery in claim_deliveries(10, timedelta(minutes=5))], [abandoned.id])
+
+    def test_drain_fails_deliveries_after_max_attempts(self):
+        self.spool(str(uuid.uuid4()), attempts=3)
+        result = drain(max_attempts=3)
+        self.assertEqual(result.failed, 1)
+        self.assertEqual(GitHubWebhookDelivery.objects.get().status, "failed")
+
+    def test_process_webhook_deliveries_command(self):
+        self.spool(str(uuid.uuid4()))
+        out = StringIO()
+        call_command("process_webhook_deliveries", "--once", stdout=out)
+        self.assertIn("Processed 1 deliveries: 1 accepted", out.getvalue())
+        self.assertEqual(GitHubWebhookEvent.objects.count(), 1)
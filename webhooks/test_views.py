@@ -1,9 +1,19 @@
+import hashlib
+import hmac
+from io import BytesIO
 import json
+from unittest import mock
 from urllib.parse import urlencode
 import uuid
 
-from django.test import Client, TestCase
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
 
+from . import ingest, views
+from .cache import recent_deliveries, webhook_config_cache
+from .dispatch import registry
 from .models import GitHubWebhook, GitHubWebhookEvent
 
 
@@ -20,6 +30,8 @@ class ViewsTest(TestCase):
 class HandleGitHubWebhookEventTest(TestCase):
     def setUp(self):
         self.client = Client()
+        webhook_config_cache.clear()
+        recent_deliveries.clear()
 
     public_id = "test-public-id"
     url = f"/webhooks/github/{public_id}/handle"
@@ -47,11 +59,54 @@ class HandleGitHubWebhookEventTest(TestCase):
         webhook = GitHubWebhook.objects.create(public_id=self.public_id)
         delivery_uuid = str(uuid.uuid4())
         GitHubWebhookEvent.objects.create(webhook=webhook, delivery_uuid=delivery_uuid, event="test", payload={})
-        headers = {"X-GitHub-Delivery": delivery_uuid}
-        response = self.client.post(self.url, data=json.dumps({}), content_type="application/json", headers=headers)
+        # The delivery was stored by another process, so it isn't in recent_deliveries and its handler must not run again.
+        calls = []
+        registry.register("issues", "opened")(lambda *args: calls.append(args))
+        self.addCleanup(registry.unregister, "issues", "opened")
+        headers = {"X-GitHub-Delivery": delivery_uuid, "X-GitHub-Event": "issues"}
+        data = {
+            delivery_uuid: {
+                "action": "opened"
+            }
+        }
+        response = self.client.post(self.url, data=json.dumps(data), content_type="application/json", headers=headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": {"code": 400, "message": "Duplicate delivery"}})
+        self.assertEqual(GitHubWebhookEvent.objects.filter(delivery_uuid=delivery_uuid).count(), 1)
+        self.assertEqual(calls, [])
+
+    def test_handle_github_webhook_event_quick_redelivery_returns_400_without_queries(self):
+        GitHubWebhook.objects.create(public_id=self.public_id)
+        delivery_uuid = str(uuid.uuid4())
+        headers = {"X-GitHub-Delivery": delivery_uuid, "X-GitHub-Event": "installation"}
+        data = json.dumps({delivery_uuid: {"action": "created"}})
+        response = self.client.post(self.url, data=data, content_type="application/json", headers=headers)
+        self.assertEqual(response.status_code, 202)
+        with self.assertNumQueries(0):
+            response = self.client.post(self.url, data=data, content_type="application/json", headers=headers)
         self.assertEqual(response.status_code, 400)
         self.assertEqual(response.json(), {"error": {"code": 400, "message": "Duplicate delivery"}})
 
+    def test_handle_github_webhook_event_duplicate_delivery_allowed_returns_202(self):
+        GitHubWebhook.objects.create(public_id=self.public_id, disallow_duplicate_deliveries=False)
+        delivery_uuid = str(uuid.uuid4())
+        headers = {"X-GitHub-Delivery": delivery_uuid, "X-GitHub-Event": "installation"}
+        data = json.dumps({delivery_uuid: {"action": "created"}})
+        for _ in range(2):
+            response = self.client.post(self.url, data=data, content_type="application/json", headers=headers)
+            self.assertEqual(response.status_code, 202)
+        self.assertEqual(
+            list(GitHubWebhookEvent.objects.filter(delivery_uuid=delivery_uuid).order_by("id").values_list("is_redelivery", flat=True)),
+            [False, True],
+        )
+
+    def test_handle_github_webhook_event_invalid_delivery_header_returns_400(self):
+        GitHubWebhook.objects.create(public_id=self.public_id)
+        headers = {"X-GitHub-Delivery": "123-random-uuid", "X-GitHub-Event": "installation"}
+        response = self.client.post(self.url, data=json.dumps({}), content_type="application/json", headers=headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": {"code": 400, "message": "Invalid X-GitHub-Delivery header"}})
+
     def test_handle_github_webhook_event_missing_event_header_returns_400(self):
         GitHubWebhook.objects.create(public_id=self.public_id)
         headers = {"X-GitHub-Delivery": str(uuid.uuid4())}
@@ -129,3 +184,105 @@ class HandleGitHubWebhookEventTest(TestCase):
         response = self.client.post(self.url, data=encoded_data, content_type="application/x-www-form-urlencoded", headers=headers)
         self.assertEqual(response.status_code, 202)
         self.assertEqual(response.json(), {"status": "accepted"})
+
+    def test_handle_github_webhook_event_cached_webhook_makes_no_lookup_query(self):
+        GitHubWebhook.objects.create(public_id=self.public_id, disallow_duplicate_deliveries=False)
+        headers = {"X-GitHub-Delivery": str(uuid.uuid4()), "X-GitHub-Event": "installation"}
+        self.client.post(self.url, data=json.dumps({headers["X-GitHub-Delivery"]: {"action": "created"}}), content_type="application/json", headers=headers)
+        headers = {"X-GitHub-Delivery": str(uuid.uuid4()), "X-GitHub-Event": "installation"}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, data=json.dumps({headers["X-GitHub-Delivery"]: {"action": "created"}}), content_type="application/json", headers=headers)
+        self.assertEqual(response.status_code, 202)
+        # The savepoint wrapping the insert only exists because the test runs inside a transaction.
+        statements = [query["sql"] for query in queries.captured_queries if "SAVEPOINT" not in query["sql"]]
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith("INSERT"))
+
+    def signed_headers(self, body: bytes, delivery_uuid: str, secret_token: str = "test-secret-token") -> dict:
+        signature = hmac.new(secret_token.encode("utf-8"), body, hashlib.sha256).hexdigest()
+        return {"X-GitHub-Delivery": delivery_uuid, "X-GitHub-Event": "installation", "X-Hub-Signature-256": f"sha256={signature}"}
+
+    def test_handle_github_webhook_event_valid_signature_returns_202(self):
+        GitHubWebhook.objects.create(public_id=self.public_id, secret_token="test-secret-token")
+        delivery_uuid = str(uuid.uuid4())
+        body = json.dumps({delivery_uuid: {"action": "created"}}).encode("utf-8")
+        response = self.client.post(self.url, data=body, content_type="application/json", headers=self.signed_headers(body, delivery_uuid))
+        self.assertEqual(response.status_code, 202)
+
+    def test_handle_github_webhook_event_invalid_signature_returns_403_before_parsing(self):
+        GitHubWebhook.objects.create(public_id=self.public_id, secret_token="test-secret-token")
+        delivery_uuid = str(uuid.uuid4())
+        body = json.dumps({delivery_uuid: {"action": "created"}}).encode("utf-8")
+        headers = self.signed_headers(body, delivery_uuid, secret_token="forged-secret-token")
+        with mock.patch.object(ingest, "parse_delivery") as parse_delivery, self.assertNumQueries(1):
+            response = self.client.post(self.url, data=body, content_type="application/json", headers=headers)
+        parse_delivery.assert_not_called()
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json(), {"error": {"code": 403, "message": "Invalid signature"}})
+        self.assertFalse(GitHubWebhookEvent.objects.exists())
+
+    def test_handle_github_webhook_event_missing_signature_returns_400(self):
+        GitHubWebhook.objects.create(public_id=self.public_id, secret_token="test-secret-token")
+        delivery_uuid = str(uuid.uuid4())
+        headers = {"X-GitHub-Delivery": delivery_uuid, "X-GitHub-Event": "installation"}
+        response = self.client.post(self.url, data=json.dumps({delivery_uuid: {"action": "created"}}), content_type="application/json", headers=headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": {"code": 400, "message": "Missing X-Hub-Signature-256 header"}})
+
+    def test_handle_github_webhook_event_validation_disabled_ignores_signature(self):
+        GitHubWebhook.objects.create(public_id=self.public_id, secret_token="test-secret-token", validate_deliveries=False)
+        delivery_uuid = str(uuid.uuid4())
+        body = json.dumps({delivery_uuid: {"action": "created"}}).encode("utf-8")
+        headers = self.signed_headers(body, delivery_uuid, secret_token="forged-secret-token")
+        response = self.client.post(self.url, data=body, content_type="application/json", headers=headers)
+        self.assertEqual(response.status_code, 202)
+
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=1024)
+    def test_handle_github_webhook_event_oversized_body_returns_413(self):
+        GitHubWebhook.objects.create(public_id=self.public_id, secret_token="test-secret-token")
+        delivery_uuid = str(uuid.uuid4())
+        body = json.dumps({delivery_uuid: {"action": "created", "padding": "x" * 2048}}).encode("utf-8")
+        with mock.patch.object(ingest, "read_verified_body", wraps=ingest.read_verified_body) as read_verified_body:
+            response = self.client.post(self.url, data=body, content_type="application/json", headers=self.signed_headers(body, delivery_uuid))
+        # Rejected on its Content-Length header, before the body is read.
+        read_verified_body.assert_not_called()
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json(), {"error": {"code": 413, "message": "Request body too large"}})
+        self.assertFalse(GitHubWebhookEvent.objects.exists())
+
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=1024)
+    def test_read_request_chunks_stops_past_the_limit(self):
+        # Without a Content-Length header, the body is only known to be too large once it's read.
+        stream = BytesIO(b"x" * 4096)
+        request = mock.Mock(META={}, read=stream.read)
+        with self.assertRaises(ingest.DeliveryError) as cm:
+            list(ingest.read_request_chunks(request, chunk_size=512))
+        self.assertEqual(cm.exception.code, 413)
+        self.assertEqual(stream.tell(), 1536)
+
+# Runs every behaviour test above against the native async view served by config/asgi.py.
+@override_settings(ROOT_URLCONF="config.asgi_urls")
+class AsyncHandleGitHubWebhookEventTest(HandleGitHubWebhookEventTest):
+
+    def test_asgi_urlconf_routes_to_async_view(self):
+        self.assertIs(resolve(self.url).func, views.ahandle_github_webhook_event)
+
+    def test_asgi_application_uses_asgi_urlconf(self):
+        from config.asgi import application
+        scope = {"type": "http", "method": "POST", "path": self.url, "headers": []}
+        request, error_response = application.create_request(scope, BytesIO())
+        self.assertIsNone(error_response)
+        self.assertEqual(request.urlconf, "config.asgi_urls")
+
+    async def test_handle_github_webhook_event_with_async_client_returns_202(self):
+        await GitHubWebhook.objects.acreate(public_id=self.public_id)
+        delivery_uuid = str(uuid.uuid4())
+        headers = {"X-GitHub-Delivery": delivery_uuid, "X-GitHub-Event": "installation"}
+        data = {
+            delivery_uuid: {
+                "action": "created"
+            }
+        }
+        response = await self.async_client.post(self.url, data=json.dumps(data), content_type="application/json", headers=headers)
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(await GitHubWebhookEvent.objects.filter(delivery_uuid=delivery_uuid, action="created").aexists())
@@ -0,0 +1,130 @@
+import json
+from unittest import mock
+import uuid
+
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from . import writer
+from .cache import recent_deliveries, webhook_config_cache
+from .dispatch import registry
+from .models import GitHubWebhook, GitHubWebhookEvent
+from .writer import BatchWriter
+
+
+class BatchWriterTest(TestCase):
+
+    def setUp(self):
+        self.webhook = GitHubWebhook.objects.create(public_id="test-public-id")
+        self.writer = BatchWriter(max_size=10, max_delay=60, autostart=False)
+
+    def test_flush_writes_batch_in_one_insert(self):
+        futures = [self.writer.submit(self.webhook.id, str(uuid.uuid4()), False, event="installation", payload={}) for _ in range(3)]
+        with CaptureQueriesContext(connection) as queries:
+            self.writer.flush()
+        inserts = [query for query in queries.captured_queries if query["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(GitHubWebhookEvent.objects.count(), 3)
+        self.assertTrue(all(future.result().pk for future in futures))
+
+    def test_flush_resolves_duplicates_to_none(self):
+        delivery_uuid = str(uuid.uuid4())
+        GitHubWebhookEvent.objects.create(webhook=self.webhook, delivery_uuid=delivery_uuid, event="installation", payload={})
+        duplicate = self.writer.submit(self.webhook.id, delivery_uuid, False, event="installation", payload={})
+        other = self.writer.submit(self.webhook.id, str(uuid.uuid4()), False, event="installation", payload={})
+        self.writer.flush()
+        self.assertIsNone(duplicate.result())
+        self.assertIsNotNone(other.result())
+        self.assertEqual(GitHubWebhookEvent.objects.count(), 2)
+
+    def test_flush_inserts_rest_of_batch_with_duplicates_at_once(self):
+        stored, repeated = str(uuid.uuid4()), str(uuid.uuid4())
+        GitHubWebhookEvent.objects.create(webhook=self.webhook, delivery_uuid=stored, event="installation", payload={})
+        allowed = self.writer.submit(self.webhook.id, stored, True, event="installation", payload={})
+        futures = [self.writer.submit(self.webhook.id, delivery_uuid, False, event="installation", payload={}) for delivery_uuid in [stored, repeated, repeated]]
+        futures += [self.writer.submit(self.webhook.id, str(uuid.uuid4()), False, event="installation", payload={}) for _ in range(3)]
+        with CaptureQueriesContext(connection) as queries:
+            self.writer.flush()
+        inserts = [query for query in queries.captured_queries if query["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 2)
+        self.assertTrue(allowed.result().is_redelivery)
+        self.assertEqual([future.result() is None for future in futures], [True, False, True, False, False, False])
+        self.assertEqual(GitHubWebhookEvent.objects.count(), 6)
+
+    def test_flush_resolves_errors_to_exceptions(self):
+        future = self.writer.submit(self.webhook.id, str(uuid.uuid4()), False, event="installation", payload={})
+        with mock.patch.object(GitHubWebhookEvent.objects, "bulk_create", side_effect=RuntimeError("boom")):
+            self.writer.flush()
+        with self.assertRaises(RuntimeError):
+            future.result()
+
+    def test_close_flushes_and_rejects_new_events(self):
+        self.writer.submit(self.webhook.id, str(uuid.uuid4()), False, event="installation", payload={})
+        self.writer.close()
+        self.assertEqual(GitHubWebhookEvent.objects.count(), 1)
+        with self.assertRaises(RuntimeError):
+            self.writer.submit(self.webhook.id, str(uuid.uuid4()), False, event="installation", payload={})
+
+
+# The batch writer thread uses its own database connection, so the test data must be committed.
+@override_settings(WEBHOOKS_BATCH_WRITER=True)
+class BatchWriterViewTest(TransactionTestCase):
+    public_id = "test-public-id"
+    url = f"/webhooks/github/{public_id}/handle"
+
+    def setUp(self):
+        self.client = Client()
+        webhook_config_cache.clear()
+        recent_deliveries.clear()
+        self.webhook = GitHubWebhook.objects.create(public_id=self.public_id)
+        self.batch_writer = BatchWriter(max_size=200, max_delay=0.01)
+        patcher = mock.patch.object(writer, "get_batch_writer", return_value=self.batch_writer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.batch_writer.close)
+
+    def post(self, delivery_uuid: str):
+        headers = {"X-GitHub-Delivery": delivery_uuid, "X-GitHub-Event": "installation"}
+        data = json.dumps({delivery_uuid: {"action": "created"}})
+        return self.client.post(self.url, data=data, content_type="application/json", headers=headers)
+
+    def test_flush_durability_acknowledges_after_write(self):
+        delivery_uuid = str(uuid.uuid4())
+        self.assertEqual(self.post(delivery_uuid).status_code, 202)
+        self.assertTrue(GitHubWebhookEvent.objects.filter(delivery_uuid=delivery_uuid).exists())
+
+    def test_flush_durability_rejects_duplicates(self):
+        delivery_uuid = str(uuid.uuid4())
+        GitHubWebhookEvent.objects.create(webhook=self.webhook, delivery_uuid=delivery_uuid, event="installation", payload={})
+        response = self.post(delivery_uuid)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": {"code": 400, "message": "Duplicate delivery"}})
+
+    @override_settings(WEBHOOKS_BATCH_WRITER_DURABILITY="buffer")
+    def test_buffer_durability_acknowledges_before_write(self):
+        self.batch_writer.max_delay = 60
+        delivery_uuid = str(uuid.uuid4())
+        self.assertEqual(self.post(delivery_uuid).status_code, 202)
+        self.batch_writer.close()
+        self.assertTrue(GitHubWebhookEvent.objects.filter(delivery_uuid=delivery_uuid).exists())
+
+    def test_handler_runs_after_write(self):
+        def count_events(webhook, event, action, delivery, payload):
+            counts.append(GitHubWebhookEvent.objects.filter(delivery_uuid=delivery["uuid"]).count())
+
+        counts = []
+        registry.register("issues", "opened")(count_events)
+        self.addCleanup(registry.unregister, "issues", "opened")
+        delivery_uuid = str(uuid.uuid4())
+        headers = {"X-GitHub-Delivery": delivery_uuid, "X-GitHub-Event": "issues"}
+        data = json.dumps({delivery_uuid: {"action": "opened", "uuid": delivery_uuid}})
+        response = self.client.post(self.url, data=data, content_type="application/json", headers=headers)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(counts, [1])
+
+
+# Runs the view tests above against the native async view served by config/asgi.py.
+@override_settings(ROOT_URLCONF="config.asgi_urls")
+class AsyncBatchWriterViewTest(BatchWriterViewTest):
+    pass
@@ -5,4 +5,5 @@ from . import views
 urlpatterns = [
     path('', views.index, name='index'),
     path('github/<slug:public_id>/handle', views.handle_github_webhook_event, name='handle_github_webhook_event'),
+    path('metrics', views.metrics_view, name='metrics'),
 ]
@@ -1,12 +1,12 @@
-import json
 import logging
-from urllib.parse import parse_qs
 
-from django.http import HttpRequest, HttpResponse, HttpResponseNotFound, JsonResponse
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.http import Http404, HttpRequest, HttpResponse, HttpResponseNotFound
 from django.views.decorators.csrf import csrf_exempt
 
-from .models import GitHubWebhook, GitHubWebhookEvent
+from . import ingest, metrics, ratelimit, spool, writer
+from .cache import webhook_config_cache
+from .models import GitHubWebhookDelivery
 
 logger = logging.getLogger("astra.webhooks.views")
 
@@ -27,99 +27,74 @@ def index(request: HttpRequest) -> HttpResponse:
 # https://docs.github.com/en/webhooks/using-webhooks/handling-webhook-deliveries
 # https://docs.github.com/en/webhooks/webhook-events-and-payloads#delivery-headers
 @csrf_exempt
+@metrics.instrument
+@ratelimit.shed_load
 def handle_github_webhook_event(request: HttpRequest, public_id: str) -> HttpResponse:
     if request.method == "POST":
-        webhook = get_object_or_404(GitHubWebhook, public_id=public_id, enabled=True)
+        timings = metrics.get_timings(request)
+        with timings.stage("lookup"):
+            webhook = webhook_config_cache.get(public_id)
+        if webhook is None:
+            raise Http404("No enabled GitHub webhook matches the given query.")
 
-        delivery_uuid = request.headers.get("X-GitHub-Delivery")
-        if not delivery_uuid:
-            # If the X-GitHub-Delivery header is missing, return a 400 Bad Request response.
-            logger.warning("Missing X-GitHub-Delivery header for webhook %s", webhook)
-            return JsonResponse(data={"error": { "code": 400, "message": "Missing X-GitHub-Delivery header"}}, status=400)
-
-        if webhook.disallow_duplicate_deliveries:
-            # If duplicate deliveries are not allowed, check if the delivery already exists.
-            if GitHubWebhookEvent.objects.filter(webhook=webhook, delivery_uuid=delivery_uuid).exists():
-                logger.warning(f"Duplicate delivery {delivery_uuid} for webhook {webhook}")
-                return JsonResponse(data={"error": { "code": 400, "message": "Duplicate delivery"}}, status=400)
-
-        event = request.headers.get("X-GitHub-Event")
-        if not event:
-            # If the X-GitHub-Event header is missing, return a 400 Bad Request response.
-            logger.warning("Missing X-GitHub-Event header for webhook %s", webhook)
-            return JsonResponse(data={"error": { "code": 400, "message": "Missing X-GitHub-Event header"}}, status=400)
-        # TODO Verify webhook event types
-
-        logger.info(f"Received {event} event for webhook {webhook}")
-        logger.debug(f"Received request body: {request.body.decode("utf-8")}")
-
-        # If the content type is "application/x-www-form-urlencoded", extract the payload from the "payload" parameter.
-        if request.content_type == "application/x-www-form-urlencoded":
-            try:
-                decoded_payload = parse_qs(request.body.decode("utf-8"), strict_parsing=True)
-            except ValueError as e:
-                logger.warning(f"Invalid URL-encoded payload for webhook {webhook}: {e}")
-                return JsonResponse(data={"error": { "code": 400, "message": "Invalid URL-encoded payload"}}, status=400)
-
-            body = decoded_payload.get("payload")[0]
-            # TODO Add handling for if the payload isn't present in the request body
-            body = body.replace("'", '"')
-            # TODO Replacing single quotes with double quotes is a workaround for the URL-encoded payload.
-        # If the content type is "application/json", extract the payload from the request body.
-        elif request.content_type == "application/json":
-            body = request.body.decode("utf-8")
-        else:
-            # If the content type is not supported, return a 415 Unsupported Media Type response.
-            logger.warning("Unsupported media type %s for webhook %s", request.content_type, webhook)
-            return JsonResponse(data={"error": { "code": 415, "message": "Unsupported media type"}}, status=415)
-
-        # Parse the payload as JSON.
         try:
-            payload = json.loads(body)
-        except json.JSONDecodeError as e:
-            # If the payload is not valid JSON, return a 400 Bad Request response.
-            logger.warning(f"Invalid JSON payload for webhook {webhook}: {e}")
-            logger.debug(f"Received invalid JSON request body: {body}")
-            return JsonResponse(data={"error": { "code": 400, "message": "Invalid JSON payload"}}, status=400)
+            body = ingest.read_request(webhook, request, timings)
+            # Charged once the signature is verified, so that forged deliveries can't drain the bucket.
+            ratelimit.check_rate_limit(webhook)
+
+            if spool.get_ingest_mode() == "spool":
+                # Only store the raw delivery, it's processed by the process_webhook_deliveries command.
+                with timings.stage("spool"):
+                    GitHubWebhookDelivery.objects.create(webhook_id=webhook.id, headers=dict(request.headers), body=body)
+                return ingest.accept()
+
+            delivery = ingest.parse_request(webhook, request, body, timings)
+            # The insert doubles as the duplicate check, see GitHubWebhookEventManager.create_delivery,
+            # and the handler only runs once it succeeded, see webhooks/writer.py.
+            stored = writer.store_and_handle(webhook, delivery.delivery_uuid, delivery.handle, timings, **delivery.columns)
+            return ingest.accept(delivery, stored)
+        except ingest.DeliveryError as e:
+            return e.as_response()
+    return HttpResponseNotFound()
 
-        if webhook.validate_deliveries:
-            # TODO Validate the user agent
-            # TODO Validate the payload signature
-            pass
+# This is the native async version of handle_github_webhook_event, routed by config/asgi.py.
+# It uses the async ORM so that deliveries don't each tie up a thread through sync_to_async.
+@csrf_exempt
+@metrics.instrument
+@ratelimit.shed_load
+async def ahandle_github_webhook_event(request: HttpRequest, public_id: str) -> HttpResponse:
+    if request.method == "POST":
+        timings = metrics.get_timings(request)
+        with timings.stage("lookup"):
+            webhook = await webhook_config_cache.aget(public_id)
+        if webhook is None:
+            raise Http404("No enabled GitHub webhook matches the given query.")
 
-        # Get the delivery from the payload using the delivery UUID.
-        delivery = payload.get(delivery_uuid)
-        if not delivery:
-            logger.warning(f"Delivery {delivery_uuid} not found in payload for webhook {webhook}")
-            return JsonResponse(data={"error": { "code": 400, "message": "X-GitHub-Delivery header must match payload"}}, status=400)
+        try:
+            body = ingest.read_request(webhook, request, timings)
+            await ratelimit.acheck_rate_limit(webhook)
+
+            if spool.get_ingest_mode() == "spool":
+                # Only store the raw delivery, it's processed by the process_webhook_deliveries command.
+                with timings.stage("spool"):
+                    await GitHubWebhookDelivery.objects.acreate(webhook_id=webhook.id, headers=dict(request.headers), body=body)
+                return ingest.accept()
+
+            delivery = ingest.parse_request(webhook, request, body, timings)
+            stored = await writer.astore_and_handle(webhook, delivery.delivery_uuid, delivery.handle, timings, **delivery.columns)
+            return ingest.accept(delivery, stored)
+        except ingest.DeliveryError as e:
+            return e.as_response()
+    return HttpResponseNotFound()
 
-        if event == "installation":
-            action = delivery.get("action")
-            logger.info(f"Received {action} action with {event} event for webhook {webhook}")
-            if action == "created":
-                # Someone installed a GitHub App on a user or organization account.
-                pass
-            elif action == "deleted":
-                # Someone uninstalled a GitHub App from their user or organization account.
-                pass
-            elif action == "new_permissions_accepted":
-                # Someone granted new permissions to a GitHub App.
-                pass
-            elif action == "suspend":
-                # Someone blocked access by a GitHub App to their user or organization account.
-                pass
-            elif action == "unsuspend":
-                # A GitHub App that was blocked from accessing a user or organization account was given access the account again.
-                pass
-            else:
-                logger.warning(f"Unsupported action {action} with event {event} for webhook {webhook}")
-                logger.debug(f"Received payload: {payload}")
-                return JsonResponse(data={"error": { "code": 400, "message": "Unsupported action"}}, status=400)
-        else:
-            logger.warning("Unsupported event %s for webhook %s", event, webhook)
-            logger.debug(f"Received request body: {request.body.decode("utf-8")}")
-            return JsonResponse(data={"error": { "code": 400, "message": "Unsupported event"}}, status=400)
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """
+    Serves the ingest metrics of this process in the Prometheus text format, see webhooks/metrics.py.
 
-        GitHubWebhookEvent.objects.create(webhook=webhook, delivery_uuid=delivery_uuid, event=event, payload=payload)
-        return JsonResponse(data={"status": "accepted"}, status=202)
-    return HttpResponseNotFound()
+    Returns:
+        HttpResponse: The metrics, or a 404 response if WEBHOOKS_METRICS is off
+            or the client isn't in WEBHOOKS_METRICS_ALLOWED_IPS.
+    """
+    if not metrics.is_enabled() or request.META.get("REMOTE_ADDR") not in getattr(settings, "WEBHOOKS_METRICS_ALLOWED_IPS", []):
+        return HttpResponseNotFound()
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
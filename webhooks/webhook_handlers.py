@@ -0,0 +1,29 @@
+from .dispatch import registry
+
+
+# https://docs.github.com/en/webhooks/webhook-events-and-payloads#installation
+
+@registry.register("installation", "created")
+def installation_created(webhook, event, action, delivery, payload):
+    # Someone installed a GitHub App on a user or organization account.
+    pass
+
+@registry.register("installation", "deleted")
+def installation_deleted(webhook, event, action, delivery, payload):
+    # Someone uninstalled a GitHub App from their user or organization account.
+    pass
+
+@registry.register("installation", "new_permissions_accepted")
+def installation_new_permissions_accepted(webhook, event, action, delivery, payload):
+    # Someone granted new permissions to a GitHub App.
+    pass
+
+@registry.register("installation", "suspend")
+def installation_suspend(webhook, event, action, delivery, payload):
+    # Someone blocked access by a GitHub App to their user or organization account.
+    pass
+
+@registry.register("installation", "unsuspend")
+def installation_unsuspend(webhook, event, action, delivery, payload):
+    # A GitHub App that was blocked from accessing a user or organization account was given access the account again.
+    pass
@@ -0,0 +1,288 @@
+import asyncio
+import atexit
+import logging
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from concurrent.futures import Future
+from contextlib import nullcontext
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+
+from . import deduplication, extraction
+from .metrics import NULL_TIMINGS, NullTimings, Timings
+from .models import GitHubWebhookEvent
+
+logger = logging.getLogger("astra.webhooks.writer")
+
+
+# Each accepted delivery normally costs its own INSERT and commit, and on SQLite
+# every commit is an fsync while writers serialise on the database lock. When
+# WEBHOOKS_BATCH_WRITER is enabled, events are buffered per process and written
+# by a background thread with bulk_create, once WEBHOOKS_BATCH_WRITER_MAX_SIZE
+# events are buffered or WEBHOOKS_BATCH_WRITER_MAX_DELAY seconds after the first
+# one arrived, whichever comes first.
+#
+# WEBHOOKS_BATCH_WRITER_DURABILITY controls when a delivery is acknowledged:
+#
+#   "flush"   the view waits until the batch holding the event is committed, so
+#             a 202 still means the event is stored and duplicates still get a
+#             400. Latency grows by up to MAX_DELAY.
+#   "buffer"  the view returns as soon as the event is buffered. Buffered events
+#             are lost if the process dies before the next flush, and
+#             duplicates found at flush time are dropped with a warning.
+#
+# The buffer is flushed when the process exits.
+#
+# store_and_handle() runs the handler of a delivery only once its event is
+# stored, so a duplicate delivery is rejected before its handler runs again.
+# Without the batch writer the insert and the handler share a transaction, and
+# a handler rejecting the delivery rolls the event back. astore_and_handle()
+# inserts the event with the async ORM instead, which can't hold a transaction
+# across the handler, and deletes the event again if the handler fails. With it, the event is
+# committed by the time the handler runs, and with the "buffer" durability the
+# handler of a duplicate found at flush time has already run.
+
+
+class BatchWriter:
+    """
+    Buffers GitHubWebhookEvent inserts and writes them in batches from a background thread.
+    """
+
+    def __init__(self, max_size: int = 200, max_delay: float = 0.05, autostart: bool = True):
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.autostart = autostart
+        self._pending: list[tuple[GitHubWebhookEvent, bool, Future]] = []
+        self._first_at = 0.0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def submit(self, webhook_id: int, delivery_uuid: str, allow_duplicates: bool, **kwargs) -> Future:
+        """
+        Buffers the event for a delivery.
+
+        Returns:
+            Future: Resolves to the stored event once it's written, or to None if the
+            delivery is a duplicate and duplicates are not allowed.
+        """
+        kwargs = {**extraction.extract(kwargs.get("payload")), **kwargs}
+        event = GitHubWebhookEvent(webhook_id=webhook_id, delivery_uuid=delivery_uuid, **kwargs)
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("BatchWriter is closed")
+            if self.autostart and self._thread is None:
+                self.start()
+            if not self._pending:
+                self._first_at = time.monotonic()
+            self._pending.append((event, allow_duplicates, future))
+            if len(self._pending) == 1 or len(self._pending) >= self.max_size:
+                self._condition.notify()
+        return future
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="webhooks-batch-writer", daemon=True)
+        self._thread.start()
+
+    def flush(self):
+        """
+        Writes every buffered event from the calling thread.
+        """
+        with self._condition:
+            batch, self._pending = self._pending, []
+        if batch:
+            self._write(batch)
+
+    def close(self):
+        """
+        Stops the background thread after it has written every buffered event.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _run(self):
+        try:
+            while True:
+                with self._condition:
+                    while not self._pending and not self._closed:
+                        self._condition.wait()
+                    # Give the batch until max_delay after its first event to fill up.
+                    while not self._closed and len(self._pending) < self.max_size:
+                        remaining = self._first_at + self.max_delay - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(remaining)
+                    batch, self._pending = self._pending, []
+                    closed = self._closed
+                if batch:
+                    self._write(batch)
+                if closed:
+                    return
+        finally:
+            connection.close()
+
+    def _write_deduplicated(self, batch: list[tuple[GitHubWebhookEvent, bool, Future]]) -> list[GitHubWebhookEvent | None]:
+        """
+        Writes a batch holding duplicates, looking the stored deliveries up first so that the rest of the
+        batch can still be inserted at once.
+        """
+        stored = set(
+            GitHubWebhookEvent.objects.filter(
+                webhook_id__in={event.webhook_id for event, _, _ in batch},
+                delivery_uuid__in={event.delivery_uuid for event, _, _ in batch},
+                is_redelivery=False,
+            ).values_list("webhook_id", "delivery_uuid")
+        )
+        results = []
+        for event, allow_duplicates, _ in batch:
+            key = (event.webhook_id, uuid.UUID(str(event.delivery_uuid)))
+            if key not in stored:
+                stored.add(key)
+                results.append(event)
+            elif allow_duplicates:
+                event.is_redelivery = True
+                results.append(event)
+            else:
+                results.append(None)
+        try:
+            with transaction.atomic():
+                GitHubWebhookEvent.objects.bulk_create([event for event in results if event is not None], batch_size=self.max_size)
+            return results
+        except IntegrityError:
+            # Another writer stored one of the deliveries meanwhile. Insert them one at a time
+            # so that each gets its own result. The payloads are deduplicated by now, so the
+            # columns extracted from the complete payloads are passed along.
+            logger.info("Duplicate delivery in batch of %s events, inserting one at a time", len(batch))
+            return [
+                GitHubWebhookEvent.objects.create_delivery(
+                    event.webhook_id, event.delivery_uuid, allow_duplicates,
+                    event=event.event, action=event.action, payload=event.payload,
+                    **{column: getattr(event, column) for column in extraction.EXTRACTED_COLUMNS},
+                )
+                for event, allow_duplicates, _ in batch
+            ]
+
+    def _write(self, batch: list[tuple[GitHubWebhookEvent, bool, Future]]):
+        try:
+            # Before the events' transaction, so that retrying a batch holding duplicates still finds the objects.
+            payloads = deduplication.deduplicate_many([event.payload for event, _, _ in batch])
+            for (event, _, _), payload in zip(batch, payloads):
+                event.payload = payload
+            try:
+                with transaction.atomic():
+                    GitHubWebhookEvent.objects.bulk_create([event for event, _, _ in batch], batch_size=self.max_size)
+                results = [event for event, _, _ in batch]
+            except IntegrityError:
+                logger.info("Duplicate delivery in batch of %s events", len(batch))
+                results = self._write_deduplicated(batch)
+        except Exception as e: # pylint: disable=broad-exception-caught
+            logger.exception("Failed to write batch of %s events", len(batch))
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        for (event, _, future), result in zip(batch, results):
+            if result is None:
+                logger.warning("Duplicate delivery %s for webhook %s dropped by batch writer", event.delivery_uuid, event.webhook_id)
+            future.set_result(result)
+
+
+_batch_writer = None
+_batch_writer_lock = threading.Lock()
+
+
+def get_batch_writer() -> BatchWriter:
+    global _batch_writer # pylint: disable=global-statement
+    with _batch_writer_lock:
+        if _batch_writer is None:
+            _batch_writer = BatchWriter(
+                max_size=getattr(settings, "WEBHOOKS_BATCH_WRITER_MAX_SIZE", 200),
+                max_delay=getattr(settings, "WEBHOOKS_BATCH_WRITER_MAX_DELAY", 0.05),
+            )
+            atexit.register(_batch_writer.close)
+        return _batch_writer
+
+
+def store_event(webhook, delivery_uuid: str, **kwargs) -> bool:
+    """
+    Stores the event for a delivery, through the batch writer if it's enabled.
+
+    Returns:
+        bool: False if the delivery is a duplicate and the webhook disallows duplicate deliveries.
+    """
+    allow_duplicates = not webhook.disallow_duplicate_deliveries
+    if not getattr(settings, "WEBHOOKS_BATCH_WRITER", False):
+        return GitHubWebhookEvent.objects.create_delivery(webhook.id, delivery_uuid, allow_duplicates, **kwargs) is not None
+    future = get_batch_writer().submit(webhook.id, delivery_uuid, allow_duplicates, **kwargs)
+    if getattr(settings, "WEBHOOKS_BATCH_WRITER_DURABILITY", "flush") == "buffer":
+        return True
+    return future.result() is not None
+
+
+async def astore_event(webhook, delivery_uuid: str, **kwargs) -> bool:
+    allow_duplicates = not webhook.disallow_duplicate_deliveries
+    if not getattr(settings, "WEBHOOKS_BATCH_WRITER", False):
+        return await GitHubWebhookEvent.objects.acreate_delivery(webhook.id, delivery_uuid, allow_duplicates, **kwargs) is not None
+    future = get_batch_writer().submit(webhook.id, delivery_uuid, allow_duplicates, **kwargs)
+    if getattr(settings, "WEBHOOKS_BATCH_WRITER_DURABILITY", "flush") == "buffer":
+        return True
+    return await asyncio.wrap_future(future) is not None
+
+
+def store_and_handle(webhook, delivery_uuid: str, handle: Callable[[], None], timings: Timings | NullTimings = NULL_TIMINGS, **kwargs) -> bool:
+    """
+    Stores the event for a delivery and runs its handler if it was stored, see module comment.
+
+    Args:
+        handle (Callable[[], None]): Runs the handler of the delivery.
+
+    Returns:
+        bool: False if the delivery is a duplicate and the webhook disallows duplicate deliveries.
+
+    Raises:
+        DeliveryError: If the handler rejects the delivery.
+    """
+    batching = getattr(settings, "WEBHOOKS_BATCH_WRITER", False)
+    with transaction.atomic() if not batching else nullcontext():
+        with timings.stage("insert"):
+            stored = store_event(webhook, delivery_uuid, **kwargs)
+        if stored:
+            handle()
+    return stored
+
+
+async def astore_and_handle(webhook, delivery_uuid: str, handle: Callable[[], None], timings: Timings | NullTimings = NULL_TIMINGS, **kwargs) -> bool:
+    if getattr(settings, "WEBHOOKS_BATCH_WRITER", False):
+        with timings.stage("insert"):
+            stored = await astore_event(webhook, delivery_uuid, **kwargs)
+        if stored:
+            # Handlers are synchronous and may use the ORM, which can't run in the event loop.
+            await sync_to_async(handle)()
+        return stored
+
+    # The async ORM can't hold a transaction across the insert and the handler,
+    # so the handler runs in its own and the event is deleted again if it fails,
+    # as store_and_handle() rolls it back.
+    with timings.stage("insert"):
+        event = await GitHubWebhookEvent.objects.acreate_delivery(webhook.id, delivery_uuid, not webhook.disallow_duplicate_deliveries, **kwargs)
+    if event is None:
+        return False
+    try:
+        await sync_to_async(_handle_atomically)(handle)
+    except Exception:
+        await GitHubWebhookEvent.objects.filter(pk=event.pk).adelete()
+        raise
+    return True
+
+
+def _handle_atomically(handle: Callable[[], None]):
+    with transaction.atomic():
+        handle()